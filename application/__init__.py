@@ -1,6 +1,7 @@
 # pylint: disable=wrong-import-position, import-outside-toplevel
 
 import logging
+import multiprocessing
 logging.basicConfig(level=logging.WARNING)
 
 from decouple import config
@@ -35,8 +36,36 @@ def create_app(config_object=Configuration):
     # Register blueprints
     from application.auth.routes import auth
     from application.linebot.routes import line_callback
+    from application.status.routes import status
 
     app.register_blueprint(auth)
     app.register_blueprint(line_callback)
+    app.register_blueprint(status)
+
+    # Worker processes import the app as well. Only the web process starts workers and browsers.
+    if multiprocessing.current_process().name == 'MainProcess':
+        from application.utils.worker_pool import worker_pool, workers_for_memory_budget
+        worker_processes = app.config.get('SELENIUM_WORKER_PROCESSES')
+        if worker_processes == 'auto':
+            worker_processes = workers_for_memory_budget()
+        elif worker_processes is not None:
+            worker_processes = int(worker_processes)
+
+        if worker_processes:
+            # Selenium jobs run in worker processes, each launching its own browsers ahead of time.
+            worker_pool.start(worker_processes, prewarm=app.config.get('PREWARM_DRIVER_POOL'))
+        elif app.config.get('PREWARM_DRIVER_POOL'):
+            # Launch browsers ahead of the first absen/zoom request
+            from application.utils.webdriver import driver_pool
+            driver_pool.start_warming()
+
+        if app.config.get('PREWARM_LIBRARY_CACHE'):
+            from application.drive_linker.drive_linker import ebook_folder_id, bank_soal_folder_id
+            from application.drive_linker.library_cache import library_cache
+            library_cache.start_warming(drive, [ebook_folder_id, bank_soal_folder_id])
+
+        if app.config.get('PREWARM_SESSIONS'):
+            from application.attendance.prewarm import prewarm_scheduler
+            prewarm_scheduler.start(app)
 
     return app
@@ -2,23 +2,39 @@ import sys
 import timeit
 import logging
 import traceback
-from datetime import timedelta
+from datetime import datetime, timedelta
+from requests import RequestException
 from selenium.common.exceptions import WebDriverException, NoSuchElementException
 
 from application.utils.course import COURSE_ABBREVIATION_HELP_STRING, MATKUL_ABBREVIATIONS
 from application.utils.log_handler import ListHandler
-from application.utils.webdriver import build_driver
-from application.auth.access_db import fetch_credentials
-from application.exceptions import AuthorizationRetrievalError, WrongSpecificationError
+from application.utils.webdriver import driver_pool
+from application.utils.worker_pool import worker_pool
+from application.utils.circuit_breaker import circuit_breakers
+from application.auth.access_db import fetch_credentials, load_user_state, save_user_state, log_attendance_request
+from application.models import db
+from application.exceptions import (
+    AuthorizationRetrievalError, WrongSpecificationError, DriverPoolExhaustedError, PageStructureError, WorkerJobError,
+    UpstreamUnavailableError
+)
 
-from application.utils.page_object_models import LoginPage, DashboardPage, TimetablePage
+from application.utils.page_object_models import DashboardPage, TimetablePage
+from application.utils.session_broker import SessionBroker, LoginHeadStart
+from application.utils.http_client import HTTP_FAST_PATH, do_attendance_over_http
+from application.utils.http_client.common import get_course_link
 
 module_logger = logging.getLogger(__name__)
 module_logger.setLevel(logging.DEBUG)
 
+PORTAL = "presensi"
+# Hosts an attendance job can't do without, see circuit_breaker.
+UPSTREAMS = ("sso", "presensi")
+
 ATTENDANCE_HELP_STRING = """This keyword is used to register your attendance in Presensi. To use, send this format:
 absen + (course abbreviation) + (6-digit attendance code)
 
+Several courses can be done at once by repeating the pair, e.g. absen ekon 123123 ansur 456456
+
 where course abbreviation is one of the known ones, listed as follows:
 
 """ + COURSE_ABBREVIATION_HELP_STRING
@@ -29,28 +45,66 @@ def absen_from_line(unparsed_text, user_id):
 
     if unparsed_text:
         try:
-            course_name, attendance_code = preprocess_chat_absen(unparsed_text)
-            username, password = fetch_credentials(user_id)
-        except (WrongSpecificationError, AuthorizationRetrievalError) as error:
+            course_code_pairs = split_chat_absen(unparsed_text)
+            circuit_breakers.check(*UPSTREAMS)
+        except (WrongSpecificationError, UpstreamUnavailableError) as error:
             module_logger.debug(str(error))
             message_list.append(str(error))
         else:
-            reply = run_attendance(username, password, course_name, attendance_code, user_id)
-            message_list.extend(reply)
+            # Well-formed enough to be worth a login: get the login page loading while the
+            # course names are checked and the credentials decrypted.
+            job = start_attendance()
+            try:
+                attendances = [parse_attendance(matkul, kode_absen) for matkul, kode_absen in course_code_pairs]
+                username, password = fetch_credentials(user_id)
+            except (WrongSpecificationError, AuthorizationRetrievalError) as error:
+                job.cancel()
+                module_logger.debug(str(error))
+                message_list.append(str(error))
+            except BaseException:
+                job.cancel()
+                raise
+            else:
+                log_attendance_request(db, user_id, [course_name for course_name, _ in attendances], now_in_wib())
+                reply = run_attendance(username, password, attendances, user_id, job=job)
+                message_list.extend(reply)
     else:
         message_list.append(ATTENDANCE_HELP_STRING)
     
     module_logger.info("Time elapsed in executing request: {}".format(str(timedelta(seconds = timeit.default_timer() - start_time))))
     return message_list
 
-def preprocess_chat_absen(unparsed_text):
-    try:
-        splitlist = unparsed_text.split(' ', 1)
-        matkul = splitlist[0]
-        kode_absen = splitlist[1]
-    except IndexError:
+def now_in_wib():
+    return datetime.utcnow() + timedelta(hours = 7)
+
+def split_chat_absen(unparsed_text):
+    """Split "course code [course code ...]" into (course abbreviation, code) pairs, unchecked.
+
+    A course name runs until the next word that has digits in it, so it may span several
+    words, e.g. "analisis survival 123123".
+    """
+    course_code_pairs = []
+    course_words = []
+    for word in unparsed_text.split():
+        if not any(char.isdigit() for char in word):
+            course_words.append(word)
+            continue
+        if not course_words:
+            raise WrongSpecificationError("Either missing course name or attendance code.")
+        course_code_pairs.append((' '.join(course_words), word))
+        course_words = []
+
+    if course_words and ' '.join(course_words[:-1]) in MATKUL_ABBREVIATIONS:
+        # A known course then a code without digits, e.g. "ekon abcdef", is left for
+        # parse_attendance to say the code should be numbers.
+        course_code_pairs.append((' '.join(course_words[:-1]), course_words[-1]))
+        course_words = []
+
+    if course_words or not course_code_pairs:
         raise WrongSpecificationError("Either missing course name or attendance code.")
-    
+    return course_code_pairs
+
+def parse_attendance(matkul, kode_absen):
     try:
         matkul_proper_name = MATKUL_ABBREVIATIONS[matkul]
     except KeyError:
@@ -64,16 +118,29 @@ def preprocess_chat_absen(unparsed_text):
     
     return matkul_proper_name, kode_absen
 
-def run_attendance(username, password, course_name, attendance_code, user_id):
+def start_attendance():
+    """Start an attendance job ahead of its inputs, see _run_attendance.
+
+    Over HTTP the job needs no browser, so it doesn't wait for a worker.
+    """
+    return worker_pool.start_staged(_run_attendance, (), in_process=HTTP_FAST_PATH)
+
+def run_attendance(username, password, attendances, user_id, job=None):
+    """Do the attendances, on job if one was started already. Returns the messages for the user."""
     message_list = []
     
     logger = logging.getLogger(__name__ + "." + user_id)
     logger.setLevel(logging.DEBUG)
     logger.addHandler(ListHandler(message_list=message_list))
     
+    if job is None:
+        job = start_attendance()
     try:
-        _run_attendance(username, password, course_name, attendance_code, logger)
+        with circuit_breakers.guard(*UPSTREAMS):
+            job.provide(username, password, attendances, load_user_state(user_id, PORTAL))
+            state = job.result(logger)
     except Exception:
+        job.cancel() # In case it never got its inputs
         # The general idea of catching Exception here is to make sure
         # program does not break because of something that is related to
         # Selenium trying to do its job. This is a necessity, albeit one
@@ -82,32 +149,107 @@ def run_attendance(username, password, course_name, attendance_code, user_id):
         exc_type, exc_value, _ = sys.exc_info()
 
         # Is this good idea?
-        if exc_type is NoSuchElementException:
+        if exc_type in (DriverPoolExhaustedError, UpstreamUnavailableError) or isinstance(exc_value, WorkerJobError):
+            logger.error(str(exc_value))
+        elif exc_type is NoSuchElementException:
             logger.error("NoSuchElementException encountered. This could be a signal that the webpage design has changed and provided selectors has been obsolete. The operation is likely failed.")
         elif isinstance(exc_value, WebDriverException):
             logger.error("The operation is likely failed due to a webdriver exception.")
+        elif isinstance(exc_value, RequestException):
+            logger.error("The operation is likely failed due to a network error while contacting the portal.")
         else:
             logger.error("The operation is likely failed due to an unspecified exception.")
         logger.debug(traceback.format_exc())
+    else:
+        save_user_state(db, user_id, PORTAL, state)
         
     return message_list
 
-def _run_attendance(username, password, course_name, attendance_code, logger):
-    login_link = 'https://presensi.its.ac.id'
+def _run_attendance(inputs, logger):
+    """Do every (course_name, attendance_code) in attendances with a single login.
+
+    Started before its inputs are ready: the login page is loaded (over HTTP, or in the
+    browser when the fast path is off) while username, password, attendances and state
+    are still on their way through inputs. Over HTTP it runs in the web process, and
+    whatever the fast path can't do is handed to a browser in a worker.
+    """
     dashboard_link = 'https://presensi.its.ac.id/dashboard'
+    with LoginHeadStart(PORTAL, browser=not HTTP_FAST_PATH) as head_start:
+        username, password, attendances, state = inputs.get()
+        broker = SessionBroker(username, password, state, head_start)
+        if not HTTP_FAST_PATH:
+            with head_start.checkout() as driver:
+                return _do_attendance_in_browser(broker, driver, attendances, logger, dashboard_link)
 
-    with build_driver() as driver:
-        login_page = LoginPage(driver, logger, login_link)
-        login_failed = not login_page.do_login(username, password)
-        if login_failed:
-            return
-        
-        dashboard_page = DashboardPage(driver, logger, dashboard_link)
-        course_name_not_found = not (timetable_link := dashboard_page.get_course_link(course_name))
-        if course_name_not_found:
-            return
+        pending_attendances = list(attendances)
+        try:
+            state = do_attendance_over_http(broker, pending_attendances, logger, dashboard_link)
+        except PageStructureError as error:
+            module_logger.warning("HTTP fast path is not applicable, falling back to webdriver: {}".format(error))
+
+    if pending_attendances:
+        state = worker_pool.run(_run_attendance_in_browser, (username, password, pending_attendances, state), logger)
+    return state
+
+def _run_attendance_in_browser(username, password, attendances, state, logger):
+    dashboard_link = 'https://presensi.its.ac.id/dashboard'
+    broker = SessionBroker(username, password, state)
+    with driver_pool.checkout() as driver:
+        return _do_attendance_in_browser(broker, driver, attendances, logger, dashboard_link)
+
+def _do_attendance_in_browser(broker, driver, attendances, logger, dashboard_link):
+    """The LoginPage -> DashboardPage -> TimetablePage chain for every attendance. Returns the user state."""
+    state = broker.state
+    if not broker.browser_session(driver, PORTAL, logger):
+        return state
+    
+    dashboard_page = None # Visited at most once, its course links are kept for the whole batch
+    for course_name, attendance_code in attendances:
+        logger.info("{}:".format(course_name.upper()))
+        timetable_page = None
+        if (timetable_link := state["course_links"].get(course_name)):
+            timetable_page = TimetablePage(driver, logger, timetable_link)
+        if timetable_page is None or not timetable_page.landed_on_requested_page():
+            state["course_links"].pop(course_name, None)
+            if dashboard_page is None:
+                dashboard_page = DashboardPage(driver, logger, dashboard_link)
+            course_name_not_found = not (timetable_link := dashboard_page.get_course_link(course_name))
+            if course_name_not_found:
+                continue
+            state["course_links"][course_name] = timetable_link
+            timetable_page = TimetablePage(driver, logger, timetable_link)
 
-        timetable_page = TimetablePage(driver, logger, timetable_link)
         timetable_page.do_attendance(attendance_code)
 
-    return
\ No newline at end of file
+    return state
+
+def _prewarm_attendance(username, password, course_name, state, logger):
+    """Log in and find the course's timetable ahead of class, so the request only has to submit the code.
+
+    Over HTTP this runs right here. Only the browser fallback takes a worker.
+    """
+    dashboard_link = 'https://presensi.its.ac.id/dashboard'
+
+    if HTTP_FAST_PATH:
+        broker = SessionBroker(username, password, state)
+        try:
+            with broker.http_session(PORTAL, logger) as session:
+                if session is not None and not state["course_links"].get(course_name):
+                    if (timetable_link := get_course_link(session, dashboard_link, 'h5 > a', course_name, logger)):
+                        state["course_links"][course_name] = timetable_link
+            return state
+        except PageStructureError as error:
+            module_logger.warning("HTTP fast path is not applicable, falling back to webdriver: {}".format(error))
+
+    return worker_pool.run(_prewarm_attendance_in_browser, (username, password, course_name, state), logger)
+
+def _prewarm_attendance_in_browser(username, password, course_name, state, logger):
+    dashboard_link = 'https://presensi.its.ac.id/dashboard'
+    broker = SessionBroker(username, password, state)
+
+    with driver_pool.checkout() as driver:
+        if broker.browser_session(driver, PORTAL, logger) and not state["course_links"].get(course_name):
+            if (timetable_link := DashboardPage(driver, logger, dashboard_link).get_course_link(course_name)):
+                state["course_links"][course_name] = timetable_link
+
+    return state
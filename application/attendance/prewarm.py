@@ -0,0 +1,97 @@
+import logging
+import threading
+from datetime import datetime, timedelta
+from decouple import config
+
+from application.auth.access_db import (
+    fetch_credentials, load_user_state, save_user_state, fetch_usual_attendance_times, fetch_session_cookies_age
+)
+from application.models import db
+from application.utils.log_handler import DeferredLogger
+from application.attendance.absen import PORTAL, _prewarm_attendance, now_in_wib
+
+# Log users in this many minutes before they usually send their attendance code.
+PREWARM_LEAD_MINUTES = config('PREWARM_LEAD_MINUTES', cast=int, default=5)
+# At most this many users are being logged in ahead of time at once. The rest are skipped.
+PREWARM_MAX_CONCURRENT = config('PREWARM_MAX_CONCURRENT', cast=int, default=2)
+# Usual times are learned from this many weeks of requests, and need at least this many of them.
+PREWARM_HISTORY_WEEKS = config('PREWARM_HISTORY_WEEKS', cast=int, default=6)
+PREWARM_MIN_OCCURRENCES = config('PREWARM_MIN_OCCURRENCES', cast=int, default=2)
+PREWARM_CHECK_INTERVAL = 60
+
+module_logger = logging.getLogger(__name__)
+module_logger.setLevel(logging.INFO)
+
+class PrewarmScheduler:
+    """
+    Logs users in to Presensi shortly before they usually ask for attendance.
+
+    Attendance codes come in during the first minutes of a class, from everyone at once.
+    Usual times are learned per user, course and weekday from past absen requests. Around
+    PREWARM_LEAD_MINUTES before such a time, the user's saved session is refreshed and the
+    course's timetable link looked up, so the request itself only has to submit the code.
+    """
+    def __init__(self, lead_minutes=PREWARM_LEAD_MINUTES, max_concurrent=PREWARM_MAX_CONCURRENT,
+                 history_weeks=PREWARM_HISTORY_WEEKS, min_occurrences=PREWARM_MIN_OCCURRENCES):
+        self.lead_minutes = lead_minutes
+        self.history_weeks = history_weeks
+        self.min_occurrences = min_occurrences
+        self.app = None
+
+        self._slots = threading.BoundedSemaphore(max_concurrent)
+        self._schedule_date = None
+        self._schedule = []
+        self._done = set() # (user_id, minute_of_day) already pre-warmed today
+        self._stopped = threading.Event()
+
+    def start(self, app):
+        self.app = app
+        threading.Thread(target=self._loop, name="prewarm-scheduler", daemon=True).start()
+
+    def stop(self):
+        self._stopped.set()
+
+    def _loop(self):
+        while not self._stopped.is_set():
+            try:
+                with self.app.app_context():
+                    self.tick(now_in_wib())
+            except Exception:
+                module_logger.exception("Pre-warm scheduler tick failed.")
+            self._stopped.wait(PREWARM_CHECK_INTERVAL)
+
+    def tick(self, now):
+        """Start pre-warming whoever is due at `now` (WIB)."""
+        if self._schedule_date != now.date():
+            since = datetime.utcnow() - timedelta(weeks=self.history_weeks)
+            self._schedule = fetch_usual_attendance_times(now.weekday(), since, self.min_occurrences)
+            self._schedule_date = now.date()
+            self._done = set()
+
+        minute_of_day = now.hour * 60 + now.minute
+        for user_id, course_name, usual_minute in self._schedule:
+            if (user_id, usual_minute) in self._done or not 0 <= usual_minute - minute_of_day <= self.lead_minutes:
+                continue
+            self._done.add((user_id, usual_minute))
+
+            session_age = fetch_session_cookies_age(user_id)
+            if session_age is not None and session_age < timedelta(minutes=self.lead_minutes):
+                continue # Logged in moments ago already
+            if not self._slots.acquire(blocking=False):
+                module_logger.info("Too many sessions are being pre-warmed, skipping {}.".format(user_id))
+                continue
+            threading.Thread(target=self._prewarm, args=(user_id, course_name), daemon=True).start()
+
+    def _prewarm(self, user_id, course_name):
+        try:
+            with self.app.app_context():
+                username, password = fetch_credentials(user_id)
+                state = load_user_state(user_id, PORTAL)
+                state = _prewarm_attendance(username, password, course_name, state, DeferredLogger())
+                save_user_state(db, user_id, PORTAL, state)
+        except Exception:
+            module_logger.exception("Failed to pre-warm the session of {}.".format(user_id))
+        finally:
+            self._slots.release()
+
+prewarm_scheduler = PrewarmScheduler()
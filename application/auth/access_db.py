@@ -1,13 +1,20 @@
+import json
 import uuid
+from datetime import datetime, timedelta
+from decouple import config
 from flask import url_for, request
+from cryptography.fernet import InvalidToken
 
 from application.utils import encrypt_fernet, decrypt_fernet
-from application.models import UserAuth, UserRegister
+from application.models import UserAuth, UserRegister, UserSession, CourseLink, AttendanceRequest
 from application.exceptions import AuthorizationRetrievalError
 
 KEYWORD_AUTHORIZE = "auth"
 KEYWORD_DEAUTHORIZE = "deauth"
 
+# Saved login sessions older than this are not worth trying, the SSO will have expired them.
+SESSION_COOKIES_MAX_AGE = timedelta(hours=config('SESSION_COOKIES_MAX_AGE_HOURS', cast=int, default=12))
+
 # Helper functions so access_database can be generalized
 def add_userauth(db, user_id, u, p):
     u_enc = encrypt_fernet(u, user_id)
@@ -19,10 +26,14 @@ def update_userauth(db, user_id, u, p):
     user_auth = UserAuth.query.filter_by(user_id=user_id).first()
     user_auth.u = encrypt_fernet(u, user_id)
     user_auth.p = encrypt_fernet(p, user_id[::-1])
+    UserSession.query.filter_by(user_id=user_id).delete()
     db.session.commit()
 
 def delete_userauth(db, user_id):
     UserAuth.query.filter_by(user_id=user_id).delete()
+    UserSession.query.filter_by(user_id=user_id).delete()
+    CourseLink.query.filter_by(user_id=user_id).delete()
+    AttendanceRequest.query.filter_by(user_id=user_id).delete()
     db.session.commit()
 
 def access_database_from_line(unparsed_text, db, user_id):
@@ -46,6 +57,9 @@ def access_database_from_line(unparsed_text, db, user_id):
         delete_query = UserAuth.query.filter_by(user_id=user_id)
         if delete_query.count():
             delete_query.delete()
+            UserSession.query.filter_by(user_id=user_id).delete()
+            CourseLink.query.filter_by(user_id=user_id).delete()
+            AttendanceRequest.query.filter_by(user_id=user_id).delete()
             db.session.commit()
             message_list.append(
                 "User details deleted successfully!"
@@ -69,4 +83,89 @@ def fetch_credentials(user_id):
     
     u = decrypt_fernet(user_auth.u, user_id)
     p = decrypt_fernet(user_auth.p, user_id[::-1])
-    return u, p
\ No newline at end of file
+    return u, p
+
+# Helper functions to remember the cookies of a successful login, so the next job can skip it
+def fetch_session_cookies(user_id):
+    user_session = UserSession.query.filter_by(user_id=user_id).first()
+    if user_session is None or datetime.utcnow() - user_session.timestamp > SESSION_COOKIES_MAX_AGE:
+        return None
+    try:
+        return json.loads(decrypt_fernet(user_session.c, "session" + user_id))
+    except InvalidToken:
+        return None
+
+def store_session_cookies(db, user_id, cookies):
+    c_enc = encrypt_fernet(json.dumps(cookies), "session" + user_id)
+    user_session = UserSession.query.filter_by(user_id=user_id).first()
+    if user_session is None:
+        db.session.add(UserSession(user_id, c_enc, datetime.utcnow()))
+    else:
+        user_session.c = c_enc
+        user_session.timestamp = datetime.utcnow()
+    db.session.commit()
+
+def delete_session_cookies(db, user_id):
+    UserSession.query.filter_by(user_id=user_id).delete()
+    db.session.commit()
+
+# Helper functions to remember where each course lives in a portal, so the dashboard can be skipped
+def fetch_course_links(user_id, portal):
+    return {
+        course_link.course_name: course_link.url
+        for course_link in CourseLink.query.filter_by(user_id=user_id, portal=portal)
+    }
+
+def store_course_links(db, user_id, portal, course_links):
+    stored_course_links = fetch_course_links(user_id, portal)
+    if stored_course_links == course_links:
+        return
+    CourseLink.query.filter_by(user_id=user_id, portal=portal).delete()
+    for course_name, url in course_links.items():
+        db.session.add(CourseLink(user_id, portal, course_name, url))
+    db.session.commit()
+
+# Helper functions to learn when each user usually sends their attendance code
+def log_attendance_request(db, user_id, course_names, requested_at):
+    """requested_at is in WIB, the time zone classes are scheduled in."""
+    minute_of_day = requested_at.hour * 60 + requested_at.minute
+    for course_name in course_names:
+        db.session.add(AttendanceRequest(user_id, course_name, requested_at.weekday(), minute_of_day, datetime.utcnow()))
+    db.session.commit()
+
+def fetch_usual_attendance_times(weekday, since, min_occurrences):
+    """(user_id, course_name, minute_of_day) of every user and course usually attended on weekday.
+
+    The usual time is the median of the requests made since `since` (UTC), for courses
+    asked for at least min_occurrences times in that period.
+    """
+    minutes_per_course = {}
+    for attendance_request in AttendanceRequest.query.filter(
+        AttendanceRequest.weekday == weekday, AttendanceRequest.timestamp >= since
+    ):
+        key = attendance_request.user_id, attendance_request.course_name
+        minutes_per_course.setdefault(key, []).append(attendance_request.minute_of_day)
+
+    usual_times = []
+    for (user_id, course_name), minutes in minutes_per_course.items():
+        if len(minutes) >= min_occurrences:
+            usual_times.append((user_id, course_name, sorted(minutes)[len(minutes) // 2]))
+    return usual_times
+
+def fetch_session_cookies_age(user_id):
+    user_session = UserSession.query.filter_by(user_id=user_id).first()
+    return None if user_session is None else datetime.utcnow() - user_session.timestamp
+
+# Everything a job needs to remember about a user between runs, gathered in one plain dict
+def load_user_state(user_id, portal):
+    return {
+        "session_cookies": fetch_session_cookies(user_id),
+        "course_links": fetch_course_links(user_id, portal),
+    }
+
+def save_user_state(db, user_id, portal, state):
+    if state["session_cookies"]:
+        store_session_cookies(db, user_id, state["session_cookies"])
+    else:
+        delete_session_cookies(db, user_id)
+    store_course_links(db, user_id, portal, state["course_links"])
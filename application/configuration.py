@@ -3,3 +3,12 @@ from decouple import config
 class Configuration:
     SQLALCHEMY_DATABASE_URI = config('DATABASE_URL')
     SQLALCHEMY_TRACK_MODIFICATIONS = False
+    PREWARM_DRIVER_POOL = config('PREWARM_DRIVER_POOL', cast=bool, default=True)
+    # Log users in ahead of the times they usually send attendance codes.
+    PREWARM_SESSIONS = config('PREWARM_SESSIONS', cast=bool, default=True)
+    # Selenium jobs run in this many worker processes, 'auto' for as many as fit in
+    # WORKER_MEMORY_BUDGET_MB. 0 runs them inside the web process.
+    SELENIUM_WORKER_PROCESSES = config('SELENIUM_WORKER_PROCESSES', default='auto')
+    # List the ebook and bank soal folders ahead of the first library request.
+    PREWARM_LIBRARY_CACHE = config('PREWARM_LIBRARY_CACHE', cast=bool, default=True)
+    STATUS_TOKEN = config('STATUS_TOKEN', default='')
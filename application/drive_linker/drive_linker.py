@@ -3,9 +3,16 @@ import logging
 from decouple import config
 from datetime import timedelta
 import humanize
+from concurrent.futures import ThreadPoolExecutor
 
+import httplib2
+from pydrive.files import ApiRequestError
+
+from application.drive_linker.library_cache import library_cache
+from application.drive_linker.folder_numbering import folder_numbering_index
 from application.utils.log_handler import ListHandler
-from application.exceptions import WrongSpecificationError
+from application.utils.circuit_breaker import circuit_breakers
+from application.exceptions import WrongSpecificationError, UpstreamUnavailableError
 
 module_logger = logging.getLogger(__name__)
 module_logger.setLevel(logging.DEBUG)
@@ -13,6 +20,9 @@ module_logger.setLevel(logging.DEBUG)
 bank_soal_folder_id = config("BANK_SOAL_FOLDER_ID")
 ebook_folder_id = config("EBOOK_FOLDER_ID")
 
+# How many folders of a course folder tree are listed side by side.
+DRIVE_LIST_WORKERS = config("DRIVE_LIST_WORKERS", cast=int, default=8)
+
 def browse_library_from_line(drive, doctype, unparsed_rest_of_text, user_id):
     start_time = timeit.default_timer()
     message_list = []
@@ -53,20 +63,32 @@ def run_library(drive, doctype, sorted_number, user_id):
     logger.setLevel(logging.DEBUG)
     logger.addHandler(ListHandler(message_list=message_list))
 
-    drive_linker = DriveLinker(drive, logger, home_folder)
-    reply = drive_linker.summarize_course_folder_with_this_sorted_number(sorted_number)
+    drive_linker = DriveLinker(drive, logger, home_folder, user_id)
+    try:
+        with circuit_breakers.guard("drive", is_outage=is_drive_outage):
+            reply = drive_linker.summarize_course_folder_with_this_sorted_number(sorted_number)
+    except UpstreamUnavailableError as error:
+        reply = str(error)
     
     message_list.append(reply)
     return message_list
 
+def is_drive_outage(error):
+    """Whether Drive didn't answer, or answered with a server error."""
+    if isinstance(error, ApiRequestError) and error.args:
+        error = error.args[0] # The googleapiclient HttpError
+    status = getattr(getattr(error, 'resp', None), 'status', 0)
+    return isinstance(error, (OSError, httplib2.HttpLib2Error)) or int(status) >= 500
+
 class DriveLinker:
     """
     Methods that interact with drive, go here.
     """
-    def __init__(self, drive_instance, logger_instance, home_folder):
+    def __init__(self, drive_instance, logger_instance, home_folder, user_id=None):
         self.drive = drive_instance
         self.logger = logger_instance
         self.home_folder = home_folder
+        self.user_id = user_id # Whose numbers "ebook N" are, see _get_folder_id_by_sorted_number
         self.directory_path_separator = " - "
     
     def summarize_course_folder_with_this_sorted_number(self, sorted_number):
@@ -83,57 +105,86 @@ class DriveLinker:
             return self._summarize_course_folder_into_string(folder_id)
     
     def _get_folder_id_by_sorted_number(self, subfolder_sorted_number):
+        """Given a number from the home folder's listing, obtain the id it stands for
+
+        Numbers are looked up in the listing the user was last shown, kept as a numbering
+        snapshot, so a folder added in the meantime doesn't shift them. If that listing is
+        too old, or the item has gone since, the user is told to list the home folder again.
+        """
         if subfolder_sorted_number is None:
             return self.home_folder
         
-        actual_index = int(subfolder_sorted_number) - 1 # Python is 0-indexed, but showing the list to user is 1-indexed.
-        subfolders, files = self._get_home_folder_contents()
-        
-        results = [*subfolders, *files]
+        number = int(subfolder_sorted_number)
+        current_numbering = self._get_home_folder_numbering()
+        numbering = current_numbering
+        if (seen_version := self._get_seen_home_folder_version()) not in (None, current_numbering.version):
+            numbering = folder_numbering_index.get(self.home_folder, seen_version)
+        if numbering is None:
+            raise IndexError(number, self._stale_number_message(number))
         
         try:
-            item_id = results[actual_index]['id']
+            item_id = numbering.id_of(number)
         except IndexError as error:
             error.args = (
                 *error.args,
-                "Invalid folder number {}. Expected range 1 - {}.".format(int(subfolder_sorted_number), len(results))
+                "Invalid folder number {}. Expected range 1 - {}.".format(number, len(numbering))
             )
             raise error
+        if item_id not in current_numbering.numbers:
+            raise IndexError(number, self._stale_number_message(number))
         return item_id
     
+    def _get_home_folder_numbering(self):
+        """Given the home folder, obtain the numbering of its listing as it is now"""
+        version, (subfolders, files) = library_cache.versioned_contents(self.drive, self.home_folder)
+        return folder_numbering_index.numbering(self.home_folder, version, subfolders, files)
+    
+    def _get_seen_home_folder_version(self):
+        if self.user_id is None:
+            return None
+        return folder_numbering_index.seen(self.user_id, self.home_folder)
+    
+    def _stale_number_message(self, number):
+        return "The folder list has changed since you last saw it, so number {} may not be what you meant. Send the command without a number to see the new list.".format(number)
+    
     def _summarize_home_folder_into_string(self, folder_id):
         """Given a home folder's id, summarize it's contents
         
         This will NOT recursively summarize each subfolder. This function is intended to be used
         on a home folder, i.e. kesmalib/ebook
         """
-        subfolders, files = self._get_home_folder_contents()
+        numbering = self._get_home_folder_numbering()
+        if self.user_id is not None:
+            folder_numbering_index.remember(self.user_id, self.home_folder, numbering.version)
+        numbered_titles = [str(number) + ". " + title for number, title in enumerate(numbering.titles, 1)]
         
         str_list = [
             # List all subfolders
-            *[str(index) + ". " + item['title'] for index, item in enumerate(subfolders, 1)],
+            *numbered_titles[:numbering.folder_count],
             
             # An empty space to separate folder from files
             "",
             
             # List all files
-            *[str(index) + ". " + item['title'] for index, item in enumerate(files, len(subfolders) + 1)],
+            *numbered_titles[numbering.folder_count:],
         ]
         
         str_reply = "\n".join(str_list)
         return str_reply
     
-    def _summarize_course_folder_into_string(self, folder_id, prepend_title=''):
+    def _summarize_course_folder_into_string(self, folder_id, prepend_title='', listings=None):
         """Given a course folder's id, summarize its contents
         
         This will recursively summarize each subfolder. This function is intended to be used
         on a course folder, i.e. kesmalib/ebook/pms
         """
-        subfolders, files = self._get_subfolders_and_files_separately(folder_id)
+        if listings is None:
+            listings = self._get_folder_tree_contents(folder_id)
+        subfolders, files = listings[folder_id]
         
         str_list = [            
             # Summarize each subfolder
-            *[self._summarize_course_folder_into_string(folder_id=folder['id'], prepend_title=folder['title']+self.directory_path_separator) for folder in subfolders],
+            *[self._summarize_course_folder_into_string(folder_id=folder['id'], prepend_title=folder['title']+self.directory_path_separator, listings=listings) for folder in subfolders],
             
             # Summarize this folder
             *[
@@ -146,55 +197,28 @@ class DriveLinker:
         str_reply = "\n\n".join(str_list)
         return str_reply
     
-    def _get_home_folder_contents(self):
-        """Given a home folder's id, obtain its contents and sort"""
-        subfolders, files = self._get_subfolders_and_files_separately(self.home_folder)
-        
-        subfolders = sorted(subfolders, key = lambda item: item['title'])
-        files = sorted(files, key = lambda item: item['title'])
-        
-        return subfolders, files
-        
-    def _get_subfolders_and_files_separately(self, folder_id):
-        query = self._build_query(folder_id=folder_id)
-        item_list = self.drive.ListFile(query).GetList()
-        
-        subfolders, files = self._separate_into_subfolders_and_files_based_on_mimetype(item_list)
-        return subfolders, files
-    
-    def _separate_into_subfolders_and_files_based_on_mimetype(self, item_list):
-        subfolders, files = [], []
-        for item in item_list:
-            if item['mimeType'] == "application/vnd.google-apps.folder":
-                subfolders.append(item)
-            else:
-                files.append(item)
-        
-        return subfolders, files
+    def _get_folder_tree_contents(self, folder_id):
+        """Given a folder's id, obtain the contents of it and every folder under it
 
-    def _build_query(self, folder_id=None, search_by_title=None, exact_title=True):
+        Folders are listed level by level, all folders of a level at once, so a deep tree
+        costs as many rounds of queries as it has levels rather than folders.
+        Returns {folder id: (subfolders, files)}.
         """
-        Helper method to build query dict for pydrive ListFile method
-        """
-        # Folder query
-        if folder_id is None:
-            folder_id = self.home_folder
-        folder_query = "'{}' in parents and trashed=false".format(folder_id)
-
-        # Title query
-        # I realize either one the following is not going to be used
-        # but I'll leave here anyway for the meantime
-        if search_by_title is not None:
-            if exact_title:
-                title_query = "title = '{}'".format(search_by_title)
-            else:
-                title_query = "title contains '{}'".format(search_by_title)
-            full_query = " and ".join([folder_query, title_query])
-        else:
-            full_query = folder_query
-        
-        return {"q": full_query}
+        listings = {}
+        level = [folder_id]
+        with ThreadPoolExecutor(max_workers=DRIVE_LIST_WORKERS) as executor:
+            while level:
+                listings.update(self._get_subfolders_and_files_of_many(level, executor.map))
+                level = list(dict.fromkeys(
+                    folder['id'] for subfolders, _ in map(listings.get, level) for folder in subfolders
+                    if folder['id'] not in listings
+                ))
+        return listings
     
+    def _get_subfolders_and_files_of_many(self, folder_ids, map_function=map):
+        # Folders that aren't cached are listed a few dozen at a time, see build_parents_queries
+        return library_cache.contents_of_many(self.drive, folder_ids, map_function)
+
     def _get_title_by_id(self, folder_id):
         # NOTE(Rayhan) Unused at the moment
         return self.drive.CreateFile({"id": folder_id})['title'].upper()
@@ -0,0 +1,71 @@
+import threading
+from collections import OrderedDict
+
+from decouple import config
+
+# How many past numberings of a home folder are kept, so "ebook N" still means the folder
+# numbered N in the listing the user saw, even if the home folder has changed since.
+FOLDER_NUMBERING_HISTORY = config('FOLDER_NUMBERING_HISTORY', cast=int, default=8)
+
+class FolderNumbering:
+    """
+    A home folder's listing as numbered for users: subfolders, then files, each sorted by title.
+
+    Snapshot of one version of the listing. Number N is at ids[N - 1], numbers maps ids back.
+    """
+    __slots__ = ('version', 'ids', 'titles', 'numbers', 'folder_count')
+
+    def __init__(self, version, subfolders, files):
+        subfolders = sorted(subfolders, key = lambda item: item['title'])
+        files = sorted(files, key = lambda item: item['title'])
+        self.version = version
+        self.ids = tuple(item['id'] for item in [*subfolders, *files])
+        self.titles = tuple(item['title'] for item in [*subfolders, *files])
+        self.numbers = {item_id: number for number, item_id in enumerate(self.ids, 1)}
+        self.folder_count = len(subfolders)
+
+    def __len__(self):
+        return len(self.ids)
+
+    def id_of(self, number):
+        """Id numbered number (1-based). Raises IndexError if there's no such number."""
+        if not 1 <= number <= len(self.ids):
+            raise IndexError(number)
+        return self.ids[number - 1]
+
+class FolderNumberingIndex:
+    """
+    Numberings of the home folders, built once per version of their listing, and which
+    version every user has last been shown.
+    """
+    def __init__(self, history=FOLDER_NUMBERING_HISTORY):
+        self.history = max(1, history)
+        self._numberings = {} # folder id -> OrderedDict of version -> FolderNumbering, oldest first
+        self._seen = {} # (user id, folder id) -> version last shown to them
+        self._lock = threading.Lock()
+
+    def numbering(self, folder_id, version, subfolders, files):
+        """Numbering of version of the folder's listing, with the given contents if it has to be built."""
+        with self._lock:
+            numberings = self._numberings.setdefault(folder_id, OrderedDict())
+            if (numbering := numberings.get(version)) is None:
+                numbering = numberings[version] = FolderNumbering(version, subfolders, files)
+                while len(numberings) > self.history:
+                    numberings.popitem(last=False)
+            return numbering
+
+    def get(self, folder_id, version):
+        """Numbering of an earlier version of the folder's listing, None if it's no longer kept."""
+        with self._lock:
+            return self._numberings.get(folder_id, {}).get(version)
+
+    def remember(self, user_id, folder_id, version):
+        with self._lock:
+            self._seen[(user_id, folder_id)] = version
+
+    def seen(self, user_id, folder_id):
+        """Version of the folder's numbering user_id was last shown, None if they weren't."""
+        with self._lock:
+            return self._seen.get((user_id, folder_id))
+
+folder_numbering_index = FolderNumberingIndex()
@@ -0,0 +1,326 @@
+import itertools
+import logging
+import threading
+import timeit
+
+from decouple import config
+from apiclient import errors
+from pydrive.auth import LoadAuth
+from pydrive.files import ApiRequestError
+
+# Cached listings are checked against Drive's changes feed at most this often, in seconds.
+LIBRARY_CACHE_REFRESH_INTERVAL = config('LIBRARY_CACHE_REFRESH_INTERVAL', cast=int, default=60)
+# How long a request waits for that check before it's served the cached listings anyway, in seconds.
+LIBRARY_CACHE_REFRESH_WAIT = config('LIBRARY_CACHE_REFRESH_WAIT', cast=float, default=1)
+
+# Longest Drive query listing several folders at once. Longer ones are split up.
+DRIVE_QUERY_MAX_LENGTH = config('DRIVE_QUERY_MAX_LENGTH', cast=int, default=2000)
+
+# Listings ask for the fields LibraryNode keeps and nothing else, in pages as large as Drive allows
+# (the size pydrive's GetList() asks for too).
+LISTING_FIELDS = "nextPageToken,items(id,title,mimeType,parents/id,webContentLink,fileSize)"
+CHANGES_FIELDS = (
+    "nextPageToken,newStartPageToken,"
+    "items(fileId,deleted,file(id,title,mimeType,parents/id,webContentLink,fileSize,labels/trashed))"
+)
+LISTING_PAGE_SIZE = 1000
+
+FOLDER_MIME_TYPE = "application/vnd.google-apps.folder"
+
+# Drive answers these to a page token it no longer knows. The listings have to be loaded anew.
+EXPIRED_PAGE_TOKEN_STATUSES = (400, 404, 410)
+
+module_logger = logging.getLogger(__name__)
+module_logger.setLevel(logging.INFO)
+
+def build_parents_queries(folder_ids, max_length=DRIVE_QUERY_MAX_LENGTH):
+    """Drive queries for the items in any of folder_ids, e.g. "('a' in parents or 'b' in parents) and trashed=false".
+
+    Each query is at most max_length long, unless a single folder's is longer already.
+    """
+    queries, clauses = [], []
+    for folder_id in folder_ids:
+        clause = "'{}' in parents".format(folder_id)
+        if clauses and len(parents_query(clauses + [clause])) > max_length:
+            queries.append(parents_query(clauses))
+            clauses = []
+        clauses.append(clause)
+    if clauses:
+        queries.append(parents_query(clauses))
+    return queries
+
+def parents_query(clauses):
+    return "({}) and trashed=false".format(" or ".join(clauses))
+
+def listing_param(query, fields=LISTING_FIELDS, page_size=LISTING_PAGE_SIZE):
+    """pydrive ListFile parameters for query. fields=None and page_size=None get Drive's defaults."""
+    param = {"q": query}
+    if fields is not None:
+        param["fields"] = fields
+    if page_size is not None:
+        param["maxResults"] = page_size
+    return param
+
+def list_pages(drive, query, fields=LISTING_FIELDS, page_size=LISTING_PAGE_SIZE):
+    """The items matching query, a page (list of pydrive files) at a time. Each page is fetched when it's asked for."""
+    yield from drive.ListFile(listing_param(query, fields, page_size))
+
+def split_folders_and_files(nodes):
+    return [node for node in nodes if node.is_folder], [node for node in nodes if not node.is_folder]
+
+class LibraryNode:
+    """
+    A file or folder in the library, with just what DriveLinker shows of it.
+
+    Reads like the pydrive file it was made from, e.g. node['title'].
+    """
+    __slots__ = ('id', 'title', 'mime_type', 'parent_ids', 'web_content_link', 'file_size')
+
+    DRIVE_FIELDS = {
+        'id': 'id', 'title': 'title', 'mimeType': 'mime_type', 'webContentLink': 'web_content_link', 'fileSize': 'file_size'
+    }
+
+    def __init__(self, node_id, title, mime_type, parent_ids, web_content_link=None, file_size=None):
+        self.id = node_id
+        self.title = title
+        self.mime_type = mime_type
+        self.parent_ids = parent_ids
+        self.web_content_link = web_content_link
+        self.file_size = file_size
+
+    @classmethod
+    def from_drive_file(cls, item):
+        return cls(
+            item['id'], item['title'], item['mimeType'],
+            tuple(parent['id'] for parent in item.get('parents', [])),
+            item.get('webContentLink'),
+            int(item['fileSize']) if item.get('fileSize') is not None else None,
+        )
+
+    @property
+    def is_folder(self):
+        return self.mime_type == FOLDER_MIME_TYPE
+
+    def __getitem__(self, key):
+        try:
+            return getattr(self, self.DRIVE_FIELDS[key])
+        except KeyError:
+            raise KeyError(key) from None
+
+    def __repr__(self):
+        return "LibraryNode({!r}, {!r})".format(self.id, self.title)
+
+class DriveChangesFeed:
+    """Drive's changes feed, which pydrive doesn't cover. Calls are authorized the way pydrive does it."""
+    def __init__(self, auth):
+        self.auth = auth
+        self.http = None
+
+    @LoadAuth
+    def start_page_token(self):
+        try:
+            return self.auth.service.changes().getStartPageToken().execute(http=self.http)['startPageToken']
+        except errors.HttpError as error:
+            raise ApiRequestError(error)
+
+    @LoadAuth
+    def page(self, page_token):
+        try:
+            return self.auth.service.changes().list(
+                pageToken=page_token, includeDeleted=True, maxResults=LISTING_PAGE_SIZE, fields=CHANGES_FIELDS
+            ).execute(http=self.http)
+        except errors.HttpError as error:
+            raise ApiRequestError(error)
+
+class LibraryCache:
+    """
+    Listings of library folders, kept in step with Drive so that browsing the library
+    doesn't have to list folders live.
+
+    A folder is listed from Drive the first time it's browsed, or by warm_up. From then
+    on it's kept current from Drive's changes feed: at most every refresh_interval, a
+    request checks the feed for what changed since the last check. If Drive takes longer
+    than refresh_wait to answer, the request gets the cached listings and the check
+    finishes in the background.
+    """
+    def __init__(self, refresh_interval=LIBRARY_CACHE_REFRESH_INTERVAL, refresh_wait=LIBRARY_CACHE_REFRESH_WAIT):
+        self.refresh_interval = refresh_interval
+        self.refresh_wait = refresh_wait
+
+        self._nodes = {} # id -> LibraryNode of everything in a listed folder
+        self._listings = {} # folder id -> [child ids], in Drive's order
+        self._versions = {} # folder id -> version of its listing, see versioned_contents
+        self._version_counter = itertools.count(1)
+        self._page_token = None # Where the changes feed continues, taken before the first listing
+        self._refreshed_at = None
+        self._refreshing = None # Thread of the changes feed check in flight
+        self._lock = threading.Lock()
+
+    def contents(self, drive, folder_id):
+        """(subfolders, files) of folder_id, as lists of LibraryNode."""
+        return self.contents_of_many(drive, [folder_id])[folder_id]
+
+    def contents_of_many(self, drive, folder_ids, map_function=map):
+        """{folder id: (subfolders, files)} of each of folder_ids.
+
+        Folders that aren't cached yet are listed together, in as few Drive queries as
+        fit DRIVE_QUERY_MAX_LENGTH. Those queries are run with map_function, e.g. an
+        executor's map to run them side by side.
+        """
+        return {
+            folder_id: split_folders_and_files(children)
+            for folder_id, (_, children) in self._versioned_children(drive, folder_ids, map_function).items()
+        }
+
+    def versioned_contents(self, drive, folder_id):
+        """(version, (subfolders, files)) of folder_id. The version is a new one whenever the listing changes."""
+        version, children = self._versioned_children(drive, [folder_id])[folder_id]
+        return version, split_folders_and_files(children)
+
+    def warm_up(self, drive, root_ids):
+        """List every folder under root_ids, so even the first requests find them cached."""
+        level = list(root_ids)
+        while level:
+            listings = self.contents_of_many(drive, level)
+            level = [folder.id for subfolders, _ in listings.values() for folder in subfolders]
+
+    def start_warming(self, drive, root_ids):
+        def warm_up():
+            try:
+                self.warm_up(drive, root_ids)
+            except Exception:
+                module_logger.exception("Failed to list the library ahead of time.")
+        threading.Thread(target=warm_up, name="library-cache-warmer", daemon=True).start()
+
+    def stats(self):
+        with self._lock:
+            return {
+                "folders": len(self._listings),
+                "nodes": len(self._nodes),
+                "refreshed_ago": None if self._refreshed_at is None else timeit.default_timer() - self._refreshed_at,
+            }
+
+    def _versioned_children(self, drive, folder_ids, map_function=map):
+        """{folder id: (version, [LibraryNode])} of each of folder_ids."""
+        self._refresh_if_due(drive)
+        children_of, missing = {}, []
+        with self._lock:
+            for folder_id in folder_ids:
+                if (child_ids := self._listings.get(folder_id)) is None:
+                    missing.append(folder_id)
+                else:
+                    children_of[folder_id] = (self._versions[folder_id], [self._nodes[child_id] for child_id in child_ids])
+        if missing:
+            children_of.update(self._load(drive, missing, map_function))
+        return {folder_id: children_of[folder_id] for folder_id in folder_ids}
+
+    def _load(self, drive, folder_ids, map_function=map):
+        if self._page_token is None:
+            page_token = DriveChangesFeed(drive.auth).start_page_token()
+            with self._lock:
+                if self._page_token is None:
+                    self._page_token, self._refreshed_at = page_token, timeit.default_timer()
+
+        # One query lists several folders. Items are sorted back into them by their parents.
+        children_of = {folder_id: [] for folder_id in folder_ids}
+        queries = build_parents_queries(list(children_of))
+        def list_nodes(query):
+            # Each page is boiled down to nodes before the next one is fetched
+            return [LibraryNode.from_drive_file(item) for page in list_pages(drive, query) for item in page]
+
+        for nodes in map_function(list_nodes, queries):
+            for node in nodes:
+                for parent_id in node.parent_ids:
+                    if parent_id in children_of:
+                        children_of[parent_id].append(node)
+
+        versioned_children_of = {}
+        with self._lock:
+            for folder_id, children in children_of.items():
+                for node in children:
+                    self._nodes[node.id] = node
+                self._listings[folder_id] = [node.id for node in children]
+                self._versions[folder_id] = version = next(self._version_counter)
+                versioned_children_of[folder_id] = (version, children)
+        return versioned_children_of
+
+    def _refresh_if_due(self, drive):
+        with self._lock:
+            if self._page_token is None or timeit.default_timer() - self._refreshed_at < self.refresh_interval:
+                return
+            if self._refreshing is None:
+                self._refreshing = threading.Thread(
+                    target=self._refresh, args=(drive,), name="library-cache-refresh", daemon=True
+                )
+                self._refreshing.start()
+            refreshing = self._refreshing
+        refreshing.join(self.refresh_wait)
+
+    def _refresh(self, drive):
+        try:
+            feed = DriveChangesFeed(drive.auth)
+            changes, page = [], {'nextPageToken': self._page_token}
+            while 'nextPageToken' in page:
+                page = feed.page(page['nextPageToken'])
+                changes.extend(page.get('items', []))
+
+            with self._lock:
+                for change in changes:
+                    self._apply(change)
+                self._page_token = page['newStartPageToken']
+        except ApiRequestError as error:
+            status = getattr(getattr(error.args[0] if error.args else None, 'resp', None), 'status', 0)
+            if int(status) in EXPIRED_PAGE_TOKEN_STATUSES:
+                module_logger.warning("Drive no longer knows the library's page token, listing it anew.")
+                with self._lock:
+                    self._nodes, self._listings, self._versions, self._page_token = {}, {}, {}, None
+            else:
+                module_logger.warning("Failed to check Drive for library changes: {}".format(error))
+        except Exception as error:
+            module_logger.warning("Failed to check Drive for library changes: {}".format(error))
+        finally:
+            with self._lock:
+                self._refreshed_at = timeit.default_timer() # Failed checks wait their turn as well
+                self._refreshing = None
+
+    def _apply(self, change):
+        """Bring the listings in line with one change. Files outside the listed folders are of no interest."""
+        file_id = change['fileId']
+        item = change.get('file')
+        removed = change.get('deleted') or item is None or item.get('labels', {}).get('trashed')
+        node = None if removed else LibraryNode.from_drive_file(item)
+
+        old_node = self._nodes.get(file_id)
+        old_parent_ids = set(old_node.parent_ids) if old_node is not None else set()
+        new_parent_ids = set(node.parent_ids) if node is not None else set()
+        for parent_id in old_parent_ids - new_parent_ids:
+            if file_id in (listing := self._listings.get(parent_id, ())):
+                listing.remove(file_id)
+        for parent_id in new_parent_ids - old_parent_ids:
+            if (listing := self._listings.get(parent_id)) is not None and file_id not in listing:
+                listing.append(file_id)
+
+        # A listing is numbered by its children's titles, so only a child coming, going or
+        # being renamed makes a new version of it. Edits to a file's content don't.
+        renamed = old_node is not None and node is not None and (
+            (old_node.title, old_node.is_folder) != (node.title, node.is_folder)
+        )
+        for parent_id in (old_parent_ids ^ new_parent_ids) | (old_parent_ids & new_parent_ids if renamed else set()):
+            if parent_id in self._listings:
+                self._versions[parent_id] = next(self._version_counter)
+
+        if node is not None and any(parent_id in self._listings for parent_id in new_parent_ids):
+            self._nodes[file_id] = node
+        else:
+            self._forget(file_id)
+
+    def _forget(self, node_id):
+        """Drop a node that is no longer in any listed folder, and if it's a folder, what was listed under it."""
+        self._nodes.pop(node_id, None)
+        self._versions.pop(node_id, None)
+        for child_id in self._listings.pop(node_id, ()):
+            child = self._nodes.get(child_id)
+            if child is not None and not any(parent_id in self._listings for parent_id in child.parent_ids):
+                self._forget(child_id)
+
+library_cache = LibraryCache()
@@ -31,4 +31,44 @@ class NoUnattendedEntryError(Exception):
 # Flask-SQLAlchemy-related custom exceptions:
 class AuthorizationRetrievalError(Exception):
     def __init__(self, msg="Failed to retrieve authorization from database.", *args, **kwargs):
-        super().__init__(msg, *args, **kwargs)
\ No newline at end of file
+        super().__init__(msg, *args, **kwargs)
+
+# Webdriver pool-related custom exceptions:
+class DriverPoolExhaustedError(Exception):
+    def __init__(self, msg="All browsers are busy at the moment. Please try again in a minute.", *args, **kwargs):
+        super().__init__(msg, *args, **kwargs)
+
+# HTTP fast path-related custom exceptions:
+class PageStructureError(Exception):
+    def __init__(self, msg="Page does not have the structure the HTTP fast path expects.", *args, **kwargs):
+        super().__init__(msg, *args, **kwargs)
+
+# Worker process pool-related custom exceptions:
+class WorkerJobError(Exception):
+    def __init__(self, msg="The operation failed because its worker process had to be stopped.", *args, **kwargs):
+        super().__init__(msg, *args, **kwargs)
+
+class WorkerPoolExhaustedError(WorkerJobError):
+    def __init__(self, msg="All workers are busy at the moment. Please try again in a minute.", *args, **kwargs):
+        super().__init__(msg, *args, **kwargs)
+
+class WorkerJobTimeoutError(WorkerJobError):
+    def __init__(self, msg="The operation took too long and was stopped.", *args, **kwargs):
+        super().__init__(msg, *args, **kwargs)
+
+class WorkerMemoryExceededError(WorkerJobError):
+    def __init__(self, msg="The operation used too much memory and was stopped.", *args, **kwargs):
+        super().__init__(msg, *args, **kwargs)
+
+class WorkerCrashedError(WorkerJobError):
+    def __init__(self, msg="The operation failed because its worker process crashed.", *args, **kwargs):
+        super().__init__(msg, *args, **kwargs)
+
+class WorkerJobCancelledError(WorkerJobError):
+    def __init__(self, msg="The operation was cancelled before it got its inputs.", *args, **kwargs):
+        super().__init__(msg, *args, **kwargs)
+
+# Upstream circuit breaker-related custom exceptions:
+class UpstreamUnavailableError(Exception):
+    def __init__(self, msg="The portal is not responding at the moment. Please try again later.", *args, **kwargs):
+        super().__init__(msg, *args, **kwargs)
@@ -28,4 +28,55 @@ class UserRegister(db.Model):
         self.user_id = user_id
     
     def __repr__(self):
-        return "<user_id {}>".format(self.user_id)
\ No newline at end of file
+        return "<user_id {}>".format(self.user_id)
+
+class UserSession(db.Model):
+    __tablename__ = "UserSession"
+    id = db.Column(db.String(), primary_key=True, default = lambda: str(uuid.uuid4()), unique=True)
+    user_id = db.Column(db.String())
+    c = db.Column(db.String())
+    timestamp = db.Column(db.DateTime())
+
+    def __init__(self, user_id, c, timestamp):
+        self.user_id = user_id
+        self.c = c
+        self.timestamp = timestamp
+    
+    def __repr__(self):
+        return "<user_id {}>".format(self.user_id)
+
+class CourseLink(db.Model):
+    __tablename__ = "CourseLink"
+    id = db.Column(db.String(), primary_key=True, default = lambda: str(uuid.uuid4()), unique=True)
+    user_id = db.Column(db.String())
+    portal = db.Column(db.String())
+    course_name = db.Column(db.String())
+    url = db.Column(db.String())
+
+    def __init__(self, user_id, portal, course_name, url):
+        self.user_id = user_id
+        self.portal = portal
+        self.course_name = course_name
+        self.url = url
+    
+    def __repr__(self):
+        return "<user_id {} course_name {}>".format(self.user_id, self.course_name)
+
+class AttendanceRequest(db.Model):
+    __tablename__ = "AttendanceRequest"
+    id = db.Column(db.String(), primary_key=True, default = lambda: str(uuid.uuid4()), unique=True)
+    user_id = db.Column(db.String())
+    course_name = db.Column(db.String())
+    weekday = db.Column(db.Integer())
+    minute_of_day = db.Column(db.Integer())
+    timestamp = db.Column(db.DateTime())
+
+    def __init__(self, user_id, course_name, weekday, minute_of_day, timestamp):
+        self.user_id = user_id
+        self.course_name = course_name
+        self.weekday = weekday
+        self.minute_of_day = minute_of_day
+        self.timestamp = timestamp
+    
+    def __repr__(self):
+        return "<user_id {} course_name {}>".format(self.user_id, self.course_name)
@@ -0,0 +1,24 @@
+import hmac
+from flask import Blueprint, current_app, request, abort, jsonify
+
+from application.utils.worker_pool import worker_pool
+from application.utils.circuit_breaker import circuit_breakers
+from application.utils.page_object_models.waits import wait_stats
+
+status = Blueprint('status', __name__, url_prefix='/status')
+
+@status.before_request
+def check_status_token():
+    # Status pages show process ids and load. Hide them unless the configured token is given.
+    status_token = current_app.config.get('STATUS_TOKEN')
+    if not status_token or not hmac.compare_digest(request.args.get('token', ''), status_token):
+        abort(404)
+
+@status.route("/workers", methods=['GET'])
+def workers():
+    # Waits are recorded in the workers and gathered here as their jobs come back
+    return jsonify({**worker_pool.stats(), "waits": wait_stats.snapshot()})
+
+@status.route("/upstreams", methods=['GET'])
+def upstreams():
+    return jsonify(circuit_breakers.stats())
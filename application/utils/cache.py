@@ -0,0 +1,64 @@
+import threading
+import timeit
+
+class SharedResultCache:
+    """
+    In-process TTL cache for results that are the same for every user, e.g. a class' zoom link.
+
+    get_or_compute() makes sure at most one computation per key runs at a time: callers
+    arriving while one is in flight wait for its result instead of starting their own.
+    If that computation comes back empty, one of the waiters takes over.
+    """
+    def __init__(self, ttl, wait_timeout=None):
+        self.ttl = ttl
+        self.wait_timeout = wait_timeout
+        self._entries = {}  # key -> (stored_at, value)
+        self._in_flight = {}  # key -> threading.Event
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            return self._get(key)
+
+    def put(self, key, value):
+        with self._lock:
+            self._entries[key] = (timeit.default_timer(), value)
+
+    def invalidate(self, key):
+        with self._lock:
+            self._entries.pop(key, None)
+
+    def get_or_compute(self, key, compute):
+        """Returns (value, from_cache). compute() returning None means nothing to cache."""
+        deadline = None if self.wait_timeout is None else timeit.default_timer() + self.wait_timeout
+        while True:
+            with self._lock:
+                if (value := self._get(key)) is not None:
+                    return value, True
+                if (in_flight := self._in_flight.get(key)) is None:
+                    in_flight = self._in_flight[key] = threading.Event()
+                    break
+
+            remaining = None if deadline is None else deadline - timeit.default_timer()
+            if remaining is not None and remaining <= 0:
+                return compute(), False # Waited long enough, do it ourselves.
+            in_flight.wait(remaining)
+
+        try:
+            value = compute()
+            if value is not None:
+                self.put(key, value)
+            return value, False
+        finally:
+            with self._lock:
+                del self._in_flight[key]
+            in_flight.set()
+
+    def _get(self, key):
+        if (entry := self._entries.get(key)) is None:
+            return None
+        stored_at, value = entry
+        if timeit.default_timer() - stored_at > self.ttl:
+            del self._entries[key]
+            return None
+        return value
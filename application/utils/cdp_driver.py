@@ -0,0 +1,761 @@
+import os
+import json
+import shutil
+import fnmatch
+import logging
+import tempfile
+import threading
+import time
+import itertools
+import subprocess
+import timeit
+from concurrent.futures import ThreadPoolExecutor
+
+import websocket
+from decouple import config
+from selenium.common.exceptions import (
+    WebDriverException, TimeoutException, JavascriptException, NoSuchElementException, NoSuchWindowException,
+    StaleElementReferenceException, ElementClickInterceptedException, ElementNotInteractableException,
+    InvalidArgumentException
+)
+from selenium.webdriver.common.keys import Keys
+
+# Seconds to wait for Chrome to start listening, for a reply to a single command,
+# and for a page to load (get() raises TimeoutException after that).
+CDP_LAUNCH_TIMEOUT = config('CDP_LAUNCH_TIMEOUT', cast=int, default=20)
+CDP_COMMAND_TIMEOUT = config('CDP_COMMAND_TIMEOUT', cast=int, default=30)
+CDP_PAGE_LOAD_TIMEOUT = config('CDP_PAGE_LOAD_TIMEOUT', cast=int, default=30)
+
+# How long window_handles waits for a window that was just opened to be attached to.
+NEW_WINDOW_ATTACH_TIMEOUT = 2
+
+# Names Chrome goes by when it's on the PATH, tried in order when no binary is configured.
+CHROME_BINARY_NAMES = ('google-chrome', 'google-chrome-stable', 'chromium', 'chromium-browser', 'chrome')
+
+# Error messages that mean a script ran against a page (or element) that is gone.
+GONE_CONTEXT_ERRORS = (
+    'Cannot find context with specified id',
+    'Could not find object with given id',
+    'Execution context was destroyed',
+    'Inspected target navigated or closed',
+)
+STALE_MARKER = '__cdp_stale_element__'
+
+# Selenium locators, evaluated in the page. Same strategies as SNAPSHOT_SCRIPT in the page objects.
+FIND_ALL_FUNCTION = r"""
+function findAll(context, by, value) {
+    switch (by) {
+        case 'xpath':
+            var result = document.evaluate(value, context, null, XPathResult.ORDERED_NODE_SNAPSHOT_TYPE, null);
+            var nodes = [];
+            for (var i = 0; i < result.snapshotLength; i++) nodes.push(result.snapshotItem(i));
+            return nodes;
+        case 'id':
+            return Array.prototype.slice.call(context.querySelectorAll('[id="' + value.replace(/"/g, '\\"') + '"]'));
+        case 'name':
+            return Array.prototype.slice.call(context.querySelectorAll('[name="' + value.replace(/"/g, '\\"') + '"]'));
+        case 'tag name':
+            return Array.prototype.slice.call(context.getElementsByTagName(value));
+        case 'class name':
+            return Array.prototype.slice.call(context.getElementsByClassName(value));
+        case 'link text':
+        case 'partial link text':
+            return Array.prototype.filter.call(context.querySelectorAll('a'), function (a) {
+                var text = a.innerText.trim();
+                return by === 'link text' ? text === value : text.indexOf(value) !== -1;
+            });
+        default:
+            return Array.prototype.slice.call(context.querySelectorAll(value));
+    }
+}
+"""
+
+# Turns a script's return value into JSON, with elements swapped for their index in a separate
+# list. Plain values come back as a string in the same round trip; only results that contain
+# elements need a second look to get hold of them.
+ENCODE_RESULT_FUNCTION = r"""
+function (result) {
+    var elements = [];
+    function encode(value) {
+        if (value instanceof Element) {
+            elements.push(value);
+            return {__cdp_element__: elements.length - 1};
+        }
+        if (Array.isArray(value) || value instanceof NodeList || value instanceof HTMLCollection) {
+            return Array.prototype.map.call(value, encode);
+        }
+        if (value && typeof value === 'object') {
+            var encoded = {};
+            Object.keys(value).forEach(function (key) { encoded[key] = encode(value[key]); });
+            return encoded;
+        }
+        return value === undefined ? null : value;
+    }
+    var json = JSON.stringify(encode(result));
+    if (json === undefined) json = 'null';
+    return elements.length ? {json: json, elements: elements} : json;
+}
+"""
+
+IS_DISPLAYED_SCRIPT = r"""
+if (!(this.offsetWidth || this.offsetHeight || this.getClientRects().length)) return false;
+for (var node = this; node && node.nodeType === Node.ELEMENT_NODE; node = node.parentNode) {
+    var style = getComputedStyle(node);
+    if (style.display === 'none' || style.opacity === '0') return false;
+}
+return getComputedStyle(this).visibility !== 'hidden';
+"""
+
+# Where to click the element: the middle of it, once scrolled into view. Fails the same way
+# chromedriver does when the element has no size or something else is on top of it.
+CLICK_POINT_SCRIPT = r"""
+this.scrollIntoView({block: 'center', inline: 'center'});
+var rect = this.getBoundingClientRect();
+if (!rect.width || !rect.height) return {error: 'not interactable'};
+var x = rect.left + rect.width / 2, y = rect.top + rect.height / 2;
+var hit = document.elementFromPoint(x, y);
+if (hit && hit !== this && !this.contains(hit)) return {error: 'intercepted', by: hit.outerHTML.slice(0, 200)};
+return {x: x, y: y};
+"""
+
+FOCUS_SCRIPT = r"""
+this.focus();
+try { this.selectionStart = this.selectionEnd = this.value.length; } catch (error) {}
+"""
+
+CLEAR_SCRIPT = r"""
+this.focus();
+if ('value' in this) {
+    this.value = '';
+    this.dispatchEvent(new Event('input', {bubbles: true}));
+    this.dispatchEvent(new Event('change', {bubbles: true}));
+} else if (this.isContentEditable) {
+    this.innerHTML = '';
+}
+"""
+
+READ_ATTRIBUTE_SCRIPT = r"""
+var attribute = arguments[0];
+var property = this[attribute];
+if (property !== undefined && property !== null && typeof property !== 'object' && typeof property !== 'function') {
+    return typeof property === 'boolean' ? (property ? 'true' : null) : String(property);
+}
+return this.getAttribute(attribute);
+"""
+
+module_logger = logging.getLogger(__name__)
+module_logger.setLevel(logging.INFO)
+
+def find_chrome_binary():
+    for name in CHROME_BINARY_NAMES:
+        if (path := shutil.which(name)):
+            return path
+    raise WebDriverException("Chrome binary not found, set GOOGLE_CHROME_BIN.")
+
+class CDPError(WebDriverException):
+    """An error reply to a DevTools command."""
+
+class _Reply:
+    __slots__ = ('event', 'message')
+
+    def __init__(self):
+        self.event = threading.Event()
+        self.message = None
+
+class CDPConnection:
+    """
+    The one websocket to the browser. Every page is talked to through its own session on it
+    (flattened protocol), so commands to several pages can be in flight at the same time.
+
+    Events are handed to on_event(method, params, session_id) on the reader thread, which
+    must not block: anything that sends commands of its own has to be moved elsewhere.
+    """
+    def __init__(self, ws_url, on_event, command_timeout=CDP_COMMAND_TIMEOUT):
+        self.on_event = on_event
+        self.command_timeout = command_timeout
+        self.closed = False
+        self._ws = websocket.create_connection(ws_url, suppress_origin=True, enable_multithread=True)
+        self._ids = itertools.count(1)
+        self._pending = {}
+        self._lock = threading.Lock()
+        threading.Thread(target=self._read, name="cdp-reader", daemon=True).start()
+
+    def send(self, method, params=None, session_id=None):
+        return self.wait(self.post(method, params, session_id))
+
+    def send_many(self, commands, session_id=None):
+        """Send every (method, params) command before waiting for any reply. Returns the results in order."""
+        replies = [self.post(method, params, session_id) for method, params in commands]
+        return [self.wait(reply) for reply in replies]
+
+    def post(self, method, params=None, session_id=None):
+        message = {'id': next(self._ids), 'method': method, 'params': params or {}}
+        if session_id:
+            message['sessionId'] = session_id
+        reply = _Reply()
+        with self._lock:
+            if self.closed:
+                raise WebDriverException("Browser connection is closed.")
+            self._pending[message['id']] = (method, reply)
+        try:
+            self._ws.send(json.dumps(message))
+        except (websocket.WebSocketException, OSError) as error:
+            with self._lock:
+                self._pending.pop(message['id'], None)
+            raise WebDriverException("Browser connection is broken: {}".format(error))
+        return method, reply
+
+    def wait(self, posted):
+        method, reply = posted
+        if not reply.event.wait(self.command_timeout):
+            raise TimeoutException("No reply to {} in {} seconds.".format(method, self.command_timeout))
+        if reply.message is None:
+            raise WebDriverException("Browser connection closed while waiting for {}.".format(method))
+        if 'error' in reply.message:
+            raise CDPError("{}: {}".format(method, reply.message['error'].get('message')))
+        return reply.message.get('result', {})
+
+    def close(self):
+        try:
+            self._ws.close()
+        except (websocket.WebSocketException, OSError):
+            pass
+
+    def _read(self):
+        while True:
+            try:
+                message = json.loads(self._ws.recv())
+            except (websocket.WebSocketException, OSError, ValueError):
+                break
+            if 'id' in message:
+                with self._lock:
+                    _, reply = self._pending.pop(message['id'], (None, None))
+                if reply is not None:
+                    reply.message = message
+                    reply.event.set()
+                continue
+            try:
+                self.on_event(message.get('method'), message.get('params', {}), message.get('sessionId'))
+            except Exception:
+                module_logger.exception("Failed to handle {}.".format(message.get('method')))
+
+        with self._lock:
+            self.closed = True
+            pending, self._pending = list(self._pending.values()), {}
+        for _, reply in pending:
+            reply.event.set()
+
+class CDPTarget:
+    """A page (tab or window) of the browser, and the session it's talked to through."""
+    __slots__ = ('target_id', 'session_id', 'order', 'ready', '_loads', '_condition')
+
+    def __init__(self, target_id, session_id, order):
+        self.target_id = target_id
+        self.session_id = session_id
+        self.order = order
+        self.ready = threading.Event() # Set once the session is configured and the page let go
+        self._loads = set() # (loaderId, lifecycle event name) seen since the last navigation
+        self._condition = threading.Condition()
+
+    def start_navigation(self):
+        with self._condition:
+            self._loads.clear()
+
+    def record_lifecycle_event(self, loader_id, name):
+        with self._condition:
+            self._loads.add((loader_id, name))
+            self._condition.notify_all()
+
+    def wait_for_lifecycle_event(self, loader_id, name, timeout):
+        with self._condition:
+            return self._condition.wait_for(lambda: (loader_id, name) in self._loads, timeout)
+
+class CDPSwitchTo:
+    def __init__(self, driver):
+        self._driver = driver
+
+    def window(self, window_name):
+        self._driver._switch_to_window(window_name)
+
+    def default_content(self):
+        pass # Frames are never switched into
+
+class CDPDriver:
+    """
+    Drives Chrome over the DevTools Protocol directly, without chromedriver in between.
+
+    Offers the part of Selenium's WebDriver the page objects use: get(), find_element(s),
+    execute_script(), windows, cookies (through execute_cdp_cmd) and quit(), raising the
+    same selenium exceptions, so the same pages and waits run on either backend. Every call
+    is one or two websocket round trips instead of an HTTP request to chromedriver, which
+    then makes the same DevTools calls.
+
+    On top of that there are block_urls() and intercept_requests() for network interception,
+    applied to every window including ones opened later, and execute_scripts() to evaluate
+    several scripts in one go.
+    """
+    def __init__(self, binary=None, arguments=(), headless=True, page_load_strategy='normal',
+                 blocked_url_patterns=(), blocked_resource_types=()):
+        self.page_load_timeout = CDP_PAGE_LOAD_TIMEOUT
+        self.switch_to = CDPSwitchTo(self)
+        self.capabilities = {'browserName': 'chrome', 'pageLoadStrategy': page_load_strategy}
+        self._load_event = 'DOMContentLoaded' if page_load_strategy == 'eager' else 'load'
+        self._targets = {} # target id -> CDPTarget, pages only
+        self._sessions = {} # session id -> CDPTarget
+        self._order = itertools.count()
+        self._condition = threading.Condition()
+        self._current = None
+        self._blocked_url_patterns = list(blocked_url_patterns)
+        self._request_handlers = [] # (url pattern, resource type or None, handler)
+        self._event_executor = ThreadPoolExecutor(max_workers=4, thread_name_prefix="cdp-events")
+        self.connection = None
+
+        for resource_type in blocked_resource_types:
+            self._request_handlers.append(('*', resource_type, lambda request: 'BlockedByClient'))
+
+        binary = binary or find_chrome_binary()
+        self.user_data_dir = tempfile.mkdtemp(prefix='cdp-driver-')
+        command = [
+            binary,
+            '--remote-debugging-port=0',
+            '--remote-allow-origins=*',
+            '--user-data-dir={}'.format(self.user_data_dir),
+            '--no-first-run',
+            '--no-default-browser-check',
+        ] + (['--headless'] if headless else []) + list(arguments) + ['about:blank']
+        self.process = subprocess.Popen(command, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+        try:
+            self.connection = CDPConnection(self._wait_for_devtools_url(), self._on_event)
+            self._attach_to_pages()
+            self.capabilities['browserVersion'] = self.connection.send('Browser.getVersion')['product'].split('/')[-1]
+        except BaseException:
+            self.quit()
+            raise
+
+    # Navigation and page state
+
+    def get(self, url):
+        target = self._current_target()
+        target.start_navigation()
+        result = self._send(target, 'Page.navigate', {'url': url})
+        if result.get('errorText'):
+            raise WebDriverException("unknown error: {} ({})".format(result['errorText'], url))
+        if 'loaderId' not in result:
+            return # Same-document navigation, nothing to load
+        if not target.wait_for_lifecycle_event(result['loaderId'], self._load_event, self.page_load_timeout):
+            raise TimeoutException("Timed out loading {}".format(url))
+
+    @property
+    def current_url(self):
+        target = self._current_target()
+        url = self.connection.send('Target.getTargetInfo', {'targetId': target.target_id})['targetInfo']['url']
+        return url or 'about:blank' # A window that was just opened has no URL yet
+
+    @property
+    def title(self):
+        return self.execute_script("return document.title;")
+
+    @property
+    def page_source(self):
+        return self.execute_script("return document.documentElement.outerHTML;")
+
+    # Scripts and elements
+
+    def execute_script(self, script, *args):
+        return self._call(self._current_target(), script, args)
+
+    def execute_scripts(self, scripts):
+        """Evaluate several (script, args) pairs in one round trip and return their results in order.
+
+        Arguments and results may not contain elements.
+        """
+        target = self._current_target()
+        posted = [
+            self.connection.post('Runtime.evaluate', self._evaluate_params(script, args), target.session_id)
+            for script, args in scripts
+        ]
+        results = []
+        for reply in posted:
+            try:
+                results.append(self._decode(target, self.connection.wait(reply)))
+            except CDPError as error:
+                raise self._translate(error, stale=False)
+        return results
+
+    def find_element(self, by, value):
+        return self._find_element(None, by, value)
+
+    def find_elements(self, by, value):
+        return self._find_elements(None, by, value)
+
+    # Windows
+
+    @property
+    def current_window_handle(self):
+        return self._current_target().target_id
+
+    @property
+    def window_handles(self):
+        """Every open page, oldest first."""
+        page_ids = [
+            info['targetId'] for info in self.connection.send('Target.getTargets')['targetInfos']
+            if info['type'] == 'page'
+        ]
+        # A window opened a moment ago exists before it's attached to. Give it a moment.
+        deadline = timeit.default_timer() + NEW_WINDOW_ATTACH_TIMEOUT
+        with self._condition:
+            self._condition.wait_for(
+                lambda: all(page_id in self._targets for page_id in page_ids),
+                max(0, deadline - timeit.default_timer())
+            )
+            targets = [self._targets[page_id] for page_id in page_ids if page_id in self._targets]
+        return [target.target_id for target in sorted(targets, key=lambda target: target.order)]
+
+    def close(self):
+        target = self._current_target()
+        self.connection.send('Target.closeTarget', {'targetId': target.target_id})
+        with self._condition:
+            self._condition.wait_for(lambda: target.target_id not in self._targets, CDP_COMMAND_TIMEOUT)
+        self._current = None
+
+    def quit(self):
+        if self.connection is not None and not self.connection.closed:
+            try:
+                self.connection.send('Browser.close')
+            except WebDriverException:
+                pass
+            self.connection.close()
+        self._event_executor.shutdown(wait=False)
+        try:
+            self.process.wait(5)
+        except subprocess.TimeoutExpired:
+            self.process.kill()
+            self.process.wait()
+        shutil.rmtree(self.user_data_dir, ignore_errors=True)
+
+    # DevTools and network
+
+    def execute_cdp_cmd(self, cmd, cmd_args=None):
+        """Send a DevTools command to the current page, same as Chrome's WebDriver.execute_cdp_cmd."""
+        return self._send(self._current_target(), cmd, cmd_args)
+
+    def block_urls(self, url_patterns):
+        """Refuse requests matching any of the (wildcard) patterns, in every window."""
+        self._blocked_url_patterns = list(url_patterns)
+        for target in self._ready_targets():
+            self.connection.send_many(self._blocking_commands(), target.session_id)
+
+    def intercept_requests(self, handler, url_pattern='*', resource_type=None):
+        """Pause requests matching url_pattern (and resource_type, e.g. 'Image') and let handler decide.
+
+        handler gets the Fetch.requestPaused event params and returns None to let the request
+        through, a network error reason (e.g. 'BlockedByClient') to fail it, or the params of
+        Fetch.fulfillRequest (responseCode, responseHeaders, body) to answer it. Handlers run
+        on a worker thread and must not use the driver.
+        """
+        self._request_handlers.append((url_pattern, resource_type, handler))
+        for target in self._ready_targets():
+            self.connection.send(*self._interception_command(), target.session_id)
+
+    # Internals
+
+    def _wait_for_devtools_url(self):
+        """Chrome writes the port it picked to DevToolsActivePort once it's listening."""
+        port_file = os.path.join(self.user_data_dir, 'DevToolsActivePort')
+        deadline = timeit.default_timer() + CDP_LAUNCH_TIMEOUT
+        while timeit.default_timer() < deadline:
+            if self.process.poll() is not None:
+                raise WebDriverException("Chrome exited with code {} on startup.".format(self.process.returncode))
+            try:
+                with open(port_file) as file:
+                    lines = file.read().splitlines()
+            except OSError:
+                lines = []
+            if len(lines) >= 2:
+                return 'ws://127.0.0.1:{}{}'.format(lines[0], lines[1])
+            time.sleep(0.05)
+        raise WebDriverException("Chrome did not start listening in {} seconds.".format(CDP_LAUNCH_TIMEOUT))
+
+    def _attach_to_pages(self):
+        """Attach to every page there is and will be. New ones wait until they're configured."""
+        self.connection.send('Target.setAutoAttach', {'autoAttach': True, 'waitForDebuggerOnStart': True, 'flatten': True})
+        if not self._targets:
+            for info in self.connection.send('Target.getTargets')['targetInfos']:
+                if info['type'] == 'page':
+                    self.connection.send('Target.attachToTarget', {'targetId': info['targetId'], 'flatten': True})
+        self._switch_to_window(self.window_handles[0])
+
+    def _on_event(self, method, params, session_id):
+        # Runs on the reader thread. Bookkeeping happens here, anything that sends commands is handed off.
+        if method == 'Target.attachedToTarget':
+            info = params['targetInfo']
+            with self._condition:
+                known = info['targetId'] in self._targets
+                if info['type'] == 'page' and not known:
+                    target = CDPTarget(info['targetId'], params['sessionId'], next(self._order))
+                    self._targets[target.target_id] = self._sessions[target.session_id] = target
+                    self._condition.notify_all()
+                    self._event_executor.submit(self._set_up_target, target, params['waitingForDebugger'])
+                    return
+            self._event_executor.submit(self._let_go_of_target, params['sessionId'], params['waitingForDebugger'])
+        elif method == 'Target.detachedFromTarget':
+            with self._condition:
+                if (target := self._sessions.pop(params['sessionId'], None)) is not None:
+                    self._targets.pop(target.target_id, None)
+                    target.ready.set()
+                    self._condition.notify_all()
+        elif method == 'Page.lifecycleEvent':
+            if (target := self._sessions.get(session_id)) is not None:
+                target.record_lifecycle_event(params['loaderId'], params['name'])
+        elif method == 'Fetch.requestPaused':
+            self._event_executor.submit(self._handle_paused_request, session_id, params)
+
+    def _set_up_target(self, target, waiting_for_debugger):
+        commands = [('Page.enable', {}), ('Page.setLifecycleEventsEnabled', {'enabled': True})]
+        commands += self._blocking_commands()
+        if self._request_handlers:
+            commands.append(self._interception_command())
+        if waiting_for_debugger:
+            commands.append(('Runtime.runIfWaitingForDebugger', {}))
+        try:
+            self.connection.send_many(commands, target.session_id)
+        except WebDriverException:
+            module_logger.warning("Failed to set up a browser window, it may have closed already.")
+        finally:
+            target.ready.set()
+
+    def _let_go_of_target(self, session_id, waiting_for_debugger):
+        """Workers, duplicate attachments and the like aren't driven, let them run on their own."""
+        try:
+            if waiting_for_debugger:
+                self.connection.send('Runtime.runIfWaitingForDebugger', session_id=session_id)
+            self.connection.send('Target.detachFromTarget', {'sessionId': session_id})
+        except WebDriverException:
+            pass
+
+    def _blocking_commands(self):
+        if not self._blocked_url_patterns:
+            return []
+        return [('Network.enable', {}), ('Network.setBlockedURLs', {'urls': self._blocked_url_patterns})]
+
+    def _interception_command(self):
+        patterns = [
+            dict({'urlPattern': url_pattern}, **({'resourceType': resource_type} if resource_type else {}))
+            for url_pattern, resource_type, _ in self._request_handlers
+        ]
+        return 'Fetch.enable', {'patterns': patterns}
+
+    def _handle_paused_request(self, session_id, params):
+        decision = None
+        for url_pattern, resource_type, handler in list(self._request_handlers):
+            if resource_type not in (None, params.get('resourceType')):
+                continue
+            if not fnmatch.fnmatchcase(params['request']['url'], url_pattern):
+                continue
+            try:
+                decision = handler(params)
+            except Exception:
+                module_logger.exception("Request handler failed, letting the request through.")
+                decision = None
+            if decision is not None:
+                break
+
+        if decision is None:
+            command = 'Fetch.continueRequest', {'requestId': params['requestId']}
+        elif isinstance(decision, str):
+            command = 'Fetch.failRequest', {'requestId': params['requestId'], 'errorReason': decision}
+        else:
+            command = 'Fetch.fulfillRequest', dict(decision, requestId=params['requestId'])
+        try:
+            self.connection.send(*command, session_id)
+        except WebDriverException:
+            pass # The page went away meanwhile
+
+    def _ready_targets(self):
+        with self._condition:
+            targets = list(self._targets.values())
+        for target in targets:
+            target.ready.wait(CDP_COMMAND_TIMEOUT)
+        return targets
+
+    def _current_target(self):
+        with self._condition:
+            if self._current is None or self._current.target_id not in self._targets:
+                raise NoSuchWindowException("no such window: target window already closed")
+            return self._current
+
+    def _switch_to_window(self, handle):
+        with self._condition:
+            if (target := self._targets.get(handle)) is None:
+                raise NoSuchWindowException("no such window: {}".format(handle))
+        target.ready.wait(CDP_COMMAND_TIMEOUT)
+        self.connection.send('Target.activateTarget', {'targetId': handle})
+        self._current = target
+
+    def _send(self, target, method, params=None):
+        return self.connection.send(method, params, target.session_id)
+
+    def _find_element(self, element, by, value):
+        if not (elements := self._find_elements(element, by, value)):
+            raise NoSuchElementException("no such element: Unable to locate element: {}".format(
+                json.dumps({'method': by, 'selector': value})
+            ))
+        return elements[0]
+
+    def _find_elements(self, element, by, value):
+        context = 'this' if element is not None else 'document'
+        script = FIND_ALL_FUNCTION + "return findAll({}, arguments[0], arguments[1]);".format(context)
+        if element is None:
+            return self._call(self._current_target(), script, (by, value))
+        return self._call(element.target, script, (by, value), this=element)
+
+    def _call(self, target, script, args, this=None):
+        """Run script as a function body with args, like WebDriver's execute_script."""
+        elements = [arg for arg in args if isinstance(arg, CDPElement)]
+        try:
+            if this is None and not elements:
+                result = self._send(target, 'Runtime.evaluate', self._evaluate_params(script, args))
+            else:
+                result = self._send(target, 'Runtime.callFunctionOn', {
+                    'functionDeclaration': self._function_declaration(script),
+                    'objectId': (this or elements[0]).object_id,
+                    'arguments': [
+                        {'objectId': arg.object_id} if isinstance(arg, CDPElement) else {'value': arg}
+                        for arg in args
+                    ],
+                    'userGesture': True,
+                })
+            return self._decode(target, result)
+        except CDPError as error:
+            raise self._translate(error, stale=this is not None or bool(elements))
+        except JavascriptException as error:
+            if STALE_MARKER in str(error):
+                raise StaleElementReferenceException("stale element reference: element is not attached to the page document")
+            raise
+
+    def _evaluate_params(self, script, args):
+        try:
+            encoded_args = json.dumps(list(args))
+        except TypeError as error:
+            raise InvalidArgumentException("Script arguments must be JSON or elements: {}".format(error))
+        return {
+            'expression': "({}).apply(window, {})".format(self._function_declaration(script), encoded_args),
+            'userGesture': True,
+        }
+
+    def _function_declaration(self, script):
+        return "function () {{ return ({})((function () {{\n{}\n}}).apply(this, arguments)); }}".format(
+            ENCODE_RESULT_FUNCTION, script
+        )
+
+    def _decode(self, target, result):
+        if 'exceptionDetails' in result:
+            details = result['exceptionDetails']
+            raise JavascriptException("javascript error: {}".format(
+                details.get('exception', {}).get('description') or details.get('text')
+            ))
+        remote_object = result['result']
+        if remote_object['type'] == 'string':
+            return json.loads(remote_object['value'])
+        if remote_object.get('objectId') is None:
+            return None
+
+        # The result holds elements: {json, elements}.
+        holder = self._get_properties(target, remote_object['objectId'])
+        elements = {
+            int(name): CDPElement(self, target, element['objectId'])
+            for name, element in self._get_properties(target, holder['elements']['objectId']).items()
+            if name.isdigit()
+        }
+        return json.loads(
+            holder['json']['value'],
+            object_hook=lambda value: elements[value['__cdp_element__']] if '__cdp_element__' in value else value
+        )
+
+    def _get_properties(self, target, object_id):
+        properties = self._send(target, 'Runtime.getProperties', {'objectId': object_id, 'ownProperties': True})
+        return {prop['name']: prop['value'] for prop in properties['result'] if 'value' in prop}
+
+    def _translate(self, error, stale):
+        if any(message in str(error) for message in GONE_CONTEXT_ERRORS):
+            if stale:
+                return StaleElementReferenceException("stale element reference: {}".format(error))
+            return JavascriptException("javascript error: {}".format(error))
+        return error
+
+class CDPElement:
+    """An element of a page driven by CDPDriver, with the WebElement methods the page objects use."""
+    __slots__ = ('driver', 'target', 'object_id')
+
+    def __init__(self, driver, target, object_id):
+        self.driver = driver
+        self.target = target
+        self.object_id = object_id
+
+    def __eq__(self, other):
+        return isinstance(other, CDPElement) and self._call("return this === arguments[0];", other)
+
+    def __hash__(self):
+        return hash(self.object_id)
+
+    @property
+    def text(self):
+        return self._call("return this.innerText.trim();")
+
+    @property
+    def tag_name(self):
+        return self._call("return this.tagName.toLowerCase();")
+
+    def get_attribute(self, name):
+        return self._call(READ_ATTRIBUTE_SCRIPT, name)
+
+    def is_displayed(self):
+        return self._call(IS_DISPLAYED_SCRIPT)
+
+    def is_enabled(self):
+        return self._call("return !this.disabled;")
+
+    def find_element(self, by, value):
+        return self.driver._find_element(self, by, value)
+
+    def find_elements(self, by, value):
+        return self.driver._find_elements(self, by, value)
+
+    def click(self):
+        point = self._call(CLICK_POINT_SCRIPT)
+        if point.get('error') == 'intercepted':
+            raise ElementClickInterceptedException(
+                "element click intercepted: Other element would receive the click: {}".format(point['by'])
+            )
+        if point.get('error'):
+            raise ElementNotInteractableException("element not interactable")
+        mouse_event = dict(point, button='left', clickCount=1)
+        self.driver.connection.send_many([
+            ('Input.dispatchMouseEvent', dict(mouse_event, type='mousePressed')),
+            ('Input.dispatchMouseEvent', dict(mouse_event, type='mouseReleased')),
+        ], self.target.session_id)
+
+    def clear(self):
+        self._call(CLEAR_SCRIPT)
+
+    def send_keys(self, *value):
+        """Type text into the element. Of the special keys, only Enter is supported."""
+        self._call(FOCUS_SCRIPT)
+        text = ''.join(value).replace(Keys.RETURN, Keys.ENTER)
+        commands = []
+        for index, chunk in enumerate(text.split(Keys.ENTER)):
+            if index:
+                key = {'key': 'Enter', 'code': 'Enter', 'windowsVirtualKeyCode': 13}
+                commands += [
+                    ('Input.dispatchKeyEvent', dict(key, type='keyDown', text='\r')),
+                    ('Input.dispatchKeyEvent', dict(key, type='keyUp')),
+                ]
+            if any('\ue000' <= char <= '\uf8ff' for char in chunk): # Keys are private use characters
+                raise InvalidArgumentException("Only Keys.ENTER is supported by the CDP backend.")
+            if chunk:
+                commands.append(('Input.insertText', {'text': chunk}))
+        self.driver.connection.send_many(commands, self.target.session_id)
+
+    def _call(self, script, *args):
+        script = "if (!this.isConnected) throw new Error('{}');\n{}".format(STALE_MARKER, script)
+        return self.driver._call(self.target, script, args, this=self)
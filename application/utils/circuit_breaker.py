@@ -0,0 +1,192 @@
+import logging
+import threading
+import timeit
+from contextlib import contextmanager
+from datetime import timedelta
+
+import humanize
+from decouple import config
+from requests import RequestException, HTTPError
+from selenium.common.exceptions import TimeoutException
+
+from application.exceptions import UpstreamUnavailableError, WorkerJobTimeoutError
+
+# A host's circuit opens after this many outages in a row, i.e. failed jobs that
+# couldn't reach it or timed out, with no successful job in between.
+CIRCUIT_FAILURE_THRESHOLD = config('CIRCUIT_FAILURE_THRESHOLD', cast=int, default=3)
+# While open, jobs needing the host are turned down for this many seconds. Then the
+# circuit is half-open and lets this many trial jobs through at once to see if it's back.
+CIRCUIT_OPEN_SECONDS = config('CIRCUIT_OPEN_SECONDS', cast=int, default=60)
+CIRCUIT_HALF_OPEN_TRIALS = config('CIRCUIT_HALF_OPEN_TRIALS', cast=int, default=1)
+
+# Upstream hosts, how users know them, and what their URLs look like in error messages.
+UPSTREAMS = {
+    "sso": ("myITS SSO", "my.its.ac.id"),
+    "presensi": ("Presensi", "presensi.its.ac.id"),
+    "classroom": ("Classroom", "classroom.its.ac.id"),
+    "drive": ("Google Drive", "googleapis.com"),
+}
+
+CLOSED, OPEN, HALF_OPEN = "closed", "open", "half-open"
+
+module_logger = logging.getLogger(__name__)
+module_logger.setLevel(logging.INFO)
+
+def is_outage(error):
+    """Whether error means the host didn't answer (in time), rather than that the job went wrong.
+
+    Errors coming back from worker processes may have lost their response on the way,
+    so HTTP errors are told apart by message.
+    """
+    if isinstance(error, HTTPError):
+        return "Server Error" in str(error)
+    return isinstance(error, (RequestException, TimeoutException, WorkerJobTimeoutError))
+
+def upstream_of(error, upstreams):
+    """Which of upstreams error is about, going by the host in its message. The last one if there's none."""
+    message = str(error)
+    for upstream in upstreams:
+        if UPSTREAMS[upstream][1] in message:
+            return upstream
+    return upstreams[-1]
+
+class CircuitBreaker:
+    """
+    Turns jobs down right away while a host is out, instead of letting each of them
+    run into its timeouts.
+
+    Closed: jobs go through and consecutive outages are counted. Open: jobs are turned
+    down until open_seconds have passed. Half-open: up to half_open_trials jobs go through,
+    and the first of them to succeed closes the circuit again, or to fail reopens it.
+    """
+    def __init__(self, name, failure_threshold=CIRCUIT_FAILURE_THRESHOLD, open_seconds=CIRCUIT_OPEN_SECONDS,
+                 half_open_trials=CIRCUIT_HALF_OPEN_TRIALS):
+        self.name = name
+        self.failure_threshold = max(1, failure_threshold)
+        self.open_seconds = open_seconds
+        self.half_open_trials = max(1, half_open_trials)
+
+        self._state = CLOSED
+        self._failures = 0
+        self._opened_at = None
+        self._trials = 0 # Trial jobs in flight while half-open
+        self._times_opened = 0
+        self._lock = threading.Lock()
+
+    @property
+    def state(self):
+        with self._lock:
+            return self._current_state()
+
+    def check(self):
+        """Raise UpstreamUnavailableError if a job needing this host would be turned down now."""
+        with self._lock:
+            self._check()
+
+    def admit(self):
+        """Let a job through. Returns whether it's a trial, to be passed back to record()."""
+        with self._lock:
+            self._check()
+            if self._state == HALF_OPEN:
+                self._trials += 1
+                return True
+            return False
+
+    def record(self, outcome, trial):
+        """Outcome of an admitted job: True if it succeeded, False if the host was out, None if it tells nothing."""
+        with self._lock:
+            if trial:
+                self._trials -= 1
+            if outcome is None:
+                return
+            if (state := self._current_state()) == OPEN or (state == HALF_OPEN and not trial):
+                return # Started before the circuit opened, it's old news.
+
+            if outcome:
+                if state == HALF_OPEN:
+                    module_logger.info("{} is back, closing its circuit.".format(self.name))
+                self._state, self._failures = CLOSED, 0
+            elif state == HALF_OPEN or (failures := self._failures + 1) >= self.failure_threshold:
+                module_logger.warning("{} is out, turning jobs down for {} seconds.".format(self.name, self.open_seconds))
+                self._state, self._failures, self._opened_at = OPEN, 0, timeit.default_timer()
+                self._times_opened += 1
+            else:
+                self._failures = failures
+
+    def stats(self):
+        with self._lock:
+            state = self._current_state()
+            return {
+                "state": state,
+                "consecutive_failures": self._failures,
+                "retry_in": self._retry_in() if state == OPEN else 0,
+                "trials_in_flight": self._trials,
+                "times_opened": self._times_opened,
+            }
+
+    def _current_state(self):
+        if self._state == OPEN and self._retry_in() <= 0:
+            self._state = HALF_OPEN
+        return self._state
+
+    def _retry_in(self):
+        return self._opened_at + self.open_seconds - timeit.default_timer()
+
+    def _check(self):
+        state = self._current_state()
+        if state == CLOSED or (state == HALF_OPEN and self._trials < self.half_open_trials):
+            return
+        retry_in = max(1, self._retry_in()) if state == OPEN else self.open_seconds
+        raise UpstreamUnavailableError(
+            "{} is not responding at the moment. Please try again in {}.".format(
+                UPSTREAMS[self.name][0], humanize.naturaldelta(timedelta(seconds=retry_in))
+            )
+        )
+
+class CircuitBreakers:
+    """One CircuitBreaker per upstream host, see UPSTREAMS."""
+    def __init__(self, upstreams=UPSTREAMS, **kwargs):
+        self.breakers = {upstream: CircuitBreaker(upstream, **kwargs) for upstream in upstreams}
+
+    def __getitem__(self, upstream):
+        return self.breakers[upstream]
+
+    def check(self, *upstreams):
+        for upstream in upstreams:
+            self.breakers[upstream].check()
+
+    @contextmanager
+    def guard(self, *upstreams, is_outage=is_outage):
+        """Run the block as a job needing all of upstreams, e.g. `with circuit_breakers.guard("sso", "presensi"):`.
+
+        Raises UpstreamUnavailableError up front if any of them is out. Otherwise the block's
+        outcome is recorded: success for all of them, or an outage of the one its error is
+        about. Other errors, e.g. a full worker pool, say nothing about the hosts.
+        """
+        admitted = []
+        try:
+            for upstream in upstreams:
+                admitted.append((upstream, self.breakers[upstream].admit()))
+        except UpstreamUnavailableError:
+            for upstream, trial in admitted:
+                self.breakers[upstream].record(None, trial)
+            raise
+
+        try:
+            yield
+        except Exception as error:
+            failed = upstream_of(error, upstreams) if is_outage(error) else None
+            for upstream, trial in admitted:
+                self.breakers[upstream].record(False if upstream == failed else None, trial)
+            raise
+        except BaseException:
+            for upstream, trial in admitted:
+                self.breakers[upstream].record(None, trial)
+            raise
+        for upstream, trial in admitted:
+            self.breakers[upstream].record(True, trial)
+
+    def stats(self):
+        return {upstream: breaker.stats() for upstream, breaker in self.breakers.items()}
+
+circuit_breakers = CircuitBreakers()
@@ -0,0 +1,3 @@
+from .session import PortalSession, HTTP_FAST_PATH
+from .attendance import do_attendance_over_http
+from .zoom import find_zoom_link_over_http, harvest_zoom_links_over_http, unique_course_links
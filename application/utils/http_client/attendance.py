@@ -0,0 +1,111 @@
+import json
+
+from application.exceptions import PageStructureError
+from application.utils.timetable import select_timetable_entry
+from application.utils.log_handler import DeferredLogger
+
+from .common import get_dashboard_course_links, find_course_link
+from .session import visible_text
+
+def do_attendance_over_http(broker, pending_attendances, logger, dashboard_link):
+    """Browserless version of the LoginPage -> DashboardPage -> TimetablePage chain.
+
+    pending_attendances is a list of (course_name, attendance_code). Each one is removed
+    from it once handled, and all of them are if the login fails. Takes the user's
+    SessionBroker and returns the user state dict (session cookies, course links). Raises
+    PageStructureError if any page doesn't look like what TimetablePage expects. The caller
+    should then fall back to the browser for whatever is still pending; messages about
+    that course are not logged.
+    """
+    state = broker.state
+    # Held back until a course is done, so nothing shows if the first course falls back.
+    course_logger = DeferredLogger()
+    with broker.http_session("presensi", course_logger) as session:
+        if session is None:
+            course_logger.flush_to(logger)
+            pending_attendances.clear()
+            return state
+
+        course_links = None  # Dashboard is read at most once for the whole batch
+        for course_name, attendance_code in list(pending_attendances):
+            course_logger.info("{}:".format(course_name.upper()))
+            response, timetable = None, None
+            if (timetable_link := state["course_links"].get(course_name)):
+                response, timetable = session.get_soup_if_landed(timetable_link)
+            if timetable is None:
+                state["course_links"].pop(course_name, None)
+                if course_links is None:
+                    course_links = get_dashboard_course_links(session, dashboard_link, 'h5 > a')
+                if (timetable_link := find_course_link(course_links, course_name, course_logger)):
+                    state["course_links"][course_name] = timetable_link
+                    response, timetable = session.get_soup(timetable_link)
+
+            if timetable is not None:
+                attend_timetable(session, response, timetable, attendance_code, course_logger)
+
+            course_logger.flush_to(logger)
+            pending_attendances.remove((course_name, attendance_code))
+            state["session_cookies"] = session.get_session_cookies()
+    return state
+
+def attend_timetable(session, response, timetable, attendance_code, logger):
+    course_entries = get_timetable_entries(timetable)
+    if (selected_index := select_timetable_entry(course_entries, logger)) is None:
+        return
+
+    form, values = get_attendance_form(timetable, course_entries[selected_index][0], attendance_code)
+
+    # Past this point the code has been submitted. Never raise PageStructureError
+    # after it, or the browser fallback would submit it a second time.
+    response, result = session.submit_form(response.url, form, values)
+    logger.info(get_notification_text(response, result))
+
+def get_timetable_entries(timetable):
+    """Same rows, dates and statuses TimetablePage.find_desired_timetable_entry reads."""
+    if (table := timetable.find('table')) is None:
+        raise PageStructureError("Timetable page has no table.")
+
+    course_entries = []
+    for entry in [tbody for tbody in table.find_all('tbody') if tbody.get('class')]:
+        date = entry.select_one('tr > td:nth-of-type(2) > p:nth-of-type(1)')
+        status = entry.find(lambda tag: tag.name == 'td' and tag.get('class') == ['jenis-hadir-mahasiswa'])
+        if date is None or status is None:
+            raise PageStructureError("Timetable row is missing its date or status.")
+        course_entries.append((entry, visible_text(date), visible_text(status)))
+    return course_entries
+
+def get_attendance_form(timetable, entry, attendance_code):
+    """Find the form behind the entry's "isi presensi" modal and fill in the code."""
+    button = entry.find(attrs={'data-target': lambda target: target and '#modal-hadir' in target})
+    if button is None:
+        raise PageStructureError("Timetable entry has no attendance button.")
+
+    modal = timetable.find(id=button['data-target'].lstrip('#'))
+    form = modal.find('form') if modal is not None else None
+    code_field = form.find('input', id='kode_akses_mhs') if form is not None else None
+    if code_field is None:
+        raise PageStructureError("Attendance modal has no attendance code form.")
+
+    values = {code_field.get('name', 'kode_akses_mhs'): attendance_code}
+    if form.find('input', attrs={'name': '_token'}) is None:
+        if (csrf_meta := timetable.find('meta', attrs={'name': 'csrf-token'})) is None:
+            raise PageStructureError("Attendance form has no CSRF token.")
+        values['_token'] = csrf_meta.get('content', '')
+
+    submit_button = form.find(id='submit-hadir-mahasiswa')
+    if submit_button is not None and submit_button.get('name'):
+        values[submit_button['name']] = submit_button.get('value', '')
+    return form, values
+
+def get_notification_text(response, result):
+    if 'json' in response.headers.get('Content-Type', ''):
+        try:
+            return str(json.loads(response.text).get('message', response.text))
+        except (ValueError, AttributeError):
+            return response.text
+
+    if (notification := result.find('div', attrs={'role': 'alert'})) is not None:
+        lines = [line.strip() for line in notification.get_text('\n').splitlines() if line.strip()]
+        if lines:
+            return lines[-1]
+    return "Attendance code has been submitted, but the portal's response could not be read."
@@ -0,0 +1,27 @@
+from urllib.parse import urljoin
+
+from application.exceptions import PageStructureError
+
+from .session import visible_text
+
+def get_course_link(session, dashboard_link, course_links_selector, course_name, logger):
+    """Counterpart of DashboardPage.get_course_link. Presensi and Classroom only differ in the selector."""
+    course_links = get_dashboard_course_links(session, dashboard_link, course_links_selector)
+    return find_course_link(course_links, course_name, logger)
+
+def get_dashboard_course_links(session, dashboard_link, course_links_selector):
+    """Every (text, url) course link on the dashboard, to look several courses up with one visit."""
+    response, dashboard = session.get_soup(dashboard_link)
+    a_tags = dashboard.select(course_links_selector)
+    if not a_tags:
+        raise PageStructureError("Dashboard has no course links.")
+    return [(visible_text(entry), urljoin(response.url, entry.get('href', ''))) for entry in a_tags]
+
+def find_course_link(course_links, course_name, logger):
+    for text, course_link in course_links:
+        if course_name in text:
+            logger.info("Course {} is found.".format(course_name))
+            logger.debug(course_link)
+            return course_link
+    logger.info("Course {} is not found.".format(course_name))
+    return None
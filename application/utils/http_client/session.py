@@ -0,0 +1,174 @@
+from urllib.parse import urljoin
+
+import requests
+from bs4 import BeautifulSoup, Comment
+from decouple import config
+
+from application.exceptions import PageStructureError
+
+HTTP_FAST_PATH = config('HTTP_FAST_PATH', cast=bool, default=True)
+HTTP_TIMEOUT = config('HTTP_TIMEOUT', cast=float, default=10)
+
+# Pretend to be the same browser the Selenium path uses, some portals refuse unknown clients.
+USER_AGENT = "Mozilla/5.0 (X11; Linux x86_64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/90.0.4430.93 Safari/537.36"
+
+# OIDC hops between the portal and the SSO are auto-submitting forms. Don't follow them forever.
+MAX_AUTO_SUBMIT_HOPS = 5
+
+# Text a browser would not render, so WebElement.text never contains it.
+HIDDEN_TAGS = {'script', 'style', 'noscript', 'template'}
+HIDDEN_CLASSES = {'accesshide', 'sr-only', 'visually-hidden', 'hidden'}
+
+def visible_text(element):
+    """Whitespace-normalized text, close to what WebElement.text gives."""
+    def is_hidden(tag):
+        return tag.name in HIDDEN_TAGS or bool(HIDDEN_CLASSES.intersection(tag.get('class') or []))
+
+    def is_rendered(string):
+        if isinstance(string, Comment):
+            return False
+        tag = string.parent
+        while tag is not None:
+            if is_hidden(tag):
+                return False
+            if tag is element:
+                return True
+            tag = tag.parent
+        return True
+
+    return ' '.join(' '.join(filter(is_rendered, element.find_all(string=True))).split())
+
+class PortalSession(requests.Session):
+    """
+    HTTP counterpart of a logged-in browser: a requests session that knows how to go
+    through the my.its.ac.id SSO login and read portal pages as BeautifulSoup trees.
+
+    Cookies are exchanged in the same shape the browser path uses (CDP cookie dicts),
+    so a saved session can be picked up by either path.
+    """
+    def __init__(self, session_cookies=None):
+        super().__init__()
+        self.headers['User-Agent'] = USER_AGENT
+        self.session_restored = bool(session_cookies)
+        if session_cookies:
+            self.load_session_cookies(session_cookies)
+
+    def allow_concurrent_requests(self, count):
+        """Keep up to count connections per host open, for when that many requests run side by side.
+
+        Past requests' default pool size, connections finishing last are thrown away
+        and the next requests have to connect all over again.
+        """
+        adapter = requests.adapters.HTTPAdapter(pool_maxsize=max(count, requests.adapters.DEFAULT_POOLSIZE))
+        self.mount('https://', adapter)
+        self.mount('http://', adapter)
+
+    def request(self, *args, **kwargs):
+        kwargs.setdefault('timeout', HTTP_TIMEOUT)
+        return super().request(*args, **kwargs)
+
+    def get_soup(self, url, **kwargs):
+        response = self.get(url, **kwargs)
+        response.raise_for_status()
+        return response, BeautifulSoup(response.text, 'html.parser')
+
+    def get_soup_if_landed(self, url):
+        """Like get_soup, but None if the page is gone (404) or redirects somewhere else."""
+        response = self.get(url)
+        if response.status_code == 404 or response.history:
+            return None, None
+        response.raise_for_status()
+        return response, BeautifulSoup(response.text, 'html.parser')
+
+    def login(self, login_link, username, password, text_in_title_to_confirm_login_success="Dashboard", landed=None):
+        """Log in through the SSO. Returns (login_successful, soup of the page landed on).
+
+        landed is the (response, soup) of login_link if it has been fetched already.
+        Raises PageStructureError if the pages don't look the way the browser path expects.
+        """
+        # With a live SSO session, the portal logs in through redirects and auto-submitting forms alone.
+        response, soup = self.follow_auto_submit_forms(*(landed or self.get_soup(login_link)))
+        if self._title_contains(soup, text_in_title_to_confirm_login_success):
+            return True, soup
+        if self.session_restored:
+            # Saved session is rejected, start over from a clean slate.
+            self.cookies.clear()
+            self.session_restored = False
+            response, soup = self.get_soup(login_link)
+
+        # The SSO asks for the username first and the password on the next step.
+        # Both fields sitting in one form works the same way.
+        for _ in range(2):
+            form = self._find_form_with_input(soup, 'username') or self._find_form_with_input(soup, 'password')
+            if form is None:
+                break
+            values = {}
+            for field_id, value in (('username', username), ('password', password)):
+                if (field := form.find('input', id=field_id)) is not None:
+                    values[field.get('name', field_id)] = value
+
+            response, soup = self.submit_form(response.url, form, values)
+            response, soup = self.follow_auto_submit_forms(response, soup)
+            if self._title_contains(soup, text_in_title_to_confirm_login_success):
+                return True, soup
+            if form.find('input', id='password') is not None:
+                break
+
+        if soup.find('input', id='password') is not None:
+            return False, soup # Back at the password form: rejected credentials.
+        raise PageStructureError("Login landed on an unexpected page: {}".format(response.url))
+
+    def load_session_cookies(self, session_cookies):
+        for cookie in session_cookies:
+            self.cookies.set(
+                cookie['name'], cookie['value'],
+                domain=cookie.get('domain', ''), path=cookie.get('path', '/'),
+                secure=cookie.get('secure', False),
+                expires=None if cookie.get('session') or cookie.get('expires', -1) < 0 else int(cookie['expires']),
+                rest={'HttpOnly': None} if cookie.get('httpOnly') else {}
+            )
+
+    def get_session_cookies(self):
+        return [{
+            'name': cookie.name,
+            'value': cookie.value,
+            'domain': cookie.domain,
+            'path': cookie.path,
+            'secure': bool(cookie.secure),
+            'httpOnly': cookie.has_nonstandard_attr('HttpOnly'),
+            'expires': cookie.expires if cookie.expires is not None else -1,
+            'session': cookie.expires is None,
+        } for cookie in self.cookies]
+
+    def submit_form(self, page_url, form, values):
+        data = {
+            field['name']: field.get('value', '')
+            for field in form.find_all('input')
+            if field.get('name') and field.get('type', 'text') != 'submit'
+        }
+        data.update(values)
+        action = urljoin(page_url, form.get('action') or page_url)
+        if form.get('method', 'get').lower() == 'post':
+            response = self.post(action, data=data)
+        else:
+            response = self.get(action, params=data)
+        response.raise_for_status()
+        return response, BeautifulSoup(response.text, 'html.parser')
+
+    def follow_auto_submit_forms(self, response, soup):
+        """OIDC responses are often a page with one hidden-only form submitted by javascript."""
+        for _ in range(MAX_AUTO_SUBMIT_HOPS):
+            forms = soup.find_all('form')
+            if len(forms) != 1 or forms[0].find('input', type=lambda t: t not in ('hidden', 'submit')) is not None:
+                break
+            response, soup = self.submit_form(response.url, forms[0], {})
+        return response, soup
+
+    @staticmethod
+    def _find_form_with_input(soup, input_id):
+        field = soup.find('input', id=input_id)
+        return field.find_parent('form') if field is not None else None
+
+    @staticmethod
+    def _title_contains(soup, text):
+        return soup.title is not None and text in soup.title.get_text()
@@ -0,0 +1,171 @@
+import functools
+from contextlib import closing
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import urljoin, urlparse
+
+import furl
+from decouple import config
+
+from application.exceptions import PageStructureError
+from application.utils.log_handler import DeferredLogger
+
+from .common import get_course_link, get_dashboard_course_links
+from .session import visible_text
+
+# loadmeeting.php may bounce through a few Classroom URLs before handing out the Zoom one.
+MAX_JOIN_REDIRECTS = 5
+
+# How many zoom sessions are fetched side by side while looking for the one with a link.
+ZOOM_PROBE_WORKERS = config('ZOOM_PROBE_WORKERS', cast=int, default=4)
+# How many courses are searched side by side when harvesting every course's link.
+# Each of them probes its sessions with ZOOM_PROBE_WORKERS on top of that.
+ZOOM_HARVEST_WORKERS = config('ZOOM_HARVEST_WORKERS', cast=int, default=3)
+
+def find_zoom_link_over_http(broker, course_name, logger, dashboard_link, shared=None):
+    """Browserless version of the LoginPage -> ClassroomDashboardPage -> CourseHomePage chain.
+
+    Takes the user's SessionBroker and returns the user state dict (session cookies, course
+    links). Raises PageStructureError if any page doesn't look like what CourseHomePage
+    expects, in which case the caller should fall back to the browser.
+
+    shared(course link, mod/zoom link, find) may stand in for find(), which resolves a
+    meeting session's link, e.g. to reuse what someone else in the class has found.
+    """
+    state = broker.state
+    with broker.http_session("classroom", logger) as session:
+        if session is None:
+            return state
+
+        response, course_page = None, None
+        if (course_page_link := state["course_links"].get(course_name)):
+            response, course_page = session.get_soup_if_landed(course_page_link)
+        if course_page is None:
+            state["course_links"].pop(course_name, None)
+            if not (course_page_link := get_course_link(session, dashboard_link, 'a.coursename', course_name, logger)):
+                return state
+            state["course_links"][course_name] = course_page_link
+            response, course_page = session.get_soup(course_page_link)
+
+        state["zoom_link"] = find_zoom_link(session, response, course_page, logger, shared)
+    return state
+
+def harvest_zoom_links_over_http(broker, logger, dashboard_link, shared=None):
+    """Log in once and find the latest zoom link of every course on the Classroom dashboard.
+
+    Sets state["zoom_links"] to a list of (course title, course link, zoom link or None)
+    in dashboard order. Raises PageStructureError and takes shared like find_zoom_link_over_http.
+    """
+    state = broker.state
+    with broker.http_session("classroom", logger) as session:
+        if session is None:
+            return state
+
+        course_links = unique_course_links(get_dashboard_course_links(session, dashboard_link, 'a.coursename'))
+        session.allow_concurrent_requests(ZOOM_HARVEST_WORKERS * ZOOM_PROBE_WORKERS)
+
+        def harvest(course_link):
+            response, course_page = session.get_soup(course_link)
+            # Per-session reports of every course would drown the table, keep them out.
+            return find_zoom_link(session, response, course_page, DeferredLogger(), shared)
+
+        with ThreadPoolExecutor(max_workers=ZOOM_HARVEST_WORKERS) as executor:
+            zoom_links = list(executor.map(harvest, [course_link for _, course_link in course_links]))
+
+        state["zoom_links"] = [
+            (title, course_link, zoom_link) for (title, course_link), zoom_link in zip(course_links, zoom_links)
+        ]
+    return state
+
+def unique_course_links(course_links):
+    """The dashboard may list a course in more than one block. Keep the first of each."""
+    seen = set()
+    return [(title, link) for title, link in course_links if not (link in seen or seen.add(link))]
+
+def find_zoom_link(session, response, course_page, logger, shared=None):
+    """Counterpart of CourseHomePage.do_find_zoom_link, reporting the same way."""
+    traversal_report_per_line = []
+    zoom_link = None
+
+    def probe(element):
+        find = functools.partial(get_zoom_link_from_mod_zoom_page, session, element[0])
+        return find() if shared is None else shared(response.url, element[0], find)
+
+    if (potential_mod_zoom_links := get_potential_mod_zoom_links(response, course_page, logger)):
+        traversal_report_per_line.append("COURSE SESSIONS CHECKED:")
+        probes = probe_in_order(potential_mod_zoom_links, probe)
+        with closing(probes):
+            for (_, link_text), zoom_link in probes:
+                if zoom_link:
+                    traversal_report_per_line.append(link_text.partition('\n')[0] + ": " + "LINK FOUND")
+                    break
+                traversal_report_per_line.append(link_text.partition('\n')[0] + ": " + "no link.")
+
+    traversal_report = '\n'.join(traversal_report_per_line)
+    logger.info(traversal_report)
+    if zoom_link:
+        logger.info(zoom_link)
+    return zoom_link
+
+def probe_in_order(candidates, probe, max_workers=ZOOM_PROBE_WORKERS):
+    """Run probe(candidate) for all candidates concurrently, but yield (candidate, result)
+    in the original order. Closing the generator cancels the probes not started yet.
+    """
+    executor = ThreadPoolExecutor(max_workers=max_workers)
+    futures = [executor.submit(probe, candidate) for candidate in candidates]
+    try:
+        for candidate, future in zip(candidates, futures):
+            yield candidate, future.result()
+    finally:
+        for future in futures:
+            future.cancel()
+        executor.shutdown(wait=False)
+
+def get_potential_mod_zoom_links(response, course_page, logger):
+    potential_mod_zoom_links = [
+        (urljoin(response.url, a_tag['href']), text)
+        for a_tag in course_page.find_all('a', href=True)
+        if "Zoom meeting" in (text := visible_text(a_tag))
+    ][::-1] # Reverse, most recent is first
+    logger.info(
+        "{} meetings found as potential candidate for actual Zoom link.".format(
+            len(potential_mod_zoom_links)
+        )
+    )
+    return potential_mod_zoom_links
+
+def get_zoom_link_from_mod_zoom_page(session, mod_zoom_link):
+    """Resolve where "Join Meeting" leads without clicking it. None if the session has no button."""
+    response, mod_zoom_page = session.get_soup(mod_zoom_link)
+    join_button = mod_zoom_page.find(lambda tag: tag.name in ('button', 'a', 'input')
+                                     and "Join Meeting" in (tag.get('value') or tag.get_text()))
+    if join_button is None:
+        return None
+
+    if join_button.name == 'a' and join_button.get('href'):
+        join_url = urljoin(response.url, join_button['href'])
+    elif (form := join_button.find_parent('form')) is not None:
+        action = urljoin(response.url, form.get('action') or response.url)
+        fields = {field['name']: field.get('value', '') for field in form.find_all('input') if field.get('name')}
+        if (form.get('method') or 'get').lower() == 'post':
+            join_response = session.post(action, data=fields, allow_redirects=False)
+            if not join_response.is_redirect:
+                raise PageStructureError("Join Meeting did not redirect to Zoom.")
+            join_url = urljoin(action, join_response.headers['Location'])
+        else:
+            join_url = furl.furl(action).add(fields).url
+    else:
+        raise PageStructureError("Join Meeting button has neither a link nor a form.")
+
+    return furl.furl(resolve_redirects(session, join_url, response.url)).remove('uname').url
+
+def resolve_redirects(session, url, origin_url):
+    """Follow redirects by hand until the URL leaves the portal, without loading the target."""
+    origin_host = urlparse(origin_url).netloc
+    for _ in range(MAX_JOIN_REDIRECTS):
+        if urlparse(url).netloc != origin_host:
+            return url
+        response = session.get(url, allow_redirects=False)
+        if not response.is_redirect:
+            raise PageStructureError("Join Meeting did not redirect to Zoom.")
+        url = urljoin(url, response.headers['Location'])
+    raise PageStructureError("Join Meeting redirected too many times.")
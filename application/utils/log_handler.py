@@ -9,4 +9,27 @@ class ListHandler(logging.Handler):
         self.setLevel(logging.INFO)
         self.message_list = message_list
     def emit(self, record):
-        self.message_list.append(record.getMessage())
\ No newline at end of file
+        self.message_list.append(record.getMessage())
+
+class DeferredLogger:
+    """Logger stand-in that holds on to messages until told where they should go.
+
+    Used by attempts that may be thrown away, e.g. the browserless fast path: its
+    messages are only shown to the user if it actually succeeded.
+    """
+    def __init__(self):
+        self.records = []
+    def log(self, level, msg, *args):
+        self.records.append((level, msg, args))
+    def debug(self, msg, *args):
+        self.log(logging.DEBUG, msg, *args)
+    def info(self, msg, *args):
+        self.log(logging.INFO, msg, *args)
+    def warning(self, msg, *args):
+        self.log(logging.WARNING, msg, *args)
+    def error(self, msg, *args):
+        self.log(logging.ERROR, msg, *args)
+    def flush_to(self, logger):
+        for level, msg, args in self.records:
+            logger.log(level, msg, *args)
+        self.records = []
@@ -1,7 +1,7 @@
-from datetime import datetime, timedelta
-from babel.dates import format_date
-
 from selenium.webdriver.common.by import By
+from selenium.common.exceptions import NoSuchElementException
+
+from application.utils.timetable import select_timetable_entry
 
 from .common import BasePage
 
@@ -25,57 +25,30 @@ class TimetablePage(BasePage):
             return
         self.bring_up_widget(entry)
         self.fill_form_value(self.KODE_PRESENSI_FORM, attendance_code)
+        timetable_document = self.document_id()
         self.click_button(self.SIMPAN_BUTTON)
         
-        self.wait_until_presence_of_element_located(self.NOTIFICATION_DIV)
-        notification_alert_text = self.driver.find_element(*self.NOTIFICATION_DIV).text.rsplit('\n', 2)[-1]
+        # The notification comes with presensi's answer, however long that takes.
+        self.wait_until_presence_of_element_located(self.NOTIFICATION_DIV, "attendance_notification", after_leaving=timetable_document)
+        if not (notifications := self.snapshot(self.NOTIFICATION_DIV, {"text": (None, "text")})):
+            raise NoSuchElementException("Unable to locate element: {}".format(self.NOTIFICATION_DIV[1]))
+        notification_alert_text = notifications[0]['text'].rsplit('\n', 2)[-1]
         self.logger.info(notification_alert_text)
         
     def find_desired_timetable_entry(self):
-        if not self.wait_until_presence_of_element_located(self.TIMETABLE_TABLE):
+        if not self.wait_until_presence_of_element_located(self.TIMETABLE_TABLE, "timetable"):
             return None
-        table = self.driver.find_element(*self.TIMETABLE_TABLE)
-        
-        course_entries = [(
-            entry,
-            entry.find_element(*self.TIMETABLE_ROW_CHILD_ELEMENT_DATE).text,
-            entry.find_element(*self.TIMETABLE_ROW_CHILD_ELEMENT_STATUS).text
-        ) for entry in table.find_elements(*self.TIMETABLE_CHILD_ELEMENT_ROW)]
-
-        if (selected_entry := self.find_today_timetable_entry(course_entries)):
-            if selected_entry.find_element(*self.TIMETABLE_ROW_CHILD_ELEMENT_STATUS).text.upper() == "ALPA":
-                self.logger.info("Today's entry is ALPA, performing attendance on today's entry.")
-            elif selected_entry.find_element(*self.TIMETABLE_ROW_CHILD_ELEMENT_STATUS).text.upper() == "HADIR":
-                self.logger.info("Today's entry is already attended (HADIR).")
-            else:
-                self.logger.info("Today's entry is not actionable. It's neither HADIR nor ALPA.")
-        elif (selected_entry := self.find_most_recent_unattended_timetable_entry(course_entries)):
-            self.logger.info("Can't find entry with today's date, selecting latest ALPA entry.")
-        else:
-            self.logger.info("There is no entry marked as ALPA.")
-        
-        traversal_report_per_line = []
-        for entry, date, status in course_entries:
-            marker = '[X]' if entry == selected_entry else ''
-            traversal_report_per_line.append(' '.join([marker, status, date, marker]).strip())
-        
-        traversal_report = '\n'.join(traversal_report_per_line)
-        self.logger.info(traversal_report)
-        return selected_entry
+        rows = self.snapshot(self.TIMETABLE_CHILD_ELEMENT_ROW, {
+            "date": (self.TIMETABLE_ROW_CHILD_ELEMENT_DATE, "text"),
+            "status": (self.TIMETABLE_ROW_CHILD_ELEMENT_STATUS, "text"),
+        }, root_locator=self.TIMETABLE_TABLE)
+        course_entries = [(row['element'], row['date'], row['status']) for row in rows]
 
-    def find_today_timetable_entry(self, course_entries):
-        today_date = format_date(datetime.now() + timedelta(hours = 7), 'EEEE, d MMMM y', locale = 'id') # Note to self: configure time-zone compensation, don't hardcode
-        for entry, date, _ in course_entries[::-1]:
-            if date == today_date:
-                return entry
-        return None
-
-    def find_most_recent_unattended_timetable_entry(self, course_entries):
-        for entry, _, status in course_entries[::-1]:
-            if status == 'ALPA':
-                return entry
-        return None
+        if (selected_index := select_timetable_entry(course_entries, self.logger)) is None:
+            return None
+        return course_entries[selected_index][0]
 
     def bring_up_widget(self, entry):
+        timetable_document = self.document_id()
         entry.find_element(*self.ISI_PRESENSI_HADIR_BUTTON).click()
-        self.wait_until_element_clickable(self.KODE_PRESENSI_FORM)
+        self.wait_until_element_clickable(self.KODE_PRESENSI_FORM, "attendance_form", after_leaving=timetable_document)
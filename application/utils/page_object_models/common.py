@@ -21,21 +21,85 @@
 # https://www.maestralsolutions.com/using-custom-web-element-models-in-selenium-testing-framework/
 # Alternative solution: wrap run_attendance to catch NoSuchElementException, see below.
 
+import uuid
 import logging
-import time
 
 from selenium.webdriver.common.by import By
-from selenium.common.exceptions import TimeoutException
-from selenium.webdriver.support.ui import WebDriverWait
+from selenium.common.exceptions import NoSuchElementException
 from selenium.webdriver.support import expected_conditions as EC
 
 from selenium.webdriver.remote.remote_connection import LOGGER as selenium_logger
 from urllib3.connectionpool import log as urllib3_logger
 
+from application.utils.webdriver import get_all_cookies, restore_cookies, clear_cookies
+
+from .waits import wait_for_first, settled_without, reloaded_with, document_id
+
 # Suppress selenium debug logs by elevating them to INFO level
 selenium_logger.setLevel(logging.INFO)
 urllib3_logger.setLevel(logging.INFO)
 
+# Reads a list of elements and some of their descendants' text/attributes in one go,
+# instead of one chromedriver round trip per .text or .get_attribute() call.
+# Locators are the same (By, value) tuples the page objects use.
+SNAPSHOT_SCRIPT = r"""
+var rootLocator = arguments[0], rowLocator = arguments[1], fields = arguments[2];
+
+function findAll(context, by, value) {
+    switch (by) {
+        case 'xpath':
+            var result = document.evaluate(value, context, null, XPathResult.ORDERED_NODE_SNAPSHOT_TYPE, null);
+            var nodes = [];
+            for (var i = 0; i < result.snapshotLength; i++) nodes.push(result.snapshotItem(i));
+            return nodes;
+        case 'id':
+            return Array.prototype.slice.call(context.querySelectorAll('[id="' + value.replace(/"/g, '\\"') + '"]'));
+        case 'name':
+            return Array.prototype.slice.call(context.querySelectorAll('[name="' + value.replace(/"/g, '\\"') + '"]'));
+        case 'tag name':
+            return Array.prototype.slice.call(context.getElementsByTagName(value));
+        case 'class name':
+            return Array.prototype.slice.call(context.getElementsByClassName(value));
+        case 'link text':
+        case 'partial link text':
+            return Array.prototype.filter.call(context.querySelectorAll('a'), function (a) {
+                var text = a.innerText.trim();
+                return by === 'link text' ? text === value : text.indexOf(value) !== -1;
+            });
+        default:
+            return Array.prototype.slice.call(context.querySelectorAll(value));
+    }
+}
+
+function read(element, attribute) {
+    if (attribute === 'element') return element;
+    if (attribute === 'text') return element.innerText.trim();
+    var property = element[attribute];
+    if (property !== undefined && property !== null && typeof property !== 'object' && typeof property !== 'function') {
+        return String(property);
+    }
+    return element.getAttribute(attribute);
+}
+
+var root = rootLocator ? findAll(document, rootLocator[0], rootLocator[1])[0] : document;
+if (!root) return null;
+
+return findAll(root, rowLocator[0], rowLocator[1]).map(function (row) {
+    var record = {element: row, missing: []};
+    Object.keys(fields).forEach(function (name) {
+        var locator = fields[name][0], attribute = fields[name][1];
+        var target = locator ? findAll(row, locator[0], locator[1])[0] : row;
+        if (target) {
+            record[name] = read(target, attribute);
+        } else {
+            record[name] = null;
+            record.missing.push(name);
+        }
+    });
+    return record;
+});
+"""
+
 class BasePage(object):
     """
     Base class which all Page objects can inherit from.
@@ -43,15 +107,22 @@ class BasePage(object):
 
     def __init__(self, driver_instance, logger_instance, url):
         self.driver = driver_instance
-        self.wait = WebDriverWait(self.driver, 5) # Note to self: enable configurable wait for use in local vs Heroku
         self.logger = logger_instance
+        self.url = url
         
-        self.driver.get(url)
+        if url is not None: # None means the page is already loaded, e.g. in another tab
+            self.driver.get(url)
         self.prepare_selectors()
     
     def prepare_selectors(self):
         pass
     
+    def landed_on_requested_page(self):
+        """False if the visit was redirected elsewhere or ended up on a not-found page."""
+        redirected = self.driver.current_url.rstrip('/') != self.url.rstrip('/')
+        not_found = any(marker in self.driver.title for marker in ("404", "Not Found", "Not found"))
+        return not (redirected or not_found)
+
     def fill_form_value(self, form_locator, text):
         form_field = self.driver.find_element(*form_locator)
         form_field.clear()
@@ -60,29 +131,121 @@ class BasePage(object):
     def click_button(self, button_locator):
         self.driver.find_element(*button_locator).click()
         
-    def wait_until_presence_of_element_located(self, element_locator):
-        try: self.wait.until(EC.presence_of_element_located(element_locator))
-        except TimeoutException: return False
-        return True
+    def wait_for_first(self, outcomes, label):
+        """Wait until any of the (name, condition) outcomes holds. Returns its name, None on timeout.
+
+        Timeouts are configured per label, see waits.py.
+        """
+        return wait_for_first(self.driver, outcomes, label)
+
+    def document_id(self):
+        """Id of the document loaded now. Take it before a click and pass it as after_leaving to the wait after it."""
+        return document_id(self.driver)
+
+    def wait_until_presence_of_element_located(self, element_locator, label=None, after_leaving=None):
+        """Wait for the element. Gives up early once the page has loaded without it, see settled_without."""
+        return self.wait_for_first([
+            ("found", EC.presence_of_element_located(element_locator)),
+            ("missing", settled_without(element_locator, after_leaving=after_leaving)),
+        ], label or element_locator[1]) == "found"
     
-    def wait_until_title_contains(self, text):
-        try: self.wait.until(EC.title_contains(text))
-        except TimeoutException: return False
-        return True
+    def wait_until_title_contains(self, text, label="title"):
+        return self.wait_for_first([("found", EC.title_contains(text))], label) == "found"
     
-    def wait_until_element_clickable(self, element_locator):
-        try: self.wait.until(EC.element_to_be_clickable(element_locator))
-        except TimeoutException: return False
-        return True
+    def wait_until_element_clickable(self, element_locator, label=None, after_leaving=None):
+        return self.wait_for_first([
+            ("found", EC.element_to_be_clickable(element_locator)),
+            ("missing", settled_without(element_locator, after_leaving=after_leaving)),
+        ], label or element_locator[1]) == "found"
     
-    def sleep(self, seconds=0.3):
-        """Short time sleeping for waiting super-fast but not instantaneous operations."""
-        time.sleep(seconds)
+    def snapshot(self, row_locator, fields, root_locator=None):
+        """Extract every element matching row_locator into a plain dict, in one round trip.
+
+        fields maps a key to (locator, attribute). The locator is searched within the row
+        (None means the row itself); attribute is 'text' for the visible text, 'element'
+        for the WebElement itself, or any attribute/property name. Each dict also holds
+        the row's WebElement under 'element'.
+
+        Raises NoSuchElementException if root_locator or a field's locator finds nothing,
+        same as the find_element calls this replaces.
+        """
+        rows = self.driver.execute_script(SNAPSHOT_SCRIPT, root_locator, row_locator, fields)
+        if rows is None:
+            raise NoSuchElementException("Unable to locate element: {}".format(root_locator))
+        for row in rows:
+            if (missing := row.pop('missing')):
+                raise NoSuchElementException("Unable to locate element: {}".format(fields[missing[0]][0]))
+        return rows
+
+    def visit_in_tabs(self, urls, page_class, batch_size, logger=None):
+        """Yield a page_class page object for each url in order, loading up to batch_size at once.
+
+        Each batch is opened in background tabs so the page loads overlap, then handed out in
+        order. The tabs are closed when the batch is done or the caller stops iterating, and
+        the current tab gets focus back. Falls back to loading one url at a time in the
+        current tab if tabs can't be opened.
+        """
+        logger = logger or self.logger
+        main_handle = self.driver.current_window_handle
+        for batch_start in range(0, len(urls), batch_size):
+            batch = urls[batch_start:batch_start + batch_size]
+            handles = self.open_in_tabs(batch)
+            try:
+                for url, handle in zip(batch, handles):
+                    if handle is None:
+                        self.driver.switch_to.window(main_handle)
+                        yield page_class(self.driver, logger, url)
+                    else:
+                        self.driver.switch_to.window(handle)
+                        page = page_class(self.driver, logger, None)
+                        page.url = url
+                        page.wait_until_page_loaded()
+                        yield page
+            finally:
+                self.close_tabs([handle for handle in handles if handle is not None], main_handle)
+
+    def open_in_tabs(self, urls):
+        """Open each url in its own tab. Returns their window handles, None where it didn't work."""
+        known_handles = set(self.driver.window_handles)
+        # Window names must not clash with tabs opened by an outer visit_in_tabs, or
+        # window.open would navigate those instead of opening new ones.
+        prefix = 'tab-{}-'.format(uuid.uuid4().hex)
+        self.driver.execute_script(
+            "var prefix = arguments[1]; arguments[0].forEach(function (url, i) { window.open(url, prefix + i); });",
+            urls, prefix
+        )
+        handles_by_name = {}
+        for handle in self.driver.window_handles:
+            if handle not in known_handles:
+                self.driver.switch_to.window(handle)
+                handles_by_name[self.driver.execute_script("return window.name;")] = handle
+        return [handles_by_name.get(prefix + str(index)) for index in range(len(urls))]
+
+    def close_tabs(self, handles, main_handle):
+        current_handles = set(self.driver.window_handles)
+        for handle in handles:
+            if handle in current_handles:
+                self.driver.switch_to.window(handle)
+                self.driver.close()
+        self.driver.switch_to.window(main_handle)
+
+    def wait_until_page_loaded(self):
+        return self.wait_for_first([
+            ("loaded", lambda driver: driver.execute_script("return document.readyState;") == "complete"),
+        ], "page_load") == "loaded"
 
 class LoginPage(BasePage):
     """
     Methods to operate in login page, i.e. my.its.ac.id/blahblah
+
+    If session cookies from an earlier login are given, they are loaded into the browser
+    before visiting the page. When they are still valid, the portal skips the login form
+    and do_login returns right away; otherwise it falls back to a full login.
     """
+    def __init__(self, driver_instance, logger_instance, url, session_cookies=None):
+        self.session_restored = bool(session_cookies) and restore_cookies(driver_instance, session_cookies)
+        super().__init__(driver_instance, logger_instance, url)
+
     def prepare_selectors(self):
         self.USERNAME_FORM = By.ID, 'username'
         self.NEXT_BUTTON   = By.ID, 'continue'
@@ -90,18 +253,49 @@ class LoginPage(BasePage):
         self.SIGNIN_BUTTON = By.ID, 'login'
     
     def do_login(self, username, password, text_to_wait_in_title_to_confirm_login_success = "Dashboard"):
+        if self.session_restored:
+            # A live SSO session logs the portal in through a few redirects, give them time to land.
+            if self.wait_for_first([
+                ("success", EC.title_contains(text_to_wait_in_title_to_confirm_login_success)),
+                ("login_form", EC.visibility_of_element_located(self.USERNAME_FORM)),
+            ], "login_restored") == "success":
+                self.logger.info("Login successful (reused saved session).")
+                return True
+            # Saved session is rejected, start over from a clean slate.
+            clear_cookies(self.driver)
+            self.driver.get(self.url)
+            self.session_restored = False
+
+        # Each step waits for whichever comes first: the next step, or the SSO turning it down.
+        # The SSO does that by answering with its form again, which PortalSession.login goes
+        # by too, so a rejected login fails as soon as that page is in, not after the timeout.
         self.fill_form_value(self.USERNAME_FORM, username)
+        login_document = self.document_id()
         self.click_button(self.NEXT_BUTTON)
-        self.fill_form_value(self.PASSWORD_FORM, password)
-        self.click_button(self.SIGNIN_BUTTON)
+        login_successful = self.wait_for_first([
+            ("next", EC.element_to_be_clickable(self.PASSWORD_FORM)),
+            ("rejected", reloaded_with(self.USERNAME_FORM, login_document, unless=self.PASSWORD_FORM)),
+        ], "login_username") == "next"
+
+        if login_successful:
+            self.fill_form_value(self.PASSWORD_FORM, password)
+            login_document = self.document_id()
+            self.click_button(self.SIGNIN_BUTTON)
+            login_successful = self.wait_for_first([
+                ("success", EC.title_contains(text_to_wait_in_title_to_confirm_login_success)),
+                ("rejected", reloaded_with(self.PASSWORD_FORM, login_document)),
+            ], "login") == "success"
 
-        if (login_successful:= self.wait_until_title_contains(text_to_wait_in_title_to_confirm_login_success)):
+        if login_successful:
             self.logger.info("Login successful.")
         else:
             self.logger.info("Login failed.")
         
         return login_successful
 
+    def get_session_cookies(self):
+        return get_all_cookies(self.driver)
+
 class DashboardPage(BasePage):
     """
     Methods to operate in dashboard page, i.e. right after login.
@@ -109,19 +303,29 @@ class DashboardPage(BasePage):
     Fortunately, presensi.its.ac.id and classroom.its.ac.id dashboards
     have almost exactly similar structure, so have this class in common.
     """
+    def __init__(self, driver_instance, logger_instance, url):
+        self.course_links = None
+        super().__init__(driver_instance, logger_instance, url)
+
     def prepare_selectors(self):
         self.COURSE_LINKS = By.CSS_SELECTOR, "h5>a"
     
     def get_course_link(self, course_name):
         a_tags = self.get_potential_course_links()
         for entry in a_tags:
-            if course_name in entry.text:
+            if course_name in entry['text']:
                 self.logger.info("Course {} is found.".format(course_name))
-                self.logger.debug((course_link := entry.get_attribute('href')))
+                self.logger.debug((course_link := entry['href']))
                 return course_link
         self.logger.info("Course {} is not found.".format(course_name))
         return None
     
     def get_potential_course_links(self):
-        self.wait_until_presence_of_element_located(self.COURSE_LINKS)
-        return self.driver.find_elements(*self.COURSE_LINKS)
+        """Course links are read once, so several courses can be looked up after navigating away."""
+        if self.course_links is None:
+            self.wait_until_presence_of_element_located(self.COURSE_LINKS, "course_links")
+            self.course_links = [
+                {"text": entry["text"], "href": entry["href"]}
+                for entry in self.snapshot(self.COURSE_LINKS, {"text": (None, "text"), "href": (None, "href")})
+            ]
+        return self.course_links
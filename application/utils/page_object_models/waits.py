@@ -0,0 +1,154 @@
+import bisect
+import threading
+import timeit
+
+from decouple import config, Csv
+from selenium.common.exceptions import (
+    TimeoutException, NoSuchElementException, StaleElementReferenceException, JavascriptException
+)
+from selenium.webdriver.support.ui import WebDriverWait
+
+from application.utils.webdriver import LOCAL_ENVIRONMENT
+
+# How long a wait may take, in seconds. Local browsers are not headless and usually slower,
+# so they get more by default. Individual waits are overridden by label, for example
+# WAIT_TIMEOUTS=login:15,timetable:8
+WAIT_TIMEOUT = config('WAIT_TIMEOUT', cast=float, default=10 if LOCAL_ENVIRONMENT else 5)
+WAIT_TIMEOUTS = dict(
+    (label.strip(), float(seconds))
+    for label, _, seconds in (entry.partition(':') for entry in config('WAIT_TIMEOUTS', cast=Csv(), default=''))
+)
+WAIT_POLL_INTERVAL = config('WAIT_POLL_INTERVAL', cast=float, default=0.1)
+
+# Once a page has finished loading, how long to keep hoping for an element that isn't there.
+# Covers content that scripts add right after the load event.
+WAIT_SETTLE_GRACE = config('WAIT_SETTLE_GRACE', cast=float, default=0.5)
+
+# Upper bounds (seconds) of the latency histogram buckets. The last bucket is unbounded.
+LATENCY_BUCKETS = (0.1, 0.25, 0.5, 1, 2, 5, 10, 30)
+
+def timeout_for(label):
+    return WAIT_TIMEOUTS.get(label, WAIT_TIMEOUT)
+
+class WaitStats:
+    """Latency histogram of every wait, per label and per outcome (timeouts count as 'timeout').
+
+    Worker processes send theirs along with every job's reply, so the web process's
+    wait_stats covers the waits of every worker, see WorkerPool.
+    """
+    def __init__(self, buckets=LATENCY_BUCKETS):
+        self.buckets = buckets
+        self._histograms = {}  # (label, outcome) -> [count per bucket]
+        self._lock = threading.Lock()
+
+    def record(self, label, outcome, seconds):
+        with self._lock:
+            histogram = self._histograms.setdefault((label, outcome), [0] * (len(self.buckets) + 1))
+            histogram[bisect.bisect_left(self.buckets, seconds)] += 1
+
+    def take(self):
+        """Raw histograms recorded since the last take(), e.g. to send them out of a worker process."""
+        with self._lock:
+            histograms, self._histograms = self._histograms, {}
+            return histograms
+
+    def merge(self, histograms):
+        """Add histograms taken from another WaitStats with the same buckets."""
+        with self._lock:
+            for key, counts in histograms.items():
+                histogram = self._histograms.setdefault(key, [0] * (len(self.buckets) + 1))
+                for bucket, count in enumerate(counts):
+                    histogram[bucket] += count
+
+    def snapshot(self):
+        bucket_names = ['<={}s'.format(bound) for bound in self.buckets] + ['>{}s'.format(self.buckets[-1])]
+        with self._lock:
+            return {
+                '{}:{}'.format(label, outcome): dict(zip(bucket_names, histogram))
+                for (label, outcome), histogram in self._histograms.items()
+            }
+
+wait_stats = WaitStats()
+
+class FirstOutcome:
+    """Condition for WebDriverWait that checks several outcomes on every poll.
+
+    Returns the name of the first outcome whose condition holds. Outcomes are checked
+    in the given order, so put the one that should win a tie first.
+    """
+    def __init__(self, outcomes):
+        self.outcomes = outcomes
+
+    def __call__(self, driver):
+        for name, condition in self.outcomes:
+            try:
+                if condition(driver):
+                    return name
+            except (NoSuchElementException, StaleElementReferenceException, JavascriptException):
+                # The page is changing under us, try again on the next poll.
+                continue
+        return False
+
+# Marks the document loaded now with an id of its own, and returns it. A new document,
+# i.e. the next page load, starts without one.
+DOCUMENT_ID_SCRIPT = "return window.__waitDocumentId || (window.__waitDocumentId = Math.random().toString(36).slice(2));"
+
+class settled_without:
+    """True once the page has finished loading and `locator` has stayed absent for `grace` seconds.
+
+    Lets a wait for an element give up as soon as it's clear the element isn't coming,
+    instead of running out the timeout. After a click, pass the document_id() taken before
+    it as `after_leaving`: until that document is replaced, e.g. while a submitted form is
+    still waiting for its answer, the element may still be coming and this stays False.
+    """
+    def __init__(self, locator, grace=WAIT_SETTLE_GRACE, after_leaving=None):
+        self.locator = locator
+        self.grace = grace
+        self.after_leaving = after_leaving
+        self.settled_at = None
+
+    def __call__(self, driver):
+        ready_state, document = driver.execute_script("return [document.readyState, window.__waitDocumentId || null];")
+        if (ready_state != "complete" or (self.after_leaving is not None and document == self.after_leaving)
+                or driver.find_elements(*self.locator)):
+            self.settled_at = None
+            return False
+        if self.settled_at is None:
+            self.settled_at = timeit.default_timer()
+        return timeit.default_timer() - self.settled_at >= self.grace
+
+class reloaded_with:
+    """True once the document `after_leaving` (a document_id()) has been replaced by one that has
+    loaded with `locator` in it, and without `unless` if that's given.
+
+    E.g. a form that comes back after it was submitted, which is how the SSO turns a login down.
+    """
+    def __init__(self, locator, after_leaving, unless=None):
+        self.locator = locator
+        self.after_leaving = after_leaving
+        self.unless = unless
+
+    def __call__(self, driver):
+        ready_state, document = driver.execute_script("return [document.readyState, window.__waitDocumentId || null];")
+        if ready_state != "complete" or document == self.after_leaving or not driver.find_elements(*self.locator):
+            return False
+        return self.unless is None or not driver.find_elements(*self.unless)
+
+def document_id(driver):
+    """Id of the document loaded now, see settled_without."""
+    return driver.execute_script(DOCUMENT_ID_SCRIPT)
+
+def wait_for_first(driver, outcomes, label, timeout=None):
+    """Wait until any of the (name, condition) outcomes holds, and return its name.
+
+    Returns None if none did within the timeout for `label`. Every wait is recorded
+    in wait_stats under its label and the outcome it ended with.
+    """
+    timeout = timeout_for(label) if timeout is None else timeout
+    start = timeit.default_timer()
+    try:
+        outcome = WebDriverWait(driver, timeout, poll_frequency=WAIT_POLL_INTERVAL).until(FirstOutcome(outcomes))
+    except TimeoutException:
+        outcome = None
+    wait_stats.record(label, outcome or 'timeout', timeit.default_timer() - start)
+    return outcome
@@ -1,15 +1,41 @@
 import furl
 
 from typing import List, Tuple, NewType
+from contextlib import closing
+from decouple import config
 
+from requests import RequestException
 from selenium.webdriver.common.by import By
 from selenium.common.exceptions import NoSuchElementException
 
+from application.exceptions import PageStructureError
+from application.utils.http_client import PortalSession
+from application.utils.http_client.zoom import resolve_redirects
+from application.utils.webdriver import get_all_cookies
+
 from .common import BasePage, DashboardPage
 
 Link = NewType("Link", str)
 LinkText = NewType("Link", str)
 
+# How many zoom sessions are loaded side by side while looking for the one with a link.
+ZOOM_PROBE_TABS = config('ZOOM_PROBE_TABS', cast=int, default=3)
+
+# Where the "Join Meeting" button would take the browser: its GET form, or a URL in its onclick.
+# Returns null when that can't be known without clicking.
+JOIN_URL_SCRIPT = r"""
+var button = arguments[0];
+var form = button.form || button.closest('form');
+if (form) {
+    if ((form.getAttribute('method') || 'get').toLowerCase() !== 'get') return null;
+    var url = new URL(form.getAttribute('action') || location.href, location.href);
+    new FormData(form).forEach(function (value, name) { url.searchParams.append(name, value); });
+    return url.href;
+}
+var match = (button.getAttribute('onclick') || '').match(/(?:window\.open\s*\(|location(?:\.href)?\s*=)\s*['"]([^'"]+)['"]/);
+return match ? new URL(match[1], location.href).href : null;
+"""
+
 class ClassroomDashboardPage(DashboardPage):
     def prepare_selectors(self):
         self.COURSE_LINKS = By.CSS_SELECTOR, 'a.coursename'
@@ -25,45 +51,90 @@ class ModZoomPage(BasePage):
 
     def get_zoom_link_from_button(self):
         try:
-            self.driver.find_element(*self.JOIN_BUTTON).click()
+            join_button = self.driver.find_element(*self.JOIN_BUTTON)
         except NoSuchElementException:
             return None
-        self.driver.switch_to.window(self.driver.window_handles[-1])
-        return furl.furl(self.driver.current_url).remove('uname').url
+
+        # Work out where the button leads and follow the redirects over HTTP with this
+        # browser's cookies. That way no window is opened and Zoom's page is never loaded.
+        if (join_url := self.driver.execute_script(JOIN_URL_SCRIPT, join_button)):
+            try:
+                with PortalSession(get_all_cookies(self.driver)) as session:
+                    zoom_link = resolve_redirects(session, join_url, self.driver.current_url)
+                return furl.furl(zoom_link).remove('uname').url
+            except (PageStructureError, RequestException):
+                pass
+
+        return self.get_zoom_link_by_clicking(join_button)
+
+    def get_zoom_link_by_clicking(self, join_button):
+        """Last resort: click, read the URL of the window that opens, then close it again."""
+        original_handle = self.driver.current_window_handle
+        # Other tabs may be open, so look for the window the click adds rather than the last one.
+        known_handles = set(self.driver.window_handles)
+        join_button.click()
+        new_handles = [handle for handle in self.driver.window_handles if handle not in known_handles]
+        if not new_handles:
+            return furl.furl(self.driver.current_url).remove('uname').url
+
+        self.driver.switch_to.window(new_handles[0])
+        try:
+            self.wait_for_first([("navigated", lambda driver: driver.current_url != 'about:blank')], "zoom_join_window")
+            return furl.furl(self.driver.current_url).remove('uname').url
+        finally:
+            for handle in new_handles:
+                self.driver.switch_to.window(handle)
+                self.driver.close()
+            self.driver.switch_to.window(original_handle)
 
 
 class CourseHomePage(BasePage):
     """
     Methods to operate in classroom.its.ac.id/course/view.php?id course-specific.
     """
+    PROBE_TABS = ZOOM_PROBE_TABS
+
     def prepare_selectors(self):
         self.MOD_ZOOM_HYPERLINK_ELEMENT = By.PARTIAL_LINK_TEXT, "Zoom meeting"
 
     def do_find_zoom_link(self):
         traversal_report_per_line = []
+        zoom_link = None
 
         if (potential_mod_zoom_links := self.get_potential_mod_zoom_links()):
             traversal_report_per_line.append("COURSE SESSIONS CHECKED:")
-            for element in potential_mod_zoom_links:
-                mod_zoom_page = ModZoomPage(self.driver, self.logger, element[0])
-                if (zoom_link := mod_zoom_page.get_zoom_link_from_button()):
+            with closing(self.probe_mod_zoom_pages(potential_mod_zoom_links)) as probes:
+                for element, mod_zoom_page in probes:
+                    if (zoom_link := mod_zoom_page.get_zoom_link_from_button()):
+                        traversal_report_per_line.append(
+                            element[1].partition('\n')[0] + ": " + "LINK FOUND"
+                        )
+                        break
+                    
                     traversal_report_per_line.append(
-                        element[1].partition('\n')[0] + ": " + "LINK FOUND"
+                        element[1].partition('\n')[0] + ": " + "no link."
                     )
-                    break
-                
-                traversal_report_per_line.append(
-                    element[1].partition('\n')[0] + ": " + "no link."
-                )
         
         traversal_report = '\n'.join(traversal_report_per_line)
         self.logger.info(traversal_report)
         if zoom_link:
             self.logger.info(zoom_link)
+        return zoom_link
+
+    def probe_mod_zoom_pages(self, potential_mod_zoom_links):
+        """Yield (element, ModZoomPage) in the given order, loading up to PROBE_TABS sessions at once.
+
+        Once the caller stops iterating (a link is found), the tabs still loading are closed.
+        """
+        mod_zoom_pages = self.visit_in_tabs(
+            [element[0] for element in potential_mod_zoom_links], ModZoomPage, self.PROBE_TABS
+        )
+        with closing(mod_zoom_pages):
+            yield from zip(potential_mod_zoom_links, mod_zoom_pages)
 
     def get_potential_mod_zoom_links(self) -> List[Tuple[Link, LinkText]]:
-        potential_elements = self.driver.find_elements(*self.MOD_ZOOM_HYPERLINK_ELEMENT)
-        potential_mod_zoom_links = [(elem.get_attribute('href'), elem.text)
+        potential_elements = self.snapshot(self.MOD_ZOOM_HYPERLINK_ELEMENT, {"href": (None, "href"), "text": (None, "text")})
+        potential_mod_zoom_links = [(elem['href'], elem['text'])
                                          for elem in potential_elements][::-1] # Reverse, most recent is first
         self.logger.info(
             "{} meetings found as potential candidate for actual Zoom link.".format(
@@ -0,0 +1,99 @@
+import logging
+import itertools
+from concurrent.futures import ThreadPoolExecutor
+
+import requests
+from decouple import config, Csv
+from selenium import webdriver
+from selenium.common.exceptions import WebDriverException
+from urllib3.exceptions import HTTPError
+
+# Selenium standalone servers or grid hubs to start browsers on, e.g.
+# SELENIUM_REMOTE_URLS=http://node-1:4444/wd/hub,http://node-2:4444
+SELENIUM_REMOTE_URLS = config('SELENIUM_REMOTE_URLS', cast=Csv(), default='')
+SELENIUM_REMOTE_BROWSER = config('SELENIUM_REMOTE_BROWSER', cast=str, default='chrome')
+# Seconds a node gets to answer how many free slots it has before it's skipped.
+SELENIUM_REMOTE_STATUS_TIMEOUT = config('SELENIUM_REMOTE_STATUS_TIMEOUT', cast=float, default=2)
+
+module_logger = logging.getLogger(__name__)
+module_logger.setLevel(logging.INFO)
+
+def count_free_slots(status, browser_name):
+    """Free slots for browser_name according to a node's /status reply.
+
+    Selenium 4 lists every node's slots, with the session running in each. Selenium 3
+    standalone servers and hubs only say whether they're ready, which counts as one slot.
+    """
+    value = status.get('value') or {}
+    if (nodes := value.get('nodes')) is None:
+        return 1 if value.get('ready') else 0
+    return sum(
+        1
+        for node in nodes if node.get('availability', 'UP') == 'UP'
+        for slot in node.get('slots', [])
+        if slot.get('session') is None
+        and slot.get('stereotype', {}).get('browserName', browser_name) == browser_name
+    )
+
+class RemoteDriver(webdriver.Remote):
+    """A browser on a Selenium node. Chrome nodes take DevTools commands too, like webdriver.Chrome."""
+    def __init__(self, node_url, options):
+        super().__init__(command_executor=node_url, options=options, keep_alive=True)
+        self.node_url = node_url
+        self.command_executor._commands['executeCdpCommand'] = ('POST', '/session/$sessionId/goog/cdp/execute')
+
+    def execute_cdp_cmd(self, cmd, cmd_args):
+        return self.execute('executeCdpCommand', {'cmd': cmd, 'params': cmd_args})['value']
+
+class SeleniumGrid:
+    """
+    Starts browsers on whichever of the remote Selenium nodes has the most free slots.
+
+    Nodes are asked for their free slots right before every launch, all at once. Nodes
+    that are down, full or too slow to answer are skipped, and if starting a session fails
+    the next node is tried. Nodes with equally many free slots take turns.
+    """
+    def __init__(self, urls=SELENIUM_REMOTE_URLS, browser_name=SELENIUM_REMOTE_BROWSER,
+                 status_timeout=SELENIUM_REMOTE_STATUS_TIMEOUT):
+        self.urls = [url.rstrip('/') for url in urls if url.strip()]
+        self.browser_name = browser_name
+        self.status_timeout = status_timeout
+        self._turns = itertools.count()
+
+    @property
+    def configured(self):
+        return bool(self.urls)
+
+    def free_slots(self):
+        """[(node url, free slots)] of every node, 0 for nodes that didn't answer."""
+        if not self.urls:
+            return []
+        with ThreadPoolExecutor(max_workers=len(self.urls)) as executor:
+            return list(zip(self.urls, executor.map(self._free_slots_of, self.urls)))
+
+    def candidates(self):
+        """Node urls with free slots, most free first."""
+        free_slots = self.free_slots()
+        turn = next(self._turns) % max(1, len(free_slots))
+        rotated = free_slots[turn:] + free_slots[:turn]
+        return [url for url, free in sorted(rotated, key=lambda node: -node[1]) if free > 0]
+
+    def connect(self, options):
+        """Start a browser on the best node. Returns None if no node could take it."""
+        for url in self.candidates():
+            try:
+                return RemoteDriver(url, options)
+            except (WebDriverException, HTTPError, OSError) as error:
+                module_logger.warning("Failed to start a browser on {}: {}".format(url, error))
+        return None
+
+    def _free_slots_of(self, url):
+        try:
+            response = requests.get(url + '/status', timeout=self.status_timeout)
+            response.raise_for_status()
+            return count_free_slots(response.json(), self.browser_name)
+        except (requests.RequestException, ValueError) as error:
+            module_logger.info("Selenium node {} is unavailable: {}".format(url, error))
+            return 0
+
+selenium_grid = SeleniumGrid()
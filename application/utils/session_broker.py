@@ -0,0 +1,169 @@
+import logging
+from contextlib import contextmanager
+
+from requests import RequestException
+from selenium.common.exceptions import WebDriverException
+
+from application.exceptions import PageStructureError, DriverPoolExhaustedError
+from application.utils.http_client import PortalSession
+from application.utils.page_object_models import LoginPage
+from application.utils.webdriver import driver_pool
+
+# Portals users log in to through the ITS SSO (my.its.ac.id), and where their login starts.
+PORTAL_LOGIN_LINKS = {
+    "presensi": 'https://presensi.its.ac.id',
+    "classroom": 'https://classroom.its.ac.id/auth/oidc',
+}
+
+module_logger = logging.getLogger(__name__)
+module_logger.setLevel(logging.INFO)
+
+class SessionBroker:
+    """
+    Hands out logged-in sessions to the portals behind the ITS SSO, for one user.
+
+    The SSO's own session cookie is kept in the user state next to the portals' cookies.
+    While it's valid, logging in to any portal is just a round of redirects, so the user's
+    password goes to the SSO once, whichever portal asks first. After a password login
+    over HTTP, the other portals are logged in to as well, so the next job finds its
+    portal session ready.
+
+    Sessions come either as a PortalSession (http_session) or as cookies loaded into
+    a browser (browser_session). state["session_cookies"] is kept up to date in place.
+    Given a LoginHeadStart, the first login to its portal picks up where it left off.
+    """
+    def __init__(self, username, password, state, head_start=None):
+        self.username = username
+        self.password = password
+        self.state = state
+        self.head_start = head_start
+
+    @contextmanager
+    def http_session(self, portal, logger):
+        """Yield a PortalSession logged in to portal, or None if the credentials are rejected.
+
+        Raises PageStructureError if the login pages aren't what PortalSession.login expects.
+        """
+        session, landed = None, None
+        if self.head_start is not None:
+            session, landed = self.head_start.take_session(portal, self.state["session_cookies"])
+        if session is None:
+            session = PortalSession(self.state["session_cookies"])
+        with session:
+            login_successful, _ = session.login(
+                PORTAL_LOGIN_LINKS[portal], self.username, self.password, landed=landed
+            )
+            if not login_successful:
+                logger.info("Login failed.")
+                self.state["session_cookies"] = None
+                yield None
+                return
+            logger.info("Login successful (reused saved session)." if session.session_restored else "Login successful.")
+            password_login = not session.session_restored
+            self.state["session_cookies"] = session.get_session_cookies()
+
+            yield session
+
+            if password_login:
+                self.log_in_to_other_portals(session, portal)
+            self.state["session_cookies"] = session.get_session_cookies()
+
+    def browser_session(self, driver, portal, logger):
+        """Log the browser in to portal. Returns False if the credentials are rejected."""
+        login_link = PORTAL_LOGIN_LINKS[portal]
+        # Saved cookies go in before the login page is visited, so a page loaded without them is no use.
+        on_login_page = (
+            self.head_start is not None and self.head_start.take_login_page(driver, portal)
+            and not self.state["session_cookies"]
+        )
+        login_page = LoginPage(driver, logger, None if on_login_page else login_link, self.state["session_cookies"])
+        login_page.url = login_link
+        if not login_page.do_login(self.username, self.password):
+            self.state["session_cookies"] = None
+            return False
+        self.state["session_cookies"] = login_page.get_session_cookies()
+        return True
+
+    def log_in_to_other_portals(self, session, logged_in_portal):
+        """Ride the fresh SSO session into every other portal, so their cookies get saved too."""
+        for portal, login_link in PORTAL_LOGIN_LINKS.items():
+            if portal == logged_in_portal:
+                continue
+            try:
+                session.login(login_link, self.username, self.password)
+            except (PageStructureError, RequestException) as error:
+                module_logger.info("Could not log in to {} along the way: {}".format(portal, error))
+
+class LoginHeadStart:
+    """
+    The part of a login that doesn't depend on whose login it is: an HTTP session, or with
+    browser=True a browser, that is already on the portal's login page.
+
+    Meant to be entered while the credentials are still being decrypted, and handed to
+    SessionBroker once they're in. Whatever fails here is left for the login proper to
+    redo, and whatever isn't taken is released on exit.
+    """
+    def __init__(self, portal, browser=False):
+        self.portal = portal
+        self.browser = browser
+        self.session = None
+        self.landed = None # (response, soup) of the login page, fetched without saved cookies
+        self.driver = None
+        self._checkout = None
+        self._driver_on_login_page = False
+
+    def __enter__(self):
+        login_link = PORTAL_LOGIN_LINKS[self.portal]
+        if self.browser:
+            try:
+                self._checkout = driver_pool.checkout()
+                self.driver = self._checkout.__enter__()
+            except DriverPoolExhaustedError:
+                self._checkout = None
+                return self
+            try:
+                self.driver.get(login_link)
+                self._driver_on_login_page = True
+            except WebDriverException as error:
+                module_logger.info("Could not open the login page ahead of time: {}".format(error))
+        else:
+            self.session = PortalSession()
+            try:
+                self.landed = self.session.get_soup(login_link)
+            except RequestException as error:
+                module_logger.info("Could not fetch the login page ahead of time: {}".format(error))
+        return self
+
+    def __exit__(self, *exc_info):
+        if self.session is not None:
+            self.session.close()
+        if self._checkout is not None:
+            return self._checkout.__exit__(*exc_info)
+        return False
+
+    @contextmanager
+    def checkout(self):
+        """The head start's browser if there is one, otherwise one from the pool."""
+        if self.driver is not None:
+            yield self.driver # Returned to the pool on exit
+            return
+        with driver_pool.checkout() as driver:
+            yield driver
+
+    def take_session(self, portal, session_cookies):
+        """(session, landed login page) for SessionBroker.http_session, (None, None) if there's none for portal."""
+        if portal != self.portal or self.session is None:
+            return None, None
+        session, landed, self.session, self.landed = self.session, self.landed, None, None
+        if session_cookies:
+            # The connections are still warm, but the page was fetched as a stranger.
+            session.load_session_cookies(session_cookies)
+            session.session_restored = True
+            landed = None
+        return session, landed
+
+    def take_login_page(self, driver, portal):
+        """True if driver is this head start's browser, still on portal's login page."""
+        on_login_page = driver is self.driver and portal == self.portal and self._driver_on_login_page
+        self._driver_on_login_page = False
+        return on_login_page
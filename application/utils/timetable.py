@@ -0,0 +1,45 @@
+from datetime import datetime, timedelta
+from babel.dates import format_date
+
+# Deciding which timetable entry gets the attendance code. Shared between the
+# browser (TimetablePage) and the browserless (http_client) attendance flows,
+# so both pick the same entry and tell the user the same thing.
+
+def select_timetable_entry(course_entries, logger):
+    """Given a list of (entry, date, status) ordered oldest first, return the index of
+    the entry that should be attended, or None. Also reports the choice to logger.
+    """
+    if (selected_index := find_today_timetable_entry(course_entries)) is not None:
+        status = course_entries[selected_index][2].upper()
+        if status == "ALPA":
+            logger.info("Today's entry is ALPA, performing attendance on today's entry.")
+        elif status == "HADIR":
+            logger.info("Today's entry is already attended (HADIR).")
+        else:
+            logger.info("Today's entry is not actionable. It's neither HADIR nor ALPA.")
+    elif (selected_index := find_most_recent_unattended_timetable_entry(course_entries)) is not None:
+        logger.info("Can't find entry with today's date, selecting latest ALPA entry.")
+    else:
+        logger.info("There is no entry marked as ALPA.")
+
+    traversal_report_per_line = []
+    for index, (_, date, status) in enumerate(course_entries):
+        marker = '[X]' if index == selected_index else ''
+        traversal_report_per_line.append(' '.join([marker, status, date, marker]).strip())
+
+    traversal_report = '\n'.join(traversal_report_per_line)
+    logger.info(traversal_report)
+    return selected_index
+
+def find_today_timetable_entry(course_entries):
+    today_date = format_date(datetime.now() + timedelta(hours = 7), 'EEEE, d MMMM y', locale = 'id') # Note to self: configure time-zone compensation, don't hardcode
+    for index in range(len(course_entries) - 1, -1, -1):
+        if course_entries[index][1] == today_date:
+            return index
+    return None
+
+def find_most_recent_unattended_timetable_entry(course_entries):
+    for index in range(len(course_entries) - 1, -1, -1):
+        if course_entries[index][2] == 'ALPA':
+            return index
+    return None
@@ -1,8 +1,18 @@
+import atexit
 import logging
 import datetime
 import timeit
+import threading
+import collections
+from contextlib import contextmanager
+import urllib3
 from decouple import config
 from selenium import webdriver
+from selenium.common.exceptions import WebDriverException
+
+from application.exceptions import DriverPoolExhaustedError
+from application.utils.cdp_driver import CDPDriver
+from application.utils.selenium_grid import selenium_grid, SELENIUM_REMOTE_BROWSER
 
 LOCAL_ENVIRONMENT = config('LOCAL_ENVIRONMENT', cast=bool, default=False)
 GECKODRIVER_PATH = config('GECKODRIVER_PATH', cast=str, default='')
@@ -10,24 +20,381 @@ CHROMEDRIVER_PATH = config('CHROMEDRIVER_PATH', cast=str, default='')
 GOOGLE_CHROME_BIN_PATH = config("GOOGLE_CHROME_BIN", cast=str, default='')
 # MOZILLA_FIREFOX_BIN_PATH can be specified too if Firefox is not in default installation path (Program Files)
 
+# 'webdriver' drives the browser through chromedriver/geckodriver with Selenium. 'cdp' drives
+# Chrome over the DevTools Protocol directly (see cdp_driver.py), locally too. 'remote' starts
+# browsers on the Selenium nodes in SELENIUM_REMOTE_URLS (see selenium_grid.py).
+DRIVER_BACKEND = config('DRIVER_BACKEND', cast=str, default='webdriver')
+# What 'remote' does when no node has a free slot: start a local browser, or fail the job
+# like an exhausted driver pool does.
+SELENIUM_REMOTE_FALLBACK = config('SELENIUM_REMOTE_FALLBACK', cast=bool, default=True)
+
+# Driver pool settings. Sizes are counted in browsers, ages in seconds.
+DRIVER_POOL_MAX_SIZE = config('DRIVER_POOL_MAX_SIZE', cast=int, default=2)
+DRIVER_POOL_MIN_IDLE = config('DRIVER_POOL_MIN_IDLE', cast=int, default=1)
+DRIVER_POOL_MAX_AGE = config('DRIVER_POOL_MAX_AGE', cast=int, default=1800)
+DRIVER_POOL_MAX_USES = config('DRIVER_POOL_MAX_USES', cast=int, default=25)
+DRIVER_POOL_CHECKOUT_TIMEOUT = config('DRIVER_POOL_CHECKOUT_TIMEOUT', cast=int, default=30)
+
+# The lean profile keeps the browser from fetching what the page objects never look at:
+# images, web fonts, media and analytics. It also returns from get() once the DOM is ready
+# (eager page load) instead of after every subresource has loaded.
+LEAN_BROWSER_PROFILE = config('LEAN_BROWSER_PROFILE', cast=bool, default=True)
+# Stylesheets are opt-in. Bootstrap's modal and collapse visibility comes from CSS, and
+# the attendance modal is waited on with element_to_be_clickable.
+LEAN_BROWSER_BLOCK_STYLESHEETS = config('LEAN_BROWSER_BLOCK_STYLESHEETS', cast=bool, default=False)
+LEAN_BLOCKED_URL_PATTERNS = [
+    '*.png', '*.jpg', '*.jpeg', '*.gif', '*.svg', '*.ico', '*.webp',
+    '*.woff', '*.woff2', '*.ttf', '*.otf', '*.eot',
+    '*.mp4', '*.webm', '*.mp3',
+    '*google-analytics.com*', '*googletagmanager.com*', '*doubleclick.net*', '*hotjar.com*',
+] + (['*.css'] if LEAN_BROWSER_BLOCK_STYLESHEETS else [])
+# The CDP backend also refuses these by resource type, which catches what the URL patterns miss,
+# e.g. images served by a script.
+LEAN_BLOCKED_RESOURCE_TYPES = ['Image', 'Font', 'Media'] + (['Stylesheet'] if LEAN_BROWSER_BLOCK_STYLESHEETS else [])
+LEAN_CHROME_ARGUMENTS = [
+    '--disable-gpu',
+    '--disable-extensions',
+    '--disable-background-networking',
+    '--disable-default-apps',
+    '--disable-sync',
+    '--mute-audio',
+    '--blink-settings=imagesEnabled=false',
+]
+
+# Origins whose storage gets wiped when a browser is handed over to the next user.
+WIPED_ORIGINS = (
+    'https://my.its.ac.id',
+    'https://presensi.its.ac.id',
+    'https://classroom.its.ac.id',
+)
+
+# What a job may run into when its browser or chromedriver dies under it. Its browser is
+# replaced rather than handed to the next job.
+BROWSER_GONE_ERRORS = (WebDriverException, urllib3.exceptions.HTTPError, OSError)
+
 module_logger = logging.getLogger(__name__)
 module_logger.setLevel(logging.INFO)
 
-def build_driver():
+def build_driver(lean=None, backend=None):
+    """Launch a browser. `lean` picks the lean profile and `backend` the driver backend,
+    they default to LEAN_BROWSER_PROFILE and DRIVER_BACKEND.
+    """
+    lean = LEAN_BROWSER_PROFILE if lean is None else lean
+    backend = backend or DRIVER_BACKEND
     start = timeit.default_timer()
-    if LOCAL_ENVIRONMENT:
-        op = webdriver.FirefoxOptions()
-        op.add_argument("--disable-dev-shm-usage")
-        op.add_argument("--no-sandbox")
-        driver = webdriver.Firefox(executable_path=GECKODRIVER_PATH, options=op)
+    if backend == 'remote':
+        driver = build_remote_driver(lean)
+    elif backend == 'cdp':
+        driver = build_cdp_driver(lean)
     else:
-        op = webdriver.ChromeOptions()
-        op.add_argument('--headless')
-        op.add_argument('--incognito')
-        op.add_argument("--disable-dev-shm-usage")
-        op.add_argument("--no-sandbox")
-        op.binary_location = GOOGLE_CHROME_BIN_PATH
-        driver = webdriver.Chrome(executable_path=CHROMEDRIVER_PATH, options=op)
+        driver = build_local_driver(lean)
     end = timeit.default_timer()
     module_logger.info("Webdriver start time:{}".format(datetime.timedelta(seconds = end-start)))
-    return driver
\ No newline at end of file
+    return driver
+
+def build_local_driver(lean):
+    if LOCAL_ENVIRONMENT:
+        return webdriver.Firefox(executable_path=GECKODRIVER_PATH, options=firefox_options(lean))
+    op = chrome_options(lean)
+    op.binary_location = GOOGLE_CHROME_BIN_PATH
+    driver = webdriver.Chrome(executable_path=CHROMEDRIVER_PATH, options=op)
+    if lean:
+        block_urls(driver, LEAN_BLOCKED_URL_PATTERNS)
+    return driver
+
+def build_remote_driver(lean):
+    """Start a browser on the Selenium node with the most free slots, or locally if none has any."""
+    if SELENIUM_REMOTE_BROWSER == 'firefox':
+        op = firefox_options(lean)
+        op.add_argument('-headless')
+    else:
+        op = chrome_options(lean)
+    if (driver := selenium_grid.connect(op)) is None:
+        if not SELENIUM_REMOTE_FALLBACK:
+            raise DriverPoolExhaustedError
+        module_logger.warning("No Selenium node has a free slot, starting a local browser.")
+        return build_local_driver(lean)
+    module_logger.info("Started a browser on {}.".format(driver.node_url))
+    if lean:
+        block_urls(driver, LEAN_BLOCKED_URL_PATTERNS)
+    return driver
+
+def chrome_options(lean):
+    op = webdriver.ChromeOptions()
+    op.add_argument('--headless')
+    op.add_argument('--incognito')
+    op.add_argument("--disable-dev-shm-usage")
+    op.add_argument("--no-sandbox")
+    if lean:
+        apply_lean_chrome_profile(op)
+    return op
+
+def firefox_options(lean):
+    op = webdriver.FirefoxOptions()
+    op.add_argument("--disable-dev-shm-usage")
+    op.add_argument("--no-sandbox")
+    if lean:
+        apply_lean_firefox_profile(op)
+    return op
+
+def build_cdp_driver(lean):
+    arguments = ["--disable-dev-shm-usage", "--no-sandbox"] + (LEAN_CHROME_ARGUMENTS if lean else [])
+    return CDPDriver(
+        binary=GOOGLE_CHROME_BIN_PATH or None,
+        arguments=arguments,
+        headless=not LOCAL_ENVIRONMENT,
+        page_load_strategy='eager' if lean else 'normal',
+        blocked_url_patterns=LEAN_BLOCKED_URL_PATTERNS if lean else (),
+        blocked_resource_types=LEAN_BLOCKED_RESOURCE_TYPES if lean else (),
+    )
+
+def apply_lean_chrome_profile(op):
+    for argument in LEAN_CHROME_ARGUMENTS:
+        op.add_argument(argument)
+    op.add_experimental_option('prefs', {
+        'profile.managed_default_content_settings.images': 2,
+        'profile.managed_default_content_settings.stylesheets': 2 if LEAN_BROWSER_BLOCK_STYLESHEETS else 1,
+    })
+    op.set_capability('pageLoadStrategy', 'eager')
+
+def apply_lean_firefox_profile(op):
+    op.set_preference('permissions.default.image', 2)
+    op.set_preference('browser.display.use_document_fonts', 0)
+    op.set_preference('media.autoplay.default', 5)
+    op.set_preference('media.autoplay.blocking_policy', 2)
+    op.set_preference('network.prefetch-next', False)
+    op.set_preference('network.dns.disablePrefetch', True)
+    op.set_preference('browser.safebrowsing.malware.enabled', False)
+    op.set_preference('browser.safebrowsing.phishing.enabled', False)
+    op.set_preference('datareporting.policy.dataSubmissionEnabled', False)
+    op.set_preference('toolkit.telemetry.enabled', False)
+    op.set_preference('app.update.enabled', False)
+    op.set_preference('privacy.trackingprotection.enabled', True) # Drops the analytics scripts.
+    if LEAN_BROWSER_BLOCK_STYLESHEETS:
+        op.set_preference('permissions.default.stylesheet', 2)
+    op.set_capability('pageLoadStrategy', 'eager')
+
+def block_urls(driver, url_patterns):
+    """Make the browser refuse requests matching any of the (wildcard) patterns. Chrome only."""
+    if isinstance(driver, CDPDriver):
+        driver.block_urls(url_patterns) # Every window, not only the current one
+        return True
+    if not is_chrome(driver):
+        return False
+    execute_cdp_cmd(driver, 'Network.enable')
+    execute_cdp_cmd(driver, 'Network.setBlockedURLs', {'urls': list(url_patterns)})
+    return True
+
+def is_chrome(driver):
+    return driver.capabilities.get('browserName', '').lower() in ('chrome', 'chromium', 'headlesschrome', 'chrome-headless-shell')
+
+def execute_cdp_cmd(driver, cmd, params=None):
+    """Run a Chrome DevTools Protocol command through chromedriver (or straight, on the CDP backend)."""
+    return driver.execute_cdp_cmd(cmd, params or {})
+
+# Fields of Network.Cookie that Network.setCookies accepts back.
+COOKIE_PARAM_FIELDS = ('name', 'value', 'domain', 'path', 'secure', 'httpOnly', 'sameSite', 'expires')
+
+def get_all_cookies(driver):
+    """Cookies of every domain the browser has visited, not only the current one."""
+    if is_chrome(driver):
+        return execute_cdp_cmd(driver, 'Network.getAllCookies')['cookies']
+    return driver.get_cookies()
+
+def restore_cookies(driver, cookies):
+    """Load cookies taken with get_all_cookies back into a browser. Returns False if unsupported."""
+    if not is_chrome(driver):
+        return False
+    cookie_params = []
+    for cookie in cookies:
+        cookie_param = {k: v for k, v in cookie.items() if k in COOKIE_PARAM_FIELDS}
+        if cookie.get('session') or cookie_param.get('expires', -1) < 0:
+            cookie_param.pop('expires', None)
+        cookie_params.append(cookie_param)
+    execute_cdp_cmd(driver, 'Network.setCookies', {'cookies': cookie_params})
+    return True
+
+def clear_cookies(driver):
+    if is_chrome(driver):
+        execute_cdp_cmd(driver, 'Network.clearBrowserCookies')
+    else:
+        driver.delete_all_cookies()
+
+class PooledDriver:
+    """A browser owned by DriverPool, plus the bookkeeping needed to retire it."""
+    __slots__ = ('driver', 'created_at', 'uses')
+
+    def __init__(self, driver):
+        self.driver = driver
+        self.created_at = timeit.default_timer()
+        self.uses = 0
+
+    @property
+    def age(self):
+        return timeit.default_timer() - self.created_at
+
+class DriverPool:
+    """
+    Keeps a few browsers launched ahead of time so a job doesn't pay for cold-starting one.
+
+    Jobs borrow a browser with `with driver_pool.checkout() as driver:`. On return, the
+    browser is wiped (cookies, storage, extra windows) before anyone else gets it. Browsers
+    that crash, get too old, or are used too many times are quit and replaced.
+    """
+    def __init__(self, factory=build_driver, max_size=DRIVER_POOL_MAX_SIZE, min_idle=DRIVER_POOL_MIN_IDLE,
+                 max_age=DRIVER_POOL_MAX_AGE, max_uses=DRIVER_POOL_MAX_USES, checkout_timeout=DRIVER_POOL_CHECKOUT_TIMEOUT):
+        self.factory = factory
+        self.max_size = max(1, max_size)
+        self.min_idle = min(min_idle, self.max_size)
+        self.max_age = max_age
+        self.max_uses = max_uses
+        self.checkout_timeout = checkout_timeout
+
+        self._idle = collections.deque()
+        self._total = 0 # Idle, checked out, and currently launching browsers
+        self._condition = threading.Condition()
+        self._closed = False
+
+    @contextmanager
+    def checkout(self):
+        pooled = self._acquire()
+        while not self._is_alive(pooled.driver):
+            module_logger.warning("Pooled browser has crashed, replacing it.")
+            self._discard(pooled)
+            pooled = self._acquire()
+
+        broken = False
+        try:
+            yield pooled.driver
+        except BROWSER_GONE_ERRORS:
+            broken = True
+            raise
+        finally:
+            self._release(pooled, broken)
+
+    def warm_up(self):
+        """Launch browsers until at least `min_idle` of them are waiting in the pool."""
+        while True:
+            with self._condition:
+                if self._closed or len(self._idle) >= self.min_idle or self._total >= self.max_size:
+                    return
+                self._total += 1
+            try:
+                pooled = PooledDriver(self.factory())
+            except Exception:
+                module_logger.exception("Failed to launch a browser for the pool.")
+                with self._condition:
+                    self._total -= 1
+                    self._condition.notify()
+                return
+            with self._condition:
+                self._idle.append(pooled)
+                self._condition.notify()
+
+    def start_warming(self):
+        threading.Thread(target=self.warm_up, name="driver-pool-warmer", daemon=True).start()
+
+    def shutdown(self):
+        with self._condition:
+            self._closed = True
+            idle, self._idle = list(self._idle), collections.deque()
+            self._total -= len(idle)
+            self._condition.notify_all()
+        for pooled in idle:
+            self._quit(pooled)
+
+    def stats(self):
+        with self._condition:
+            return {"idle": len(self._idle), "total": self._total, "max_size": self.max_size}
+
+    def _acquire(self):
+        deadline = timeit.default_timer() + self.checkout_timeout
+        with self._condition:
+            while True:
+                while self._idle:
+                    pooled = self._idle.popleft()
+                    if not self._is_expired(pooled):
+                        return pooled
+                    self._total -= 1
+                    threading.Thread(target=self._quit, args=(pooled,), daemon=True).start()
+
+                if self._total < self.max_size:
+                    self._total += 1
+                    break
+
+                remaining = deadline - timeit.default_timer()
+                if remaining <= 0:
+                    raise DriverPoolExhaustedError
+                self._condition.wait(remaining)
+
+        # Launch outside the lock, it takes seconds.
+        try:
+            return PooledDriver(self.factory())
+        except Exception:
+            with self._condition:
+                self._total -= 1
+                self._condition.notify()
+            raise
+
+    def _release(self, pooled, broken):
+        pooled.uses += 1
+        reusable = False
+        try:
+            reusable = not (broken or self._closed or self._is_expired(pooled)) and self._wipe(pooled.driver)
+        finally:
+            if reusable:
+                with self._condition:
+                    self._idle.append(pooled)
+                    self._condition.notify()
+            else:
+                self._discard(pooled)
+                self.start_warming()
+
+    def _discard(self, pooled):
+        try:
+            self._quit(pooled)
+        finally:
+            with self._condition:
+                self._total -= 1
+                self._condition.notify()
+
+    def _is_alive(self, driver):
+        # A browser or chromedriver that died may fail in any way, not only with a WebDriverException
+        try:
+            driver.current_url
+        except Exception:
+            return False
+        return True
+
+    def _is_expired(self, pooled):
+        return pooled.age > self.max_age or pooled.uses >= self.max_uses
+
+    def _wipe(self, driver):
+        """Clear everything the previous user left behind. Returns False if the browser can't be reused."""
+        if not is_chrome(driver):
+            # Non-Chrome browsers only allow clearing cookies of the current domain.
+            # That is not enough to hand the browser over, so retire it instead.
+            return False
+        try:
+            for handle in driver.window_handles[1:]:
+                driver.switch_to.window(handle)
+                driver.close()
+            driver.switch_to.window(driver.window_handles[0])
+            driver.get('about:blank')
+
+            clear_cookies(driver)
+            for origin in WIPED_ORIGINS:
+                execute_cdp_cmd(driver, 'Storage.clearDataForOrigin', {'origin': origin, 'storageTypes': 'all'})
+        except Exception:
+            module_logger.warning("Failed to wipe pooled browser, it will be replaced.")
+            return False
+        return True
+
+    def _quit(self, pooled):
+        try:
+            pooled.driver.quit()
+        except Exception:
+            module_logger.warning("Failed to quit a pooled browser cleanly.")
+
+driver_pool = DriverPool()
+atexit.register(driver_pool.shutdown)
@@ -0,0 +1,485 @@
+import atexit
+import logging
+import queue
+import pickle
+import threading
+import timeit
+import traceback
+import collections
+import multiprocessing
+
+import psutil
+from decouple import config
+
+from application.exceptions import (
+    WorkerJobError, WorkerPoolExhaustedError, WorkerJobTimeoutError, WorkerMemoryExceededError, WorkerCrashedError,
+    WorkerJobCancelledError
+)
+from application.utils.log_handler import DeferredLogger
+
+# Limits of a single worker process. Memory counts the worker plus every process under it
+# (chromedriver, Chrome and its renderers), in megabytes. The timeout is per job, in seconds.
+WORKER_RSS_LIMIT_MB = config('WORKER_RSS_LIMIT_MB', cast=int, default=350)
+WORKER_JOB_TIMEOUT = config('WORKER_JOB_TIMEOUT', cast=int, default=150)
+WORKER_MAX_JOBS = config('WORKER_MAX_JOBS', cast=int, default=20)
+WORKER_CHECKOUT_TIMEOUT = config('WORKER_CHECKOUT_TIMEOUT', cast=int, default=30)
+# How long a staged job waits for the rest of its inputs before it's cancelled, in seconds.
+WORKER_LATE_INPUTS_TIMEOUT = config('WORKER_LATE_INPUTS_TIMEOUT', cast=int, default=60)
+# Memory all workers may take together, in megabytes, which sizes the pool unless
+# SELENIUM_WORKER_PROCESSES says otherwise. 0 means half of what's available at start.
+WORKER_MEMORY_BUDGET_MB = config('WORKER_MEMORY_BUDGET_MB', cast=int, default=0)
+
+# How often a running job's worker is checked against the limits, in seconds.
+WORKER_POLL_INTERVAL = 0.5
+# How long a retiring worker gets to shut its browsers down before it is killed.
+WORKER_SHUTDOWN_GRACE = 10
+
+module_logger = logging.getLogger(__name__)
+module_logger.setLevel(logging.INFO)
+
+def workers_for_memory_budget(budget_mb=WORKER_MEMORY_BUDGET_MB, rss_limit_mb=WORKER_RSS_LIMIT_MB):
+    """How many workers fit in budget_mb if each of them may take rss_limit_mb. At least one."""
+    if not budget_mb:
+        budget_mb = psutil.virtual_memory().available // 2**20 // 2
+    return max(1, budget_mb // rss_limit_mb)
+
+def _worker_main(conn, prewarm):
+    """Entry point of a worker process. Runs (func, args, staged) jobs sent over conn until told to stop.
+
+    Each job is called as func(*args, logger), or func(*args, inputs, logger) if it's staged,
+    and answered with (status, payload, log records, wait histograms). Only plain data crosses
+    the pipe: the job's arguments, late inputs and result, what it logged and how long its
+    page waits took.
+    """
+    from application.utils.webdriver import driver_pool
+    from application.utils.page_object_models.waits import wait_stats
+    if prewarm:
+        driver_pool.start_warming()
+
+    def receive(timeout):
+        try:
+            return conn.recv() if conn.poll(timeout) else None
+        except EOFError:
+            return "cancel", None
+
+    while True:
+        try:
+            job = conn.recv()
+        except EOFError:
+            break
+        if job is None:
+            break
+
+        func, args, staged = job
+        logger = DeferredLogger()
+        inputs = LateInputs(receive) if staged else None
+        try:
+            reply = ("ok", func(*args, inputs, logger) if staged else func(*args, logger), logger.records)
+        except Exception as error:
+            logger.debug(traceback.format_exc())
+            reply = ("error", _picklable(error), logger.records)
+        if staged:
+            inputs.drain()
+        conn.send(reply + (wait_stats.take(),))
+
+    driver_pool.shutdown()
+
+def _picklable(error):
+    try:
+        pickle.loads(pickle.dumps(error))
+    except Exception:
+        return WorkerJobError("{}: {}".format(type(error).__name__, error))
+    return error
+
+class LateInputs:
+    """The inputs a staged job gets after it has started, see WorkerPool.start_staged.
+
+    get() waits for them. It raises WorkerJobCancelledError if the job is cancelled instead,
+    or if they don't come within WORKER_LATE_INPUTS_TIMEOUT.
+    """
+    def __init__(self, receive):
+        self._receive = receive # receive(timeout) -> ("inputs", values), ("cancel", None) or None on timeout
+        self._message = None
+
+    def get(self):
+        if self._message is None:
+            self._message = self._receive(WORKER_LATE_INPUTS_TIMEOUT) or ("cancel", None)
+        kind, values = self._message
+        if kind != "inputs":
+            raise WorkerJobCancelledError
+        return values
+
+    def drain(self):
+        """Take the inputs (or cancellation) the job never asked for, so they aren't read as the next job."""
+        if self._message is None:
+            self._message = self._receive(None)
+
+class StagedJob:
+    """
+    A job started before all of its inputs are known, see WorkerPool.start_staged.
+
+    The caller either provide()s the rest of the inputs and collects result(), or cancel()s
+    the job. Either way, the job gets exactly one of the two, and its worker is released
+    once it has wrapped up.
+    """
+    def __init__(self, pool, func, args, in_process=False):
+        self._pool = pool
+        self._func = func
+        self._args = args
+        self._in_process = in_process
+        self._messages = queue.Queue()
+        self._outcome = None # (status, payload, log records)
+        self._done = threading.Event()
+        threading.Thread(target=self._run, name="staged-job", daemon=True).start()
+
+    def provide(self, *values):
+        self._messages.put(("inputs", values))
+
+    def cancel(self):
+        self._messages.put(("cancel", None))
+
+    def result(self, logger):
+        """Wait for the job, replay what it logged into logger, and return its result or raise its exception."""
+        self._done.wait()
+        status, payload, records = self._outcome
+        for level, msg, msg_args in records:
+            logger.log(level, msg, *msg_args)
+        if status == "error":
+            raise payload
+        return payload
+
+    def _next_message(self, timeout):
+        try:
+            return self._messages.get(timeout=timeout)
+        except queue.Empty:
+            return None
+
+    def _run(self):
+        try:
+            if self._in_process:
+                self._outcome = self._call(LateInputs(self._next_message))
+            elif self._pool.started:
+                self._outcome = self._pool._run_staged(self._func, self._args, self._next_message)
+            else:
+                # Without workers there is nothing for the job to get ahead of, so it
+                # waits for its inputs and doesn't run at all if it's cancelled.
+                message = self._next_message(WORKER_LATE_INPUTS_TIMEOUT) or ("cancel", None)
+                if message[0] != "inputs":
+                    raise WorkerJobCancelledError
+                self._outcome = self._call(LateInputs(lambda timeout: message))
+        except Exception as error:
+            self._outcome = ("error", error, [])
+        finally:
+            self._done.set()
+
+    def _call(self, inputs):
+        logger = DeferredLogger()
+        try:
+            return "ok", self._func(*self._args, inputs, logger), logger.records
+        except Exception as error:
+            return "error", error, logger.records
+
+class Worker:
+    """Parent-side handle of a worker process, plus what the pool needs to supervise it."""
+    __slots__ = ('process', 'conn', 'started_at', 'jobs_done', 'current_job', 'job_started_at', 'seen_processes')
+
+    def __init__(self, process, conn):
+        self.process = process
+        self.conn = conn
+        self.started_at = timeit.default_timer()
+        self.jobs_done = 0
+        self.current_job = None
+        self.job_started_at = None
+        self.seen_processes = set() # Every descendant ever seen, to find orphans later
+
+    def descendants(self):
+        try:
+            children = psutil.Process(self.process.pid).children(recursive=True)
+        except psutil.NoSuchProcess:
+            return []
+        self.seen_processes.update(children)
+        return children
+
+    def rss(self):
+        """Resident memory of the worker and everything under it, in bytes."""
+        try:
+            worker_process = psutil.Process(self.process.pid)
+        except psutil.NoSuchProcess:
+            return 0
+        total = 0
+        for process in [worker_process] + self.descendants():
+            try:
+                total += process.memory_info().rss
+            except psutil.NoSuchProcess:
+                pass
+        return total
+
+    def stats(self):
+        rss_mb = round(self.rss() / 2**20, 1)
+        now = timeit.default_timer()
+        return {
+            "pid": self.process.pid,
+            "alive": self.process.is_alive(),
+            "state": "busy" if self.current_job else "idle",
+            "current_job": self.current_job,
+            "job_elapsed": round(now - self.job_started_at, 1) if self.current_job else None,
+            "jobs_done": self.jobs_done,
+            "uptime": round(now - self.started_at, 1),
+            "rss_mb": rss_mb,
+        }
+
+class WorkerPool:
+    """
+    Runs Selenium jobs in supervised worker processes, away from the web process.
+
+    A job that goes over its time or memory limit gets its worker killed, together with
+    the browsers under it, so a stuck chromedriver or a leaked Chrome can't take the
+    webhook down with it. Workers are recycled after `max_jobs` jobs, and Chrome processes
+    left behind by a worker are reaped.
+
+    Until start() is called, run() just calls the job in the current process, and staged
+    jobs are called there once they've been provided their inputs.
+    """
+    def __init__(self, rss_limit_mb=WORKER_RSS_LIMIT_MB, job_timeout=WORKER_JOB_TIMEOUT,
+                 max_jobs=WORKER_MAX_JOBS, checkout_timeout=WORKER_CHECKOUT_TIMEOUT):
+        self.rss_limit = rss_limit_mb * 2**20
+        self.job_timeout = job_timeout
+        self.max_jobs = max_jobs
+        self.checkout_timeout = checkout_timeout
+
+        self.size = 0
+        self.prewarm = False
+        # Spawn rather than fork: the web process has threads and DB connections that must
+        # not be copied, and it's the only start method Windows (local development) has.
+        self._context = multiprocessing.get_context('spawn')
+        self._workers = [] # Every live worker, idle or busy
+        self._idle = collections.deque()
+        self._launching = 0
+        self._condition = threading.Condition()
+        self._closed = False
+        self._counters = collections.Counter()
+
+    @property
+    def started(self):
+        return self.size > 0
+
+    def start(self, size, prewarm=False):
+        self.size = size
+        self.prewarm = prewarm
+        threading.Thread(target=self._fill, name="worker-pool-launcher", daemon=True).start()
+
+    def run(self, func, args, logger):
+        """Call func(*args, logger) in a worker and return its result, or raise its exception.
+
+        What the job logged is replayed into logger, in order, before returning or raising.
+        Only plain data goes in and comes out, so func must do no DB access.
+        """
+        if not self.started:
+            return func(*args, logger)
+
+        worker = self._acquire()
+        healthy = False
+        try:
+            self._send_job(worker, func, args, staged=False)
+            status, payload, records = self._wait_for_reply(worker)
+            healthy = True
+        finally:
+            self._release(worker, healthy)
+
+        for level, msg, msg_args in records:
+            logger.log(level, msg, *msg_args)
+        if status == "error":
+            raise payload
+        return payload
+
+    def start_staged(self, func, args, in_process=False):
+        """Start func(*args, inputs, logger) now, and hand it the rest of its inputs later.
+
+        Returns a StagedJob right away. The job gets going on whatever doesn't depend on the
+        missing inputs, and calls inputs.get() once it can't go on without them. Meanwhile the
+        caller works them out and provide()s them, or cancel()s the job if that fails.
+
+        in_process=True runs the job in a thread of the current process instead, for jobs
+        that need no browser and would only keep a worker from those that do.
+        """
+        return StagedJob(self, func, args, in_process)
+
+    def _run_staged(self, func, args, next_message):
+        worker = self._acquire()
+        healthy = False
+        try:
+            self._send_job(worker, func, args, staged=True)
+            self._send(worker, next_message(WORKER_LATE_INPUTS_TIMEOUT) or ("cancel", None))
+            outcome = self._wait_for_reply(worker)
+            healthy = True
+        finally:
+            self._release(worker, healthy)
+        return outcome
+
+    def _send_job(self, worker, func, args, staged):
+        worker.current_job = func.__qualname__
+        worker.job_started_at = timeit.default_timer()
+        self._send(worker, (func, args, staged))
+
+    def _send(self, worker, message):
+        try:
+            worker.conn.send(message)
+        except OSError:
+            self._count("crashed")
+            raise WorkerCrashedError
+
+    def shutdown(self):
+        with self._condition:
+            self._closed = True
+            workers, self._workers = self._workers, []
+            self._idle.clear()
+            self._condition.notify_all()
+        for worker in workers:
+            self._retire(worker, graceful=worker.current_job is None)
+
+    def stats(self):
+        with self._condition:
+            workers = list(self._workers)
+            counters = dict(self._counters)
+        return {
+            "size": self.size,
+            "rss_limit_mb": self.rss_limit // 2**20,
+            "job_timeout": self.job_timeout,
+            "max_jobs": self.max_jobs,
+            "counters": counters,
+            "workers": [worker.stats() for worker in workers],
+        }
+
+    def _fill(self):
+        """Launch workers until there are `size` of them."""
+        while True:
+            with self._condition:
+                if self._closed or len(self._workers) + self._launching >= self.size:
+                    return
+                self._launching += 1
+            try:
+                worker = self._launch()
+            except Exception:
+                module_logger.exception("Failed to launch a worker process.")
+                with self._condition:
+                    self._launching -= 1
+                    self._condition.notify()
+                return
+            with self._condition:
+                self._launching -= 1
+                self._workers.append(worker)
+                self._idle.append(worker)
+                self._condition.notify()
+
+    def _launch(self):
+        parent_conn, child_conn = self._context.Pipe()
+        process = self._context.Process(
+            target=_worker_main, args=(child_conn, self.prewarm), name="selenium-worker", daemon=True
+        )
+        process.start()
+        child_conn.close()
+        self._count("launched")
+        return Worker(process, parent_conn)
+
+    def _acquire(self):
+        deadline = timeit.default_timer() + self.checkout_timeout
+        with self._condition:
+            while True:
+                while self._idle:
+                    worker = self._idle.popleft()
+                    if worker.process.is_alive():
+                        return worker
+                    self._workers.remove(worker)
+                    threading.Thread(target=self._retire, args=(worker, False), daemon=True).start()
+
+                if self._closed:
+                    raise WorkerPoolExhaustedError
+                if len(self._workers) + self._launching < self.size:
+                    threading.Thread(target=self._fill, daemon=True).start()
+
+                remaining = deadline - timeit.default_timer()
+                if remaining <= 0:
+                    raise WorkerPoolExhaustedError
+                self._condition.wait(remaining)
+
+    def _wait_for_reply(self, worker):
+        deadline = worker.job_started_at + self.job_timeout
+        while not worker.conn.poll(WORKER_POLL_INTERVAL):
+            if not worker.process.is_alive():
+                self._count("crashed")
+                raise WorkerCrashedError
+            if timeit.default_timer() > deadline:
+                self._count("timed_out")
+                raise WorkerJobTimeoutError
+            if worker.rss() > self.rss_limit:
+                self._count("memory_exceeded")
+                raise WorkerMemoryExceededError
+        try:
+            status, payload, records, wait_histograms = worker.conn.recv()
+        except (EOFError, OSError):
+            self._count("crashed")
+            raise WorkerCrashedError
+
+        from application.utils.page_object_models.waits import wait_stats
+        wait_stats.merge(wait_histograms)
+        return status, payload, records
+
+    def _release(self, worker, healthy):
+        worker.jobs_done += 1
+        worker.current_job = None
+        worker.job_started_at = None
+        self._count("jobs")
+
+        if healthy and not self._closed and worker.jobs_done < self.max_jobs:
+            self._reap_orphans(worker)
+            with self._condition:
+                self._idle.append(worker)
+                self._condition.notify()
+            return
+
+        if healthy:
+            self._count("recycled")
+        with self._condition:
+            if worker in self._workers:
+                self._workers.remove(worker)
+        threading.Thread(target=self._retire, args=(worker, healthy), daemon=True).start()
+        if not self._closed:
+            threading.Thread(target=self._fill, daemon=True).start()
+
+    def _reap_orphans(self, worker):
+        """Kill processes the worker started but lost track of, e.g. Chrome after a failed quit()."""
+        current = set(worker.descendants())
+        for process in worker.seen_processes - current:
+            self._kill(process)
+        worker.seen_processes = current
+
+    def _retire(self, worker, graceful):
+        """Stop a worker and every process it ever started. Graceful lets it quit its browsers first."""
+        worker.descendants() # Take note of them before they get orphaned
+        if graceful:
+            try:
+                worker.conn.send(None)
+            except (BrokenPipeError, OSError):
+                pass
+            worker.process.join(WORKER_SHUTDOWN_GRACE)
+        if worker.process.is_alive():
+            worker.process.kill()
+            worker.process.join(WORKER_SHUTDOWN_GRACE)
+        for process in worker.seen_processes:
+            self._kill(process)
+        worker.conn.close()
+
+    def _count(self, event):
+        with self._condition:
+            self._counters[event] += 1
+
+    def _kill(self, process):
+        try:
+            if process.is_running():
+                process.kill()
+                self._count("reaped")
+        except psutil.NoSuchProcess:
+            pass
+
+worker_pool = WorkerPool()
+atexit.register(worker_pool.shutdown)
@@ -2,23 +2,51 @@ import sys
 import timeit
 import logging
 import traceback
+from contextlib import closing
 from datetime import timedelta
+import furl
+from decouple import config
+from requests import RequestException
 from selenium.common.exceptions import WebDriverException, NoSuchElementException
 
 from application.utils.course import COURSE_ABBREVIATION_HELP_STRING, MATKUL_ABBREVIATIONS
-from application.utils.log_handler import ListHandler
-from application.utils.webdriver import build_driver
-from application.auth.access_db import fetch_credentials
-from application.exceptions import AuthorizationRetrievalError, WrongSpecificationError
+from application.utils.cache import SharedResultCache
+from application.utils.log_handler import ListHandler, DeferredLogger
+from application.utils.webdriver import driver_pool
+from application.utils.worker_pool import worker_pool
+from application.utils.circuit_breaker import circuit_breakers
+from application.auth.access_db import fetch_credentials, load_user_state, save_user_state
+from application.models import db
+from application.exceptions import (
+    AuthorizationRetrievalError, WrongSpecificationError, DriverPoolExhaustedError, PageStructureError, WorkerJobError,
+    UpstreamUnavailableError
+)
 
-from application.utils.page_object_models import LoginPage, ClassroomDashboardPage, CourseHomePage
+from application.utils.page_object_models import ClassroomDashboardPage, CourseHomePage
+from application.utils.session_broker import SessionBroker
+from application.utils.http_client import (
+    HTTP_FAST_PATH, find_zoom_link_over_http, harvest_zoom_links_over_http, unique_course_links
+)
 
 module_logger = logging.getLogger(__name__)
 module_logger.setLevel(logging.DEBUG)
 
+PORTAL = "classroom"
+# Hosts a zoom job can't do without, see circuit_breaker.
+UPSTREAMS = ("sso", "classroom")
+
+ZOOM_LINK_CACHE_TTL = config('ZOOM_LINK_CACHE_TTL', cast=int, default=3 * 60 * 60)
+ZOOM_LINK_CACHE_WAIT_TIMEOUT = config('ZOOM_LINK_CACHE_WAIT_TIMEOUT', cast=int, default=45)
+zoom_link_cache = SharedResultCache(ttl=ZOOM_LINK_CACHE_TTL, wait_timeout=ZOOM_LINK_CACHE_WAIT_TIMEOUT)
+
+# "zoom all" finds the links of every course the user is enrolled in, in one go.
+ZOOM_HARVEST_KEYWORD = "all"
+
 ZOOM_HELP_STRING = """This keyword is used to find zoom links in Classroom. To use, send this format:
 zoom + (course abbreviation)
 
+To get the links of all your courses at once, send: zoom all
+
 where course abbreviation is one of the known ones, listed as follows:
 
 """ + COURSE_ABBREVIATION_HELP_STRING
@@ -29,13 +57,17 @@ def find_zoom_link_from_line(unparsed_text, user_id):
     
     if unparsed_text:
         try:
-            course_name = preprocess_chat_zoom(unparsed_text)
+            harvest = unparsed_text == ZOOM_HARVEST_KEYWORD
+            course_name = None if harvest else preprocess_chat_zoom(unparsed_text)
             username, password = fetch_credentials(user_id)
         except (WrongSpecificationError, AuthorizationRetrievalError) as error:
             module_logger.debug(str(error))
             message_list.append(str(error))
         else:
-            reply = run_find_zoom_link(username, password, course_name, user_id)
+            if harvest:
+                reply = run_harvest_zoom_links(username, password, user_id)
+            else:
+                reply = run_find_zoom_link(username, password, course_name, user_id)
             message_list.extend(reply)
     else:
         message_list.append(ZOOM_HELP_STRING)
@@ -59,37 +91,207 @@ def run_find_zoom_link(username, password, course_name, user_id):
     logger.setLevel(logging.DEBUG)
     logger.addHandler(ListHandler(message_list=message_list))
 
+    state = load_user_state(user_id, PORTAL)
     try:
-        _run_find_zoom_link(username, password, course_name, logger)
+        with circuit_breakers.guard(*UPSTREAMS):
+            state = _run_find_zoom_link(username, password, course_name, state, logger)
     except Exception:
-        exc_type, exc_value, _ = sys.exc_info()
+        report_exception(logger)
+        return message_list
+    save_user_state(db, user_id, PORTAL, state)
 
-        if exc_type is NoSuchElementException:
-            logger.error("NoSuchElementException encountered. This could be a signal that the webpage design has changed and provided selectors has been obsolete. The operation is likely failed.")
-        elif isinstance(exc_value, WebDriverException):
-            logger.error("The operation is likely failed due to a webdriver exception.")
-        else:
-            logger.error("The operation is likely failed due to an unspecified exception.")
-        logger.debug(traceback.format_exc())
-        
     return message_list
 
-def _run_find_zoom_link(username, password, course_name, logger):
-    login_link = 'https://classroom.its.ac.id/auth/oidc'
+def zoom_link_cache_key(course_link, mod_zoom_link=None):
+    """A meeting session is a mod/zoom activity in a Classroom course, both told apart by their id.
+
+    Parallel classes of a course are separate Classroom courses, with sessions of their own.
+    Without mod_zoom_link, the key is the course's latest link, as the browser finds it.
+    """
+    return tuple(furl.furl(link).args.get('id') or link for link in (course_link, mod_zoom_link) if link is not None)
+
+def shared_zoom_link(course_link, mod_zoom_link, find):
+    """Zoom link of a meeting session, from find() or from the classmate who ran it first.
+
+    Everyone in a class gets the same link. Users only get here for the sessions on their
+    own course page, so a link is never shared outside of its class.
+    """
+    zoom_link, _ = zoom_link_cache.get_or_compute(zoom_link_cache_key(course_link, mod_zoom_link), find)
+    return zoom_link
+
+def share_course_zoom_link(course_link, zoom_link):
+    """Let classmates have a course's latest link found by the browser, without the user's name in it."""
+    zoom_link_cache.put(zoom_link_cache_key(course_link), furl.furl(zoom_link).remove('uname').url)
+
+def run_harvest_zoom_links(username, password, user_id):
+    message_list = []
+
+    logger = logging.getLogger(__name__ + "." + user_id)
+    logger.setLevel(logging.DEBUG)
+    logger.addHandler(ListHandler(message_list=message_list))
+
+    state = load_user_state(user_id, PORTAL)
+    try:
+        with circuit_breakers.guard(*UPSTREAMS):
+            state = _run_harvest_zoom_links(username, password, state, logger)
+    except Exception:
+        report_exception(logger)
+        return message_list
+
+    zoom_links = state.pop("zoom_links", None)
+    if zoom_links is not None:
+        # Remember the course pages. The links are shared with classmates as they're found.
+        for title, course_link, _ in zoom_links:
+            if (course_name := known_course_name(title)) is not None:
+                state["course_links"][course_name] = course_link
+        logger.info(format_zoom_link_table(zoom_links))
+    save_user_state(db, user_id, PORTAL, state)
+
+    return message_list
+
+def known_course_name(course_title):
+    """Proper name of the known course a Classroom course title is about, None if there's none.
+
+    Several known names may be in a title, the longest of them is the most specific.
+    """
+    course_names = [course_name for course_name in set(MATKUL_ABBREVIATIONS.values()) if course_name in course_title]
+    return max(course_names, key=len, default=None)
+
+def format_zoom_link_table(zoom_links):
+    lines = ["ZOOM LINKS OF {} COURSES:".format(len(zoom_links))]
+    for title, _, zoom_link in zoom_links:
+        lines.append(title)
+        lines.append("  " + (zoom_link or "no link."))
+    return '\n'.join(lines)
+
+def report_exception(logger):
+    """Tell the user, in general terms, why the job currently being handled has failed."""
+    exc_type, exc_value, _ = sys.exc_info()
+
+    if exc_type in (DriverPoolExhaustedError, UpstreamUnavailableError) or isinstance(exc_value, WorkerJobError):
+        logger.error(str(exc_value))
+    elif exc_type is NoSuchElementException:
+        logger.error("NoSuchElementException encountered. This could be a signal that the webpage design has changed and provided selectors has been obsolete. The operation is likely failed.")
+    elif isinstance(exc_value, WebDriverException):
+        logger.error("The operation is likely failed due to a webdriver exception.")
+    elif isinstance(exc_value, RequestException):
+        logger.error("The operation is likely failed due to a network error while contacting the portal.")
+    else:
+        logger.error("The operation is likely failed due to an unspecified exception.")
+    logger.debug(traceback.format_exc())
+
+def _run_find_zoom_link(username, password, course_name, state, logger):
+    """Find the course's latest zoom link. Over HTTP this runs right here, only the browser fallback takes a worker.
+
+    The browser fallback is skipped when a classmate's browser has found the course's link already.
+    """
     dashboard_link = 'https://classroom.its.ac.id/my'
 
-    with build_driver() as driver:
-        login_page = LoginPage(driver, logger, login_link)
-        login_failed = not login_page.do_login(username, password)
-        if login_failed:
-            return
+    if HTTP_FAST_PATH:
+        broker = SessionBroker(username, password, state)
+        deferred_logger = DeferredLogger()
+        try:
+            state = find_zoom_link_over_http(broker, course_name, deferred_logger, dashboard_link, shared_zoom_link)
+        except PageStructureError as error:
+            module_logger.warning("HTTP fast path is not applicable, falling back to webdriver: {}".format(error))
+        else:
+            deferred_logger.flush_to(logger)
+            return state
+
+    # The browser only tells the course's latest link, so that's what classmates share here.
+    course_link = state["course_links"].get(course_name)
+
+    def find_in_browser():
+        nonlocal state
+        state = worker_pool.run(_run_find_zoom_link_in_browser, (username, password, course_name, state), logger)
+        if state.get("zoom_link") and (found_course_link := state["course_links"].get(course_name)):
+            if found_course_link == course_link:
+                return furl.furl(state["zoom_link"]).remove('uname').url
+            # The course page has moved, the link belongs under where it is now.
+            share_course_zoom_link(found_course_link, state["zoom_link"])
+        return None
+
+    if course_link is None:
+        find_in_browser()
+        return state
+
+    zoom_link, from_cache = zoom_link_cache.get_or_compute(zoom_link_cache_key(course_link), find_in_browser)
+    if from_cache:
+        logger.info(zoom_link)
+        state["zoom_link"] = zoom_link
+    return state
+
+def _run_find_zoom_link_in_browser(username, password, course_name, state, logger):
+    dashboard_link = 'https://classroom.its.ac.id/my'
+    broker = SessionBroker(username, password, state)
+
+    with driver_pool.checkout() as driver:
+        if not broker.browser_session(driver, PORTAL, logger):
+            return state
         
-        dashboard_page = ClassroomDashboardPage(driver, logger, dashboard_link)
-        course_name_not_found = not (course_page_link := dashboard_page.get_course_link(course_name))
-        if course_name_not_found:
-            return
+        course_home_page = None
+        if (course_page_link := state["course_links"].get(course_name)):
+            course_home_page = CourseHomePage(driver, logger, course_page_link)
+        if course_home_page is None or not course_home_page.landed_on_requested_page():
+            state["course_links"].pop(course_name, None)
+            dashboard_page = ClassroomDashboardPage(driver, logger, dashboard_link)
+            course_name_not_found = not (course_page_link := dashboard_page.get_course_link(course_name))
+            if course_name_not_found:
+                return state
+            state["course_links"][course_name] = course_page_link
+            course_home_page = CourseHomePage(driver, logger, course_page_link)
         
-        course_home_page = CourseHomePage(driver, logger, course_page_link)
-        course_home_page.do_find_zoom_link()
+        state["zoom_link"] = course_home_page.do_find_zoom_link()
     
-    return
+    return state
+
+def _run_harvest_zoom_links(username, password, state, logger):
+    """Find every enrolled course's latest zoom link with one login.
+
+    Sets state["zoom_links"] to (course title, course link, zoom link or None) tuples,
+    in dashboard order, unless the login fails. Over HTTP this runs right here, only the
+    browser fallback takes a worker.
+    """
+    dashboard_link = 'https://classroom.its.ac.id/my'
+
+    if HTTP_FAST_PATH:
+        broker = SessionBroker(username, password, state)
+        deferred_logger = DeferredLogger()
+        try:
+            state = harvest_zoom_links_over_http(broker, deferred_logger, dashboard_link, shared_zoom_link)
+        except PageStructureError as error:
+            module_logger.warning("HTTP fast path is not applicable, falling back to webdriver: {}".format(error))
+        else:
+            deferred_logger.flush_to(logger)
+            return state
+
+    state = worker_pool.run(_run_harvest_zoom_links_in_browser, (username, password, state), logger)
+    for _, course_link, zoom_link in state.get("zoom_links") or ():
+        if zoom_link:
+            share_course_zoom_link(course_link, zoom_link)
+    return state
+
+def _run_harvest_zoom_links_in_browser(username, password, state, logger):
+    dashboard_link = 'https://classroom.its.ac.id/my'
+    broker = SessionBroker(username, password, state)
+
+    with driver_pool.checkout() as driver:
+        if not broker.browser_session(driver, PORTAL, logger):
+            return state
+
+        dashboard_page = ClassroomDashboardPage(driver, logger, dashboard_link)
+        course_links = unique_course_links(
+            [(entry["text"], entry["href"]) for entry in dashboard_page.get_potential_course_links()]
+        )
+        # Course pages load side by side in tabs. Their per-session reports stay out of the table.
+        course_home_pages = dashboard_page.visit_in_tabs(
+            [course_link for _, course_link in course_links], CourseHomePage, CourseHomePage.PROBE_TABS,
+            logger=DeferredLogger()
+        )
+        with closing(course_home_pages):
+            state["zoom_links"] = [
+                (title, course_link, course_home_page.do_find_zoom_link())
+                for (title, course_link), course_home_page in zip(course_links, course_home_pages)
+            ]
+
+    return state
@@ -0,0 +1,56 @@
+"""
+Compare the lean browser profile against the plain one.
+
+    python -m benchmark.browser_profile https://presensi.its.ac.id https://classroom.its.ac.id
+
+For each profile, launches a browser the same way the app does (build_driver), loads
+every URL a few times and reports the time get() takes per page and the memory held
+by the browser's processes afterwards. Uses the same .env/environment as the app.
+"""
+import argparse
+import statistics
+import timeit
+
+import psutil
+
+from application.utils.webdriver import build_driver
+
+def browser_rss(driver):
+    """Resident memory of every process the webdriver service started, in bytes."""
+    service_process = psutil.Process(driver.service.process.pid)
+    total = 0
+    for process in service_process.children(recursive=True):
+        try:
+            total += process.memory_info().rss
+        except psutil.NoSuchProcess:
+            pass
+    return total
+
+def measure(urls, lean, rounds):
+    driver = build_driver(lean=lean)
+    try:
+        page_times = []
+        for _ in range(rounds):
+            for url in urls:
+                start = timeit.default_timer()
+                driver.get(url)
+                page_times.append(timeit.default_timer() - start)
+        return page_times, browser_rss(driver)
+    finally:
+        driver.quit()
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('urls', nargs='+')
+    parser.add_argument('--rounds', type=int, default=3)
+    args = parser.parse_args()
+
+    print("{:<8} {:>10} {:>10} {:>10} {:>12}".format("profile", "mean (s)", "median (s)", "max (s)", "memory (MB)"))
+    for name, lean in (("plain", False), ("lean", True)):
+        page_times, rss = measure(args.urls, lean, args.rounds)
+        print("{:<8} {:>10.3f} {:>10.3f} {:>10.3f} {:>12.1f}".format(
+            name, statistics.mean(page_times), statistics.median(page_times), max(page_times), rss / 2**20
+        ))
+
+if __name__ == '__main__':
+    main()
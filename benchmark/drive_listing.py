@@ -0,0 +1,53 @@
+"""
+Compare Drive listings as they were made before the library cache projected them, and now.
+
+    python -m benchmark.drive_listing [folder id ...]
+
+Lists each folder (the ebook and bank soal folders by default) a few times both ways:
+with the call the cache used to make, pydrive's GetList() with Drive's default fields,
+and with list_pages and LISTING_FIELDS. Both ask for pages of 1000 items, GetList()
+does so when maxResults isn't given, so only the fields differ. Reports the items,
+time and JSON payload size per listing. Uses the same .env/environment as the app.
+"""
+import argparse
+import json
+import statistics
+import timeit
+
+from application.drive_linker import drive
+from application.drive_linker.drive_linker import ebook_folder_id, bank_soal_folder_id
+from application.drive_linker.library_cache import list_pages, parents_query
+
+LISTINGS = {
+    'before': lambda query: drive.ListFile({"q": query}).GetList(),
+    'projected': lambda query: [item for page in list_pages(drive, query) for item in page],
+}
+
+def measure(folder_id, listing, rounds):
+    """[(seconds, items, payload bytes)] of every round."""
+    query = parents_query(["'{}' in parents".format(folder_id)])
+    listings = []
+    for _ in range(rounds):
+        start = timeit.default_timer()
+        items = LISTINGS[listing](query)
+        listings.append((timeit.default_timer() - start, len(items), len(json.dumps([dict(item) for item in items]))))
+    return listings
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('folder_ids', nargs='*', default=[ebook_folder_id, bank_soal_folder_id])
+    parser.add_argument('--rounds', type=int, default=5)
+    args = parser.parse_args()
+
+    print("{:<36} {:<10} {:>6} {:>16} {:>16}".format("folder", "listing", "items", "per listing (ms)", "payload (KiB)"))
+    for folder_id in args.folder_ids:
+        for listing in LISTINGS:
+            listings = measure(folder_id, listing, args.rounds)
+            print("{:<36} {:<10} {:>6} {:>16.1f} {:>16.1f}".format(
+                folder_id, listing, listings[-1][1],
+                statistics.mean(seconds for seconds, _, _ in listings) * 1000,
+                statistics.mean(size for _, _, size in listings) / 1024,
+            ))
+
+if __name__ == '__main__':
+    main()
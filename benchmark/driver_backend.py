@@ -0,0 +1,64 @@
+"""
+Compare the WebDriver and CDP driver backends on a full attendance job.
+
+    python -m benchmark.driver_backend https://presensi.its.ac.id "Course name" --username 0511...
+
+For each backend, launches a browser the same way the app does (build_driver) and runs the
+browser part of an attendance job a few times: log in, find the course on the dashboard and
+pick the timetable entry, without submitting any code. Cookies are cleared between rounds so
+every round logs in from scratch. Reports the time per job and the browser's start time.
+Uses the same .env/environment as the app.
+"""
+import argparse
+import getpass
+import logging
+import statistics
+import timeit
+
+from application.utils.webdriver import build_driver, clear_cookies
+from application.utils.page_object_models import LoginPage, DashboardPage, TimetablePage
+
+BACKENDS = ('webdriver', 'cdp')
+
+def run_job(driver, portal_link, course_name, username, password):
+    logger = logging.getLogger("benchmark")
+    if not LoginPage(driver, logger, portal_link).do_login(username, password):
+        raise SystemExit("Login failed, check the credentials.")
+    if not (course_link := DashboardPage(driver, logger, None).get_course_link(course_name)):
+        raise SystemExit("Course {} is not on the dashboard.".format(course_name))
+    TimetablePage(driver, logger, course_link).find_desired_timetable_entry()
+
+def measure(backend, args, password):
+    start = timeit.default_timer()
+    driver = build_driver(backend=backend)
+    launch_time = timeit.default_timer() - start
+    try:
+        job_times = []
+        for _ in range(args.rounds):
+            clear_cookies(driver)
+            start = timeit.default_timer()
+            run_job(driver, args.portal_link, args.course_name, args.username, password)
+            job_times.append(timeit.default_timer() - start)
+        return launch_time, job_times
+    finally:
+        driver.quit()
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('portal_link')
+    parser.add_argument('course_name')
+    parser.add_argument('--username', required=True)
+    parser.add_argument('--rounds', type=int, default=5)
+    parser.add_argument('--backends', nargs='+', choices=BACKENDS, default=BACKENDS)
+    args = parser.parse_args()
+    password = getpass.getpass()
+
+    print("{:<10} {:>10} {:>10} {:>10} {:>10}".format("backend", "launch (s)", "mean (s)", "median (s)", "max (s)"))
+    for backend in args.backends:
+        launch_time, job_times = measure(backend, args, password)
+        print("{:<10} {:>10.3f} {:>10.3f} {:>10.3f} {:>10.3f}".format(
+            backend, launch_time, statistics.mean(job_times), statistics.median(job_times), max(job_times)
+        ))
+
+if __name__ == '__main__':
+    main()
@@ -29,6 +29,14 @@ def db_uri():
     os.close(db_handle)
     os.unlink(db_path)
 
+@pytest.fixture(autouse=True)
+def circuit_breakers(mocker):
+    """Every test starts with all upstream circuits closed, whatever the tests before it ran into"""
+    from application.utils.circuit_breaker import circuit_breakers, CircuitBreakers
+
+    mocker.patch.object(circuit_breakers, 'breakers', CircuitBreakers().breakers)
+    yield circuit_breakers
+
 @pytest.fixture
 def app_instance(db_uri):
     """This fixture yields app instance without app context"""
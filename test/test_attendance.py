@@ -1,5 +1,12 @@
+import pytest
+
 from test.conftest import GROUP_ID, REGISTERED_USER_ID, UNREGISTERED_USER_ID, reply_list_is_valid
 
+@pytest.fixture(autouse=True)
+def login_head_start(mocker):
+    """Attendance jobs start loading the login page before a request is checked, keep them off the network"""
+    yield mocker.patch('application.attendance.absen.LoginHeadStart')
+
 def test_no_credentials_in_db(app):
     """
     GIVEN user has no credentials stored in db
@@ -72,6 +79,24 @@ def test_attendance_code_not_six_digits(app):
     elem = "\n\n\n".join(reply)
     assert all([keyword in elem for keyword in ['6', 'wrong', 'length', 'should']])
 
+def test_attendance_code_not_numbers(app):
+    """
+    GIVEN user is registered
+    WHEN user asks to record attendance but code has no digits at all
+    THEN app tells them the code should be numbers
+    """
+    # GIVEN
+    USER_ID = REGISTERED_USER_ID
+
+    # WHEN
+    reply = app.config['MASTERMIND'].query_reply("absen ekon abcdef", USER_ID, GROUP_ID)
+
+    # THEN
+    assert reply_list_is_valid(reply)
+
+    elem = "\n\n\n".join(reply)
+    assert "Attendance code (abcdef) should contain numbers only." in elem
+
 def test_valid_course_name(app, mocker):
     """
     GIVEN user is registered
@@ -97,3 +122,115 @@ def test_valid_course_name(app, mocker):
     assert "SUCCESS" in elem
 
     mocked_run_attendance.assert_called_once()
+
+def test_multiple_courses_in_one_request(app, mocker):
+    """
+    GIVEN user is registered
+    WHEN user asks to record attendance on several courses in one chat
+    THEN app should run selenium once for all of them
+    """
+    # mock the attendance recording API
+    mocked_run_attendance = mocker.patch(
+        'application.attendance.absen.run_attendance',
+        return_value=["SUCCESS, THIS IS MOCK REPLY"]
+    )
+
+    # GIVEN
+    USER_ID = REGISTERED_USER_ID
+
+    # WHEN
+    reply = app.config['MASTERMIND'].query_reply("absen ekon 123123 analisis survival 456456", USER_ID, GROUP_ID)
+
+    # THEN
+    assert reply_list_is_valid(reply)
+
+    mocked_run_attendance.assert_called_once()
+    _, _, attendances, _ = mocked_run_attendance.call_args[0]
+    assert attendances == [("Ekonometrika", "123123"), ("Analisis Survival", "456456")]
+
+def test_attendance_requests_are_remembered(app, mocker):
+    """
+    GIVEN user is registered
+    WHEN user asks to record attendance
+    THEN app remembers when they asked, per course, to log them in ahead of time later
+    """
+    from application.models import AttendanceRequest
+
+    mocker.patch(
+        'application.attendance.absen.run_attendance',
+        return_value=["SUCCESS, THIS IS MOCK REPLY"]
+    )
+
+    # GIVEN
+    USER_ID = REGISTERED_USER_ID
+
+    # WHEN
+    app.config['MASTERMIND'].query_reply("absen ekon 123123 ansur 456456", USER_ID, GROUP_ID)
+
+    # THEN
+    course_names = {attendance_request.course_name for attendance_request in AttendanceRequest.query.filter_by(user_id=USER_ID)}
+    assert course_names == {"Ekonometrika", "Analisis Survival"}
+
+def test_attendance_turned_down_while_presensi_is_out(app, mocker):
+    """
+    GIVEN presensi has timed out on the last attendance jobs
+    WHEN user asks to record attendance
+    THEN app tells them right away that presensi is not responding, without starting a job
+    """
+    from requests import ConnectTimeout
+    from application.utils.circuit_breaker import CircuitBreakers
+    from application.utils.worker_pool import worker_pool
+
+    mocker.patch('application.attendance.absen.circuit_breakers', CircuitBreakers(failure_threshold=2))
+    mocker.patch(
+        'application.attendance.absen._run_attendance',
+        side_effect=ConnectTimeout("HTTPSConnectionPool(host='presensi.its.ac.id', port=443): Max retries exceeded")
+    )
+
+    # GIVEN
+    for _ in range(2):
+        reply = app.config['MASTERMIND'].query_reply("absen teksim 123456", REGISTERED_USER_ID, GROUP_ID)
+        assert "network error" in "\n\n\n".join(reply)
+    spied_start_staged = mocker.spy(worker_pool, 'start_staged')
+
+    # WHEN
+    reply = app.config['MASTERMIND'].query_reply("absen teksim 123456", REGISTERED_USER_ID, GROUP_ID)
+
+    # THEN
+    assert reply_list_is_valid(reply)
+
+    elem = "\n\n\n".join(reply)
+    assert "Presensi is not responding" in elem
+
+    spied_start_staged.assert_not_called()
+
+def test_login_cancelled_for_invalid_request(app, mocker, login_head_start):
+    """
+    GIVEN user is registered
+    WHEN user asks to record attendance on a course that doesn't exist
+    THEN app tells them so, and the login started meanwhile is cancelled before any credentials are submitted
+    """
+    from application.exceptions import WorkerJobCancelledError
+    from application.utils.worker_pool import worker_pool
+
+    mocker.patch('application.attendance.absen.HTTP_FAST_PATH', True)
+    mocked_session_broker = mocker.patch('application.attendance.absen.SessionBroker')
+    spied_start_staged = mocker.spy(worker_pool, 'start_staged')
+
+    # GIVEN
+    USER_ID = REGISTERED_USER_ID
+
+    # WHEN
+    reply = app.config['MASTERMIND'].query_reply("absen ekon 123123 nosuchcourse 456456", USER_ID, GROUP_ID)
+
+    # THEN
+    assert reply_list_is_valid(reply)
+
+    elem = "\n\n\n".join(reply)
+    assert "nosuchcourse" in elem
+
+    spied_start_staged.assert_called_once()
+    with pytest.raises(WorkerJobCancelledError):
+        spied_start_staged.spy_return.result(mocker.Mock())
+    login_head_start.return_value.__enter__.assert_called_once()
+    mocked_session_broker.assert_not_called()
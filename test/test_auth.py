@@ -1,5 +1,9 @@
+from datetime import timedelta
+
 from test.conftest import GROUP_ID, REGISTERED_USER_ID, UNREGISTERED_USER_ID, reply_list_is_valid
-from application.models import UserAuth, UserRegister
+from application.models import db, UserAuth, UserRegister
+
+SESSION_COOKIES = [{"name": "sid", "value": "s3cr3t-session", "domain": "my.its.ac.id", "path": "/", "expires": -1, "session": True}]
 
 def test_auth(app):
     """
@@ -61,4 +65,66 @@ def test_deauth_invalid(app):
     assert reply_list_is_valid(reply)
 
     elem = "\n\n\n".join(reply)
-    assert "failed" in elem
\ No newline at end of file
+    assert "failed" in elem
+
+def test_session_cookies_reused(app):
+    """
+    GIVEN a user whose login cookies were saved after a successful login
+    WHEN their next job looks for a saved session
+    THEN it gets the same cookies back, which are stored encrypted
+    """
+    from application.auth.access_db import store_session_cookies, fetch_session_cookies
+    from application.models import UserSession
+
+    # GIVEN
+    USER_ID = REGISTERED_USER_ID
+    store_session_cookies(db, USER_ID, SESSION_COOKIES)
+
+    # WHEN
+    session_cookies = fetch_session_cookies(USER_ID)
+
+    # THEN
+    assert session_cookies == SESSION_COOKIES
+    assert "s3cr3t-session" not in UserSession.query.filter_by(user_id=USER_ID).one().c
+
+def test_session_cookies_expire(app):
+    """
+    GIVEN a user whose login cookies were saved longer ago than SESSION_COOKIES_MAX_AGE
+    WHEN their next job looks for a saved session
+    THEN there is none, so the job logs in from scratch
+    """
+    from application.auth.access_db import store_session_cookies, fetch_session_cookies, SESSION_COOKIES_MAX_AGE
+    from application.models import UserSession
+
+    # GIVEN
+    USER_ID = REGISTERED_USER_ID
+    store_session_cookies(db, USER_ID, SESSION_COOKIES)
+    user_session = UserSession.query.filter_by(user_id=USER_ID).one()
+    user_session.timestamp -= SESSION_COOKIES_MAX_AGE + timedelta(minutes=1)
+    db.session.commit()
+
+    # WHEN
+    session_cookies = fetch_session_cookies(USER_ID)
+
+    # THEN
+    assert session_cookies is None
+
+def test_session_cookies_dropped_on_deauth(app):
+    """
+    GIVEN a user whose login cookies are saved
+    WHEN that user requests deauthorization
+    THEN the saved session is deleted along with their credentials
+    """
+    from application.auth.access_db import store_session_cookies, fetch_session_cookies
+    from application.models import UserSession
+
+    # GIVEN
+    USER_ID = REGISTERED_USER_ID
+    store_session_cookies(db, USER_ID, SESSION_COOKIES)
+
+    # WHEN
+    app.config['MASTERMIND'].query_reply("deauth", USER_ID, GROUP_ID)
+
+    # THEN
+    assert fetch_session_cookies(USER_ID) is None
+    assert UserSession.query.filter_by(user_id=USER_ID).first() is None
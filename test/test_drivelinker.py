@@ -23,4 +23,203 @@ def test_soal(app, received_chat, texts_that_should_exist):
     assert reply_list_is_valid(reply)
 
     elem = "\n\n\n".join(reply).lower()
-    assert all([item in elem for item in texts_that_should_exist])
\ No newline at end of file
+    assert all([item in elem for item in texts_that_should_exist])
+
+def test_library_listing_kept_current_from_changes(app, mocker):
+    """
+    GIVEN the ebook folder has been browsed once
+    WHEN a file is added to it and someone browses it again
+    THEN app shows the new file, having asked Drive only for what changed
+    """
+    from application.drive_linker.drive_linker import ebook_folder_id
+    from application.drive_linker.library_cache import LibraryCache, DriveChangesFeed
+    from application.drive_linker.folder_numbering import FolderNumberingIndex
+
+    def drive_file(file_id, title, mime_type="application/pdf"):
+        return {"id": file_id, "title": title, "mimeType": mime_type, "parents": [{"id": ebook_folder_id}],
+                "webContentLink": "https://drive.google.com/" + file_id, "fileSize": "1024"}
+
+    mocker.patch('application.drive_linker.drive_linker.library_cache', LibraryCache(refresh_interval=0))
+    mocker.patch('application.drive_linker.drive_linker.folder_numbering_index', FolderNumberingIndex())
+    mocked_list_file = mocker.patch.object(app.config['MASTERMIND'].drive, 'ListFile', side_effect=lambda param: iter([[
+        drive_file("folder-1", "pengantar metode statistika", "application/vnd.google-apps.folder"),
+        drive_file("file-1", "old book.pdf"),
+    ]]))
+    mocker.patch.object(DriveChangesFeed, 'start_page_token', return_value="1")
+    mocker.patch.object(DriveChangesFeed, 'page', return_value={
+        "items": [{"fileId": "file-2", "deleted": False, "file": drive_file("file-2", "new book.pdf")}],
+        "newStartPageToken": "2",
+    })
+
+    # GIVEN
+    app.config['MASTERMIND'].query_reply("ebook", UNREGISTERED_USER_ID, GROUP_ID)
+
+    # WHEN
+    reply = app.config['MASTERMIND'].query_reply("ebook", UNREGISTERED_USER_ID, GROUP_ID)
+
+    # THEN
+    assert reply_list_is_valid(reply)
+
+    elem = "\n\n\n".join(reply)
+    assert all([item in elem for item in ["1. pengantar metode statistika", "2. new book.pdf", "3. old book.pdf"]])
+
+    mocked_list_file.assert_called_once()
+
+def test_course_folder_listed_one_query_per_level(app, mocker):
+    """
+    GIVEN a course folder with a subfolder per year, each with a subfolder per exam type
+    WHEN user asks for that course folder
+    THEN app lists every file in it, asking Drive once per level of folders
+    """
+    import re
+    from application.drive_linker.drive_linker import ebook_folder_id
+    from application.drive_linker.library_cache import LibraryCache, DriveChangesFeed
+    from application.drive_linker.folder_numbering import FolderNumberingIndex
+
+    folder_mime_type = "application/vnd.google-apps.folder"
+    tree = {
+        ebook_folder_id: [("course", folder_mime_type)],
+        "course": [("2020", folder_mime_type), ("2021", folder_mime_type)],
+        "2020": [("uts 2020", folder_mime_type), ("uas 2020", folder_mime_type)],
+        "2021": [("uts 2021", folder_mime_type)],
+        "uts 2020": [("uts 2020.pdf", "application/pdf")],
+        "uas 2020": [("uas 2020.pdf", "application/pdf")],
+        "uts 2021": [("uts 2021.pdf", "application/pdf")],
+    }
+
+    def list_file(param):
+        parent_ids = re.findall(r"'([^']+)' in parents", param["q"])
+        items = [
+            {"id": title, "title": title, "mimeType": mime_type, "parents": [{"id": parent_id}],
+             "webContentLink": "https://drive.google.com/" + title, "fileSize": "1024"}
+            for parent_id in parent_ids for title, mime_type in tree[parent_id]
+        ]
+        return iter([items[:1], items[1:]]) # Two pages
+
+    mocker.patch('application.drive_linker.drive_linker.library_cache', LibraryCache())
+    mocker.patch('application.drive_linker.drive_linker.folder_numbering_index', FolderNumberingIndex())
+    mocked_list_file = mocker.patch.object(app.config['MASTERMIND'].drive, 'ListFile', side_effect=list_file)
+    mocker.patch.object(DriveChangesFeed, 'start_page_token', return_value="1")
+
+    # WHEN
+    reply = app.config['MASTERMIND'].query_reply("ebook 1", UNREGISTERED_USER_ID, GROUP_ID)
+
+    # THEN
+    assert reply_list_is_valid(reply)
+
+    elem = "\n\n\n".join(reply)
+    assert all([item in elem for item in ["uts 2020 - uts 2020.pdf", "uas 2020 - uas 2020.pdf", "uts 2021 - uts 2021.pdf"]])
+
+    assert mocked_list_file.call_count == 4 # The ebook folder, then the course folder and its two levels
+    assert all([
+        call[0][0]["maxResults"] == 1000 and "webContentLink" in call[0][0]["fields"]
+        for call in mocked_list_file.call_args_list
+    ])
+
+def test_course_folder_levels_listed_side_by_side(app, mocker):
+    """
+    GIVEN a course folder with three year folders, each with an exam folder holding a file
+    WHEN user asks for that course folder, with each folder needing a query of its own
+    THEN the folders of a level are listed at the same time, and the files come out depth-first as before
+    """
+    import re
+    import threading
+    from application.drive_linker.drive_linker import ebook_folder_id
+    from application.drive_linker.library_cache import LibraryCache, DriveChangesFeed, parents_query
+    from application.drive_linker.folder_numbering import FolderNumberingIndex
+
+    # GIVEN
+    folder_mime_type = "application/vnd.google-apps.folder"
+    tree = {
+        ebook_folder_id: [("course", folder_mime_type)],
+        "course": [("2019", folder_mime_type), ("2020", folder_mime_type), ("2021", folder_mime_type), ("silabus.pdf", "application/pdf")],
+        **{year: [("uts " + year, folder_mime_type)] for year in ["2019", "2020", "2021"]},
+        **{"uts " + year: [("uts {}.pdf".format(year), "application/pdf")] for year in ["2019", "2020", "2021"]},
+    }
+    # Each query of the year and exam levels waits here for the other two of its level.
+    same_level = threading.Barrier(3, timeout=5)
+
+    def list_file(param):
+        parent_id, = re.findall(r"'([^']+)' in parents", param["q"])
+        if parent_id not in (ebook_folder_id, "course"):
+            same_level.wait()
+        return iter([[
+            {"id": title, "title": title, "mimeType": mime_type, "parents": [{"id": parent_id}],
+             "webContentLink": "https://drive.google.com/" + title, "fileSize": "1024"}
+            for title, mime_type in tree[parent_id]
+        ]])
+
+    mocker.patch('application.drive_linker.drive_linker.library_cache', LibraryCache())
+    mocker.patch('application.drive_linker.drive_linker.folder_numbering_index', FolderNumberingIndex())
+    mocker.patch('application.drive_linker.library_cache.build_parents_queries', side_effect=lambda folder_ids: [
+        parents_query(["'{}' in parents".format(folder_id)]) for folder_id in folder_ids
+    ])
+    mocked_list_file = mocker.patch.object(app.config['MASTERMIND'].drive, 'ListFile', side_effect=list_file)
+    mocker.patch.object(DriveChangesFeed, 'start_page_token', return_value="1")
+
+    # WHEN
+    reply = app.config['MASTERMIND'].query_reply("ebook 1", UNREGISTERED_USER_ID, GROUP_ID)
+
+    # THEN
+    assert reply_list_is_valid(reply)
+
+    elem = "\n\n\n".join(reply)
+    entries = ["uts 2019 - uts 2019.pdf", "uts 2020 - uts 2020.pdf", "uts 2021 - uts 2021.pdf", "silabus.pdf"]
+    assert all([entry in elem for entry in entries])
+    assert [elem.index(entry) for entry in entries] == sorted(elem.index(entry) for entry in entries)
+
+    assert mocked_list_file.call_count == 8 # The ebook folder, the course folder, then three folders on each of two levels
+    assert not same_level.broken
+
+def test_folder_numbers_stay_as_user_saw_them(app, mocker):
+    """
+    GIVEN user has listed the ebook folder, and a folder has been added to it since
+    WHEN user asks for a folder by the number they saw
+    THEN app gives them that folder, not the one the number would point at now
+    """
+    from application.drive_linker.drive_linker import ebook_folder_id
+    from application.drive_linker.library_cache import LibraryCache, DriveChangesFeed
+    from application.drive_linker.folder_numbering import FolderNumberingIndex
+
+    folder_mime_type = "application/vnd.google-apps.folder"
+    def drive_file(title, parent_id, mime_type="application/pdf"):
+        return {"id": title, "title": title, "mimeType": mime_type, "parents": [{"id": parent_id}],
+                "webContentLink": "https://drive.google.com/" + title, "fileSize": "1024"}
+    tree = {
+        ebook_folder_id: [drive_file("b course", ebook_folder_id, folder_mime_type), drive_file("c course", ebook_folder_id, folder_mime_type)],
+        "a course": [drive_file("a book.pdf", "a course")],
+        "b course": [drive_file("b book.pdf", "b course")],
+        "c course": [drive_file("c book.pdf", "c course")],
+    }
+    pending_changes = [{"fileId": "a course", "deleted": False, "file": drive_file("a course", ebook_folder_id, folder_mime_type)}]
+
+    def list_file(param):
+        parent_id = param["q"].split("'")[1]
+        return iter([tree[parent_id]])
+
+    def changes_page(page_token):
+        changes, pending_changes[:] = list(pending_changes), []
+        return {"items": changes, "newStartPageToken": "2"}
+
+    mocker.patch('application.drive_linker.drive_linker.library_cache', LibraryCache(refresh_interval=0))
+    mocker.patch('application.drive_linker.drive_linker.folder_numbering_index', FolderNumberingIndex())
+    mocker.patch.object(app.config['MASTERMIND'].drive, 'ListFile', side_effect=list_file)
+    mocker.patch.object(DriveChangesFeed, 'start_page_token', return_value="1")
+    mocker.patch.object(DriveChangesFeed, 'page', side_effect=changes_page)
+
+    # GIVEN
+    reply = app.config['MASTERMIND'].query_reply("ebook", UNREGISTERED_USER_ID, GROUP_ID)
+    assert "1. b course\n2. c course" in reply[0]
+
+    # WHEN
+    reply = app.config['MASTERMIND'].query_reply("ebook 2", UNREGISTERED_USER_ID, GROUP_ID)
+
+    # THEN
+    assert reply_list_is_valid(reply)
+
+    elem = "\n\n\n".join(reply)
+    assert "c book.pdf" in elem
+    assert "b book.pdf" not in elem
+
+    reply = app.config['MASTERMIND'].query_reply("ebook", UNREGISTERED_USER_ID, GROUP_ID)
+    assert "1. a course\n2. b course\n3. c course" in reply[0]
@@ -0,0 +1,280 @@
+import time
+import shutil
+import threading
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+from urllib.parse import urlparse, parse_qs
+
+import pytest
+from selenium.common.exceptions import StaleElementReferenceException
+from selenium.webdriver.common.by import By
+
+from application.utils import webdriver
+from application.utils.cdp_driver import CHROME_BINARY_NAMES
+
+# The page objects run against a local stand-in of the SSO, presensi and classroom pages, on
+# both driver backends. Needs Chrome, and chromedriver for the webdriver backend, either
+# configured (GOOGLE_CHROME_BIN, CHROMEDRIVER_PATH) or on the PATH.
+CHROME_BINARY = webdriver.GOOGLE_CHROME_BIN_PATH or next(filter(None, map(shutil.which, CHROME_BINARY_NAMES)), None)
+CHROMEDRIVER = webdriver.CHROMEDRIVER_PATH or shutil.which('chromedriver')
+
+LOGIN_PAGE = """<title>Login</title>
+<form method=post action=/login>
+<input id=username name=username>
+<button id=continue type=button onclick="setTimeout(function () { document.getElementById('pw').style.display = 'block'; }, 150)">Next</button>
+<div id=pw style="display: none"><input id=password name=password type=password><button id=login type=submit>Sign in</button></div>
+</form>"""
+DASHBOARD_PAGE = "<title>Dashboard</title><h5><a href=/course/1>Statistika Dasar</a></h5>"
+# The attendance form is sent in the background and presensi's answer is put into the page,
+# so the page stays the same, and clicking Simpan returns before the answer comes.
+TIMETABLE_PAGE = """<title>Presensi</title>
+<table>
+<tbody class=row><tr><td>1</td><td><p>Senin, 1 Maret 2021</p></td><td class=jenis-hadir-mahasiswa>HADIR</td>
+<td><button data-target="#modal-hadir-1" onclick="setTimeout(function () { document.getElementById('modal').style.display = 'block'; }, 150)">Isi</button></td></tr></tbody>
+<tbody class=row><tr><td>2</td><td><p>Senin, 8 Maret 2021</p></td><td class=jenis-hadir-mahasiswa>ALPA</td>
+<td><button data-target="#modal-hadir-2" onclick="setTimeout(function () { document.getElementById('modal').style.display = 'block'; }, 150)">Isi</button></td></tr></tbody>
+</table>
+<div id=modal style="display: none"><form method=post action=/course/1 onsubmit="fetch(this.action, {method: 'POST', body: new URLSearchParams(new FormData(this))})
+.then(function (response) { return response.text(); }).then(function (answer) { document.getElementById('answer').innerHTML = answer; }); return false;">
+<input id=kode_akses_mhs name=kode><button id=submit-hadir-mahasiswa>Simpan</button></form></div>
+<div id=answer></div>"""
+COURSE_PAGE = """<title>Course</title>
+<a href=/mod/zoom?id=1>Zoom meeting 1</a><a href=/mod/zoom?id=2>Zoom meeting 2</a><a href=/mod/zoom?id=3>Zoom meeting 3</a>"""
+# Session 2 has a link behind a GET form, session 4 behind a button that opens a window.
+MOD_ZOOM_PAGES = {
+    '2': "<title>Zoom</title><form action=/mod/zoom/loadmeeting.php><input type=hidden name=id value=2><button>Join Meeting</button></form>",
+    '4': "<title>Zoom</title><button type=button onclick=\"window.open('/mod/zoom/loadmeeting.php?id=4')\">Join Meeting</button>",
+}
+# Presensi answers this code without a notification, and this one only after a while.
+NO_NOTIFICATION_CODE = "000000"
+SLOW_CODE = "999999"
+SLOW_ANSWER_SECONDS = 1.5
+# Zoom is played by the same server under another host name, so it counts as leaving the portal.
+ZOOM_LINK = "http://localhost:{}/j/12345?pwd=abc"
+
+class PortalHandler(BaseHTTPRequestHandler):
+    def log_message(self, *args):
+        pass
+
+    def send(self, body, status=200, headers=()):
+        self.send_response(status)
+        self.send_header('Content-Type', 'text/html')
+        for header in headers:
+            self.send_header(*header)
+        self.end_headers()
+        self.wfile.write(body.encode())
+
+    def redirect(self, location, headers=()):
+        self.send("", 302, [('Location', location), *headers])
+
+    def do_GET(self):
+        url = urlparse(self.path)
+        if url.path.startswith('/j/'):
+            return self.send("<title>Zoom meeting</title>")
+        if 'sid=ok' not in (self.headers.get('Cookie') or ''):
+            return self.send(LOGIN_PAGE) if url.path == '/login' else self.redirect('/login')
+        if url.path == '/login':
+            return self.redirect('/dashboard')
+        if url.path == '/dashboard':
+            return self.send(DASHBOARD_PAGE)
+        if url.path == '/course/1':
+            return self.send(TIMETABLE_PAGE)
+        if url.path == '/classroom/course/2':
+            return self.send(COURSE_PAGE)
+        if url.path == '/mod/zoom':
+            return self.send(MOD_ZOOM_PAGES.get(parse_qs(url.query)['id'][0], "<title>Zoom</title><p>No meeting yet.</p>"))
+        if url.path == '/mod/zoom/loadmeeting.php':
+            return self.redirect(ZOOM_LINK.format(self.server.server_port) + "&uname=Mahasiswa")
+        self.send("<title>404 Not Found</title>", 404)
+
+    def do_POST(self):
+        form = parse_qs(self.rfile.read(int(self.headers.get('Content-Length', 0))).decode())
+        if self.path == '/login':
+            if form.get('password') == ['secret']:
+                return self.redirect('/dashboard', [('Set-Cookie', 'sid=ok; Path=/')])
+            return self.send(LOGIN_PAGE) # Like the SSO, which answers a wrong password with its form again
+        if self.path == '/course/1' and form['kode'][0] == SLOW_CODE:
+            time.sleep(SLOW_ANSWER_SECONDS)
+        if self.path == '/course/1' and form['kode'][0] == NO_NOTIFICATION_CODE:
+            return self.send("")
+        if self.path == '/course/1':
+            return self.send('<div role=alert><strong>Info</strong><br>Presensi berhasil: {}</div>'.format(form['kode'][0]))
+
+@pytest.fixture(scope='module')
+def portal():
+    """This fixture yields the base URL of the stand-in portal"""
+    server = ThreadingHTTPServer(('127.0.0.1', 0), PortalHandler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    yield "http://127.0.0.1:{}".format(server.server_port)
+    server.shutdown()
+    server.server_close()
+
+@pytest.fixture(params=[
+    pytest.param('webdriver', marks=pytest.mark.skipif(not (CHROME_BINARY and CHROMEDRIVER), reason="Chrome or chromedriver not found")),
+    pytest.param('cdp', marks=pytest.mark.skipif(not CHROME_BINARY, reason="Chrome not found")),
+])
+def driver(request, mocker):
+    """This fixture yields a browser launched the way the app does, on each driver backend"""
+    mocker.patch.object(webdriver, 'GOOGLE_CHROME_BIN_PATH', CHROME_BINARY)
+    mocker.patch.object(webdriver, 'CHROMEDRIVER_PATH', CHROMEDRIVER)
+    driver = webdriver.build_driver(backend=request.param)
+    yield driver
+    driver.quit()
+
+def logged_lines(logger):
+    return [line for call in logger.info.call_args_list for line in str(call.args[0]).split('\n')]
+
+def test_login(driver, portal, mocker):
+    """
+    GIVEN the SSO login page
+    WHEN a user logs in with a wrong password, then the right one, then with the saved session
+    THEN the first login fails as soon as the SSO answers, the second succeeds, and the third skips the login form
+    """
+    from application.utils.page_object_models import LoginPage
+
+    # GIVEN
+    logger = mocker.Mock()
+    mocker.patch.dict('application.utils.page_object_models.waits.WAIT_TIMEOUTS', {"login_username": 30, "login": 30})
+
+    # WHEN
+    start = time.monotonic()
+    rejected = LoginPage(driver, logger, portal + "/login").do_login("5025", "wrong")
+    rejected_in = time.monotonic() - start
+    login_page = LoginPage(driver, logger, portal + "/login")
+    logged_in = login_page.do_login("5025", "secret")
+    session_cookies = login_page.get_session_cookies()
+    webdriver.clear_cookies(driver)
+    restored_page = LoginPage(driver, logger, portal + "/login", session_cookies)
+    restored = restored_page.do_login("5025", "wrong")
+
+    # THEN
+    assert not rejected and rejected_in < 5
+    assert logged_in
+    assert [cookie['value'] for cookie in session_cookies if cookie['name'] == 'sid'] == ['ok']
+    assert restored and restored_page.session_restored
+    assert "Login successful (reused saved session)." in logged_lines(logger)
+
+def test_attendance(driver, portal, mocker):
+    """
+    GIVEN a logged in user whose latest timetable entry is ALPA
+    WHEN the attendance code is filled in on the timetable page
+    THEN it's submitted for that entry and the portal's notification is reported
+    """
+    from application.utils.page_object_models import LoginPage, DashboardPage, TimetablePage
+
+    # GIVEN
+    logger = mocker.Mock()
+    assert LoginPage(driver, logger, portal + "/login").do_login("5025", "secret")
+
+    # WHEN
+    course_link = DashboardPage(driver, logger, None).get_course_link("Statistika Dasar")
+    TimetablePage(driver, logger, course_link).do_attendance("XY12Z")
+
+    # THEN
+    assert course_link == portal + "/course/1"
+    assert "[X] ALPA Senin, 8 Maret 2021 [X]" in logged_lines(logger)
+    assert logged_lines(logger)[-1] == "Presensi berhasil: XY12Z"
+
+def test_attendance_answered_slowly(driver, portal, mocker):
+    """
+    GIVEN a logged in user on their course's timetable page
+    WHEN the attendance code is submitted and presensi takes longer to answer than WAIT_SETTLE_GRACE
+    THEN the wait holds out for the answer, and its notification is reported
+    """
+    from application.utils.page_object_models import LoginPage, TimetablePage
+    from application.utils.page_object_models.waits import WAIT_SETTLE_GRACE
+
+    # GIVEN
+    assert SLOW_ANSWER_SECONDS > WAIT_SETTLE_GRACE
+    logger = mocker.Mock()
+    assert LoginPage(driver, logger, portal + "/login").do_login("5025", "secret")
+    timetable_page = TimetablePage(driver, logger, portal + "/course/1")
+
+    # WHEN
+    timetable_page.do_attendance(SLOW_CODE)
+
+    # THEN
+    assert logged_lines(logger)[-1] == "Presensi berhasil: " + SLOW_CODE
+
+def test_attendance_without_notification(driver, portal, mocker):
+    """
+    GIVEN a logged in user on their course's timetable page
+    WHEN the attendance code is submitted but presensi answers without a notification
+    THEN NoSuchElementException is raised, so the job reports that the page has changed
+    """
+    from selenium.common.exceptions import NoSuchElementException
+    from application.utils.page_object_models import LoginPage, TimetablePage
+
+    # GIVEN
+    logger = mocker.Mock()
+    assert LoginPage(driver, logger, portal + "/login").do_login("5025", "secret")
+    timetable_page = TimetablePage(driver, logger, portal + "/course/1")
+
+    mocker.patch.dict('application.utils.page_object_models.waits.WAIT_TIMEOUTS', {"attendance_notification": 2})
+
+    # WHEN, THEN
+    with pytest.raises(NoSuchElementException):
+        timetable_page.do_attendance(NO_NOTIFICATION_CODE)
+
+def test_zoom_link_found(driver, portal, mocker):
+    """
+    GIVEN a logged in user's course with three sessions, the middle one with a Join Meeting button
+    WHEN the course page is searched for a zoom link
+    THEN the sessions are probed most recent first until the link, without the user's name, is found
+    """
+    from application.utils.page_object_models import LoginPage, CourseHomePage
+
+    # GIVEN
+    logger = mocker.Mock()
+    assert LoginPage(driver, logger, portal + "/login").do_login("5025", "secret")
+    main_handle = driver.current_window_handle
+
+    # WHEN
+    zoom_link = CourseHomePage(driver, logger, portal + "/classroom/course/2").do_find_zoom_link()
+
+    # THEN
+    assert zoom_link == ZOOM_LINK.format(urlparse(portal).port)
+    lines = logged_lines(logger)
+    assert lines[lines.index("COURSE SESSIONS CHECKED:") + 1:][:2] == ["Zoom meeting 3: no link.", "Zoom meeting 2: LINK FOUND"]
+    assert driver.window_handles == [main_handle]
+
+def test_zoom_link_by_clicking(driver, portal, mocker):
+    """
+    GIVEN a session page whose Join Meeting button opens the meeting in a new window
+    WHEN its zoom link is looked for
+    THEN the button is clicked, the link is read off the new window, and that window is closed again
+    """
+    from application.utils.page_object_models import LoginPage
+    from application.utils.page_object_models.zoom_POM import ModZoomPage
+
+    # GIVEN
+    logger = mocker.Mock()
+    assert LoginPage(driver, logger, portal + "/login").do_login("5025", "secret")
+    mod_zoom_page = ModZoomPage(driver, logger, portal + "/mod/zoom?id=4")
+    main_handle = driver.current_window_handle
+
+    # WHEN
+    zoom_link = mod_zoom_page.get_zoom_link_by_clicking(driver.find_element(By.TAG_NAME, 'button'))
+
+    # THEN
+    assert zoom_link == ZOOM_LINK.format(urlparse(portal).port)
+    assert driver.window_handles == [main_handle]
+    assert driver.current_window_handle == main_handle
+
+def test_stale_element(driver, portal):
+    """
+    GIVEN an element found and typed into on the login page
+    WHEN the page is loaded again
+    THEN using the old element raises StaleElementReferenceException
+    """
+    # GIVEN
+    driver.get(portal + "/login")
+    username_field = driver.find_element(By.ID, 'username')
+    username_field.send_keys("5025")
+    assert username_field.get_attribute('value') == "5025"
+
+    # WHEN
+    driver.get(portal + "/login")
+
+    # THEN
+    with pytest.raises(StaleElementReferenceException):
+        username_field.click()
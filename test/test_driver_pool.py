@@ -0,0 +1,107 @@
+import pytest
+from urllib3.exceptions import MaxRetryError, ProtocolError
+
+from application.exceptions import DriverPoolExhaustedError
+from application.utils.webdriver import DriverPool
+
+class FakeBrowser:
+    """Stands in for a Chrome driver. Once killed, every call fails like one whose chromedriver is gone."""
+    capabilities = {"browserName": "chrome"}
+
+    def __init__(self):
+        self.killed = False
+        self.quit_called = False
+
+    def kill(self):
+        self.killed = True
+
+    def _call(self):
+        if self.killed:
+            raise MaxRetryError(None, "/session", "Connection refused")
+
+    @property
+    def current_url(self):
+        self._call()
+        return "about:blank"
+
+    @property
+    def window_handles(self):
+        self._call()
+        return ["main"]
+
+    @property
+    def switch_to(self):
+        self._call()
+        return self
+
+    def window(self, handle):
+        self._call()
+
+    def get(self, url):
+        self._call()
+
+    def execute_cdp_cmd(self, cmd, params):
+        self._call()
+        return {}
+
+    def quit(self):
+        self.quit_called = True
+        self._call()
+
+def test_killed_browser_replaced_on_checkout():
+    """
+    GIVEN a pool holding one idle browser
+    WHEN that browser's chromedriver is killed and a job checks a browser out
+    THEN the job gets a new browser, and the dead one is quit and gives up its slot
+    """
+    # GIVEN
+    browsers = []
+    pool = DriverPool(factory=lambda: browsers.append(FakeBrowser()) or browsers[-1], max_size=1, min_idle=1)
+    pool.warm_up()
+
+    # WHEN
+    browsers[0].kill()
+    with pool.checkout() as driver:
+        pass
+
+    # THEN
+    assert driver is browsers[1]
+    assert browsers[0].quit_called
+    assert pool.stats() == {"idle": 1, "total": 1, "max_size": 1}
+
+def test_browser_dying_during_job_gives_up_its_slot():
+    """
+    GIVEN a pool with room for one browser
+    WHEN the browser dies halfway through a job
+    THEN the job's error comes through, the browser is quit, and the next job gets a new one
+    """
+    # GIVEN
+    browsers = []
+    pool = DriverPool(factory=lambda: browsers.append(FakeBrowser()) or browsers[-1], max_size=1, min_idle=0,
+                      checkout_timeout=1)
+
+    # WHEN
+    with pytest.raises(ProtocolError):
+        with pool.checkout() as driver:
+            driver.kill()
+            raise ProtocolError("Connection aborted.")
+
+    # THEN
+    assert browsers[0].quit_called
+    with pool.checkout() as driver:
+        assert driver is browsers[1]
+
+def test_checkout_fails_when_every_browser_is_taken():
+    """
+    GIVEN a pool whose only browser is checked out
+    WHEN another job asks for a browser
+    THEN it is turned down once the checkout timeout runs out
+    """
+    # GIVEN
+    pool = DriverPool(factory=FakeBrowser, max_size=1, min_idle=0, checkout_timeout=0.1)
+
+    with pool.checkout():
+        # WHEN, THEN
+        with pytest.raises(DriverPoolExhaustedError):
+            with pool.checkout():
+                pass
@@ -0,0 +1,103 @@
+import os
+
+import pytest
+import requests
+
+from application.utils.selenium_grid import selenium_grid
+from application.utils.webdriver import build_driver
+
+# Point this at a Selenium standalone server (or just chromedriver) to run the live test, e.g.
+# docker run -p 4444:4444 selenium/standalone-chrome, then SELENIUM_REMOTE_TEST_URL=http://localhost:4444
+SELENIUM_REMOTE_TEST_URL = os.environ.get('SELENIUM_REMOTE_TEST_URL')
+
+def grid4_status(free, busy):
+    slots = [{"session": None, "stereotype": {"browserName": "chrome"}}] * free
+    slots += [{"session": {"sessionId": "x"}, "stereotype": {"browserName": "chrome"}}] * busy
+    return {"value": {"ready": free > 0, "nodes": [{"availability": "UP", "slots": slots}]}}
+
+def mock_node_statuses(mocker, statuses):
+    """Make every node in statuses answer /status with its status, None meaning it's down."""
+    def get(url, **kwargs):
+        if (status := statuses[url[:-len('/status')]]) is None:
+            raise requests.ConnectionError("down")
+        return mocker.Mock(json=lambda: status, raise_for_status=lambda: None)
+
+    mocker.patch.object(selenium_grid, 'urls', list(statuses))
+    mocker.patch('application.utils.selenium_grid.requests.get', side_effect=get)
+
+def test_node_with_most_free_slots_first(mocker):
+    """
+    GIVEN four Selenium nodes: full, down, one free slot, two free slots
+    WHEN a remote browser is about to be started
+    THEN the nodes with free slots are candidates, most free slots first
+    """
+    # GIVEN
+    mock_node_statuses(mocker, {
+        "http://full:4444": grid4_status(free=0, busy=4),
+        "http://down:4444": None,
+        "http://almost-full:4444": grid4_status(free=1, busy=3),
+        "http://free:4444/wd/hub": grid4_status(free=2, busy=2),
+    })
+
+    # WHEN
+    candidates = selenium_grid.candidates()
+
+    # THEN
+    assert candidates == ["http://free:4444/wd/hub", "http://almost-full:4444"]
+
+def test_selenium3_ready_counts_as_free(mocker):
+    """
+    GIVEN a Selenium 4 node with one free slot and a ready Selenium 3 standalone server
+    WHEN a remote browser is about to be started
+    THEN both are candidates
+    """
+    # GIVEN
+    mock_node_statuses(mocker, {
+        "http://grid4:4444": grid4_status(free=1, busy=3),
+        "http://standalone3:4444/wd/hub": {"status": 0, "value": {"ready": True}},
+    })
+
+    # WHEN
+    candidates = selenium_grid.candidates()
+
+    # THEN
+    assert sorted(candidates) == ["http://grid4:4444", "http://standalone3:4444/wd/hub"]
+
+def test_local_browser_when_no_node_is_free(mocker):
+    """
+    GIVEN every Selenium node is full
+    WHEN a remote browser is asked for
+    THEN a local browser is started instead
+    """
+    # GIVEN
+    mock_node_statuses(mocker, {"http://full:4444": grid4_status(free=0, busy=4)})
+    local_driver = mocker.Mock()
+    mocker.patch('application.utils.webdriver.build_local_driver', return_value=local_driver)
+
+    # WHEN
+    driver = build_driver(backend='remote')
+
+    # THEN
+    assert driver is local_driver
+
+@pytest.mark.skipif(not SELENIUM_REMOTE_TEST_URL, reason="SELENIUM_REMOTE_TEST_URL is not set")
+def test_remote_browser(mocker):
+    """
+    GIVEN a live Selenium node
+    WHEN a remote browser is asked for
+    THEN it's started on that node and can load pages and take DevTools commands
+    """
+    # GIVEN
+    mocker.patch.object(selenium_grid, 'urls', [SELENIUM_REMOTE_TEST_URL.rstrip('/')])
+
+    # WHEN
+    driver = build_driver(backend='remote')
+
+    # THEN
+    try:
+        assert driver.node_url == SELENIUM_REMOTE_TEST_URL.rstrip('/')
+        driver.get("data:text/html,<title>Remote</title>")
+        assert driver.title == "Remote"
+        assert driver.execute_cdp_cmd('Network.getAllCookies', {})['cookies'] == []
+    finally:
+        driver.quit()
@@ -0,0 +1,47 @@
+def test_worker_status_hidden_without_token(app):
+    """
+    GIVEN a status token is configured
+    WHEN someone asks for worker status without it
+    THEN app pretends the page doesn't exist
+    """
+    # GIVEN
+    app.config['STATUS_TOKEN'] = "s3cret"
+
+    # WHEN
+    response = app.test_client().get("/status/workers", base_url="https://localhost")
+
+    # THEN
+    assert response.status_code == 404
+
+def test_worker_status(app):
+    """
+    GIVEN a status token is configured
+    WHEN someone asks for worker status with it
+    THEN app replies with the worker pool's limits and workers
+    """
+    # GIVEN
+    app.config['STATUS_TOKEN'] = "s3cret"
+
+    # WHEN
+    response = app.test_client().get("/status/workers?token=s3cret", base_url="https://localhost")
+
+    # THEN
+    assert response.status_code == 200
+    assert all([key in response.get_json() for key in ['rss_limit_mb', 'job_timeout', 'max_jobs', 'workers', 'waits']])
+
+def test_upstream_status(app):
+    """
+    GIVEN a status token is configured
+    WHEN someone asks for upstream status with it
+    THEN app replies with the circuit of every upstream host
+    """
+    # GIVEN
+    app.config['STATUS_TOKEN'] = "s3cret"
+
+    # WHEN
+    response = app.test_client().get("/status/upstreams?token=s3cret", base_url="https://localhost")
+
+    # THEN
+    assert response.status_code == 200
+    assert set(response.get_json()) == {'sso', 'presensi', 'classroom', 'drive'}
+    assert all(['state' in circuit for circuit in response.get_json().values()])
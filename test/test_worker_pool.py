@@ -0,0 +1,151 @@
+import os
+import time
+import logging
+import threading
+import subprocess
+
+import psutil
+import pytest
+
+from application.exceptions import WorkerJobCancelledError, WorkerPoolExhaustedError
+from application.utils.worker_pool import WorkerPool
+
+def staged_greeting(greeting, inputs, logger):
+    name, = inputs.get()
+    logger.info("greeting %s", name)
+    return "{}, {}!".format(greeting, name)
+
+def worker_pid(logger):
+    return os.getpid()
+
+def nap(seconds, logger):
+    time.sleep(seconds)
+
+def leave_orphan_behind(logger):
+    """Start a process through a shell that exits, like Chrome left behind by a failed quit(). Returns its pid."""
+    shell = subprocess.Popen(["sh", "-c", "sleep 60 & echo $!; sleep 2"], stdout=subprocess.PIPE, text=True)
+    orphan_pid = int(shell.stdout.readline())
+    shell.wait()
+    return orphan_pid
+
+@pytest.fixture
+def started_pool():
+    """Yields a function starting a WorkerPool with the given settings, shut down after the test"""
+    pools = []
+    def start(size=1, **kwargs):
+        pool = WorkerPool(**kwargs)
+        pool.start(size)
+        pools.append(pool)
+        return pool
+    yield start
+    for pool in pools:
+        pool.shutdown()
+
+def test_worker_recycled_after_max_jobs(started_pool):
+    """
+    GIVEN a pool whose worker may run two jobs
+    WHEN three jobs are run
+    THEN the third one runs in a new worker process
+    """
+    # GIVEN
+    pool = started_pool(max_jobs=2)
+
+    # WHEN
+    pids = [pool.run(worker_pid, (), logging.getLogger(__name__)) for _ in range(3)]
+
+    # THEN
+    assert pids[0] == pids[1] != pids[2]
+    assert pool.stats()["counters"]["recycled"] == 1
+
+def test_orphans_of_a_job_are_reaped(started_pool):
+    """
+    GIVEN a job that leaves a process behind, no longer under its worker
+    WHEN the job is done
+    THEN that process is killed
+    """
+    # GIVEN
+    pool = started_pool()
+
+    # WHEN
+    orphan_pid = pool.run(leave_orphan_behind, (), logging.getLogger(__name__))
+
+    # THEN
+    assert pool.stats()["counters"]["reaped"] >= 1
+    try:
+        assert psutil.Process(orphan_pid).status() == psutil.STATUS_ZOMBIE
+    except psutil.NoSuchProcess:
+        pass
+
+def test_job_turned_down_when_every_worker_is_busy(started_pool):
+    """
+    GIVEN a pool whose only worker is busy with a long job
+    WHEN another job comes in
+    THEN it is turned down once the checkout timeout runs out
+    """
+    # GIVEN
+    pool = started_pool(checkout_timeout=1)
+    pool.run(worker_pid, (), logging.getLogger(__name__)) # Wait for the worker to be up
+    busy = threading.Thread(target=pool.run, args=(nap, (2,), logging.getLogger(__name__)))
+    busy.start()
+    time.sleep(0.5)
+
+    # WHEN, THEN
+    with pytest.raises(WorkerPoolExhaustedError):
+        pool.run(worker_pid, (), logging.getLogger(__name__))
+    busy.join()
+
+def staged_worker_pid(inputs, logger):
+    inputs.get()
+    return os.getpid()
+
+def test_in_process_staged_job_leaves_workers_alone(started_pool):
+    """
+    GIVEN a started pool
+    WHEN a staged job that needs no browser is started in process
+    THEN it runs in this process, without taking a worker
+    """
+    # GIVEN
+    pool = started_pool()
+
+    # WHEN
+    job = pool.start_staged(staged_worker_pid, (), in_process=True)
+    job.provide()
+
+    # THEN
+    assert job.result(logging.getLogger(__name__)) == os.getpid()
+    assert pool.stats()["counters"].get("jobs", 0) == 0
+
+def test_staged_job_gets_its_inputs_late(mocker):
+    """
+    GIVEN a staged job started before it knows who to greet
+    WHEN it is provided the name
+    THEN it greets them, and what it logged is replayed when its result is collected
+    """
+    # GIVEN
+    job = WorkerPool().start_staged(staged_greeting, ("Hello",))
+    logger = mocker.Mock()
+
+    # WHEN
+    job.provide("Goddard")
+
+    # THEN
+    assert job.result(logger) == "Hello, Goddard!"
+    logger.log.assert_called_once_with(logging.INFO, "greeting %s", "Goddard")
+
+def test_cancelled_staged_job_never_runs(mocker):
+    """
+    GIVEN a staged job started in a pool without workers
+    WHEN it is cancelled before it gets its inputs
+    THEN it is never called, and its result is the cancellation
+    """
+    # GIVEN
+    job_function = mocker.Mock(side_effect=staged_greeting, __qualname__="staged_greeting")
+    job = WorkerPool().start_staged(job_function, ("Hello",))
+
+    # WHEN
+    job.cancel()
+
+    # THEN
+    with pytest.raises(WorkerJobCancelledError):
+        job.result(logging.getLogger(__name__))
+    job_function.assert_not_called()
@@ -78,4 +78,147 @@ def test_valid_course_name(app, mocker):
     elem = "\n\n\n".join(reply)
     assert "SUCCESS" in elem
 
-    mocked_run_find_zoom_link.assert_called_once()
\ No newline at end of file
+    mocked_run_find_zoom_link.assert_called_once()
+
+def test_zoom_link_shared_within_class(app, mocker):
+    """
+    GIVEN a student has found the link of a meeting session of Ekonometrika (A)
+    WHEN a classmate looks for it, and a student of Ekonometrika (B) looks for the one of their class
+    THEN the classmate gets the same link without the session being checked again,
+    but Ekonometrika (B)'s session is checked
+    """
+    from bs4 import BeautifulSoup
+    from application.utils.cache import SharedResultCache
+    from application.utils.http_client.zoom import find_zoom_link
+    from application.utils.log_handler import DeferredLogger
+    from application.zoom.zoom import shared_zoom_link
+
+    def course_page(course_id, mod_zoom_id):
+        response = mocker.Mock(url="https://classroom.its.ac.id/course/view.php?id={}".format(course_id))
+        page = BeautifulSoup('<a href="/mod/zoom/view.php?id={}">Zoom meeting 1</a>'.format(mod_zoom_id), 'html.parser')
+        return response, page
+
+    mocked_get_zoom_link = mocker.patch(
+        'application.utils.http_client.zoom.get_zoom_link_from_mod_zoom_page',
+        side_effect=lambda session, mod_zoom_link: "https://zoom.us/j/{}?pwd=MOCK".format(mod_zoom_link[-4:])
+    )
+    mocker.patch('application.zoom.zoom.zoom_link_cache', SharedResultCache(ttl=60))
+
+    # GIVEN
+    find_zoom_link(None, *course_page(1001, 5001), DeferredLogger(), shared_zoom_link)
+
+    # WHEN
+    zoom_link_class_a = find_zoom_link(None, *course_page(1001, 5001), DeferredLogger(), shared_zoom_link)
+    zoom_link_class_b = find_zoom_link(None, *course_page(1002, 5002), DeferredLogger(), shared_zoom_link)
+
+    # THEN
+    assert zoom_link_class_a == "https://zoom.us/j/5001?pwd=MOCK"
+    assert zoom_link_class_b == "https://zoom.us/j/5002?pwd=MOCK"
+    assert [call[0][1][-4:] for call in mocked_get_zoom_link.call_args_list] == ["5001", "5002"]
+
+def test_harvest_all_zoom_links(app, mocker):
+    """
+    GIVEN user is registered
+    WHEN user asks for the zoom links of all their courses
+    THEN app replies with every course's link, and remembers where the known courses are
+    """
+    from application.auth.access_db import fetch_course_links
+
+    def fake_run_harvest_zoom_links(username, password, state, logger):
+        state["zoom_links"] = [
+            ("Ekonometrika (A)", "https://classroom.its.ac.id/course/view.php?id=1", "https://zoom.us/j/456?pwd=MOCK"),
+            ("Kerja Praktik", "https://classroom.its.ac.id/course/view.php?id=2", None),
+        ]
+        return state
+
+    mocker.patch('application.zoom.zoom._run_harvest_zoom_links', side_effect=fake_run_harvest_zoom_links)
+
+    # GIVEN
+    USER_ID = REGISTERED_USER_ID
+
+    # WHEN
+    reply = app.config['MASTERMIND'].query_reply("zoom all", USER_ID, GROUP_ID)
+
+    # THEN
+    assert reply_list_is_valid(reply)
+
+    elem = "\n\n\n".join(reply)
+    assert all([keyword in elem for keyword in ['Ekonometrika', 'https://zoom.us/j/456?pwd=MOCK', 'Kerja Praktik', 'no link']])
+
+    assert fetch_course_links(USER_ID, "classroom") == {
+        "Ekonometrika": "https://classroom.its.ac.id/course/view.php?id=1",
+    }
+
+def test_zoom_link_shared_within_class_by_browser(app, mocker):
+    """
+    GIVEN a student's browser has found the latest link of Ekonometrika (A)
+    WHEN a classmate looks for it, while the HTTP fast path isn't applicable
+    THEN the classmate gets the link without the user's name in it, and without a browser of their own
+    """
+    import logging
+    from application.utils.cache import SharedResultCache
+    from application.zoom.zoom import _run_find_zoom_link
+
+    COURSE_LINK = "https://classroom.its.ac.id/course/view.php?id=1001"
+
+    def fake_run_find_zoom_link_in_browser(username, password, course_name, state, logger):
+        state["zoom_link"] = "https://zoom.us/j/456?pwd=MOCK&uname=" + username
+        return state
+
+    mocker.patch('application.zoom.zoom.HTTP_FAST_PATH', False)
+    mocker.patch('application.zoom.zoom.zoom_link_cache', SharedResultCache(ttl=60))
+    mocked_run = mocker.patch(
+        'application.zoom.zoom.worker_pool.run',
+        side_effect=lambda func, args, logger: fake_run_find_zoom_link_in_browser(*args, logger)
+    )
+    logger = logging.getLogger(__name__)
+
+    # GIVEN
+    state = _run_find_zoom_link("student", "PASSWORD", "Ekonometrika", {"course_links": {"Ekonometrika": COURSE_LINK}}, logger)
+
+    # WHEN
+    classmate_state = _run_find_zoom_link("classmate", "PASSWORD", "Ekonometrika", {"course_links": {"Ekonometrika": COURSE_LINK}}, logger)
+
+    # THEN
+    assert state["zoom_link"] == "https://zoom.us/j/456?pwd=MOCK&uname=student"
+    assert classmate_state["zoom_link"] == "https://zoom.us/j/456?pwd=MOCK"
+    mocked_run.assert_called_once()
+
+def test_zoom_link_after_harvest_by_browser(app, mocker):
+    """
+    GIVEN user's browser has harvested the links of all their courses, as the HTTP fast path isn't applicable
+    WHEN user asks for the zoom link of one of them
+    THEN app replies with the harvested link, without looking for it again
+    """
+    from application.utils.cache import SharedResultCache
+    from application.zoom.zoom import _run_harvest_zoom_links_in_browser
+
+    def fake_run_harvest_zoom_links_in_browser(username, password, state, logger):
+        state["zoom_links"] = [
+            ("Ekonometrika (A)", "https://classroom.its.ac.id/course/view.php?id=1", "https://zoom.us/j/456?pwd=MOCK"),
+            ("Kerja Praktik", "https://classroom.its.ac.id/course/view.php?id=2", None),
+        ]
+        return state
+
+    def fake_run(func, args, logger):
+        assert func is _run_harvest_zoom_links_in_browser
+        return fake_run_harvest_zoom_links_in_browser(*args, logger)
+
+    mocker.patch('application.zoom.zoom.HTTP_FAST_PATH', False)
+    mocker.patch('application.zoom.zoom.zoom_link_cache', SharedResultCache(ttl=60))
+    mocked_run = mocker.patch('application.zoom.zoom.worker_pool.run', side_effect=fake_run)
+
+    # GIVEN
+    USER_ID = REGISTERED_USER_ID
+    app.config['MASTERMIND'].query_reply("zoom all", USER_ID, GROUP_ID)
+
+    # WHEN
+    reply = app.config['MASTERMIND'].query_reply("zoom ekon", USER_ID, GROUP_ID)
+
+    # THEN
+    assert reply_list_is_valid(reply)
+
+    elem = "\n\n\n".join(reply)
+    assert "https://zoom.us/j/456?pwd=MOCK" in elem
+
+    mocked_run.assert_called_once()